@@ -0,0 +1,187 @@
+"""Answer a JSONL file of queries concurrently with one shared Agent.
+
+    python batch.py queries.jsonl results.jsonl --concurrency 8
+
+Each input line is {"id": ..., "query": ...} (lines without an id are keyed by
+line number). Results are appended to the output file as each query finishes,
+so an interrupted run resumes where it left off: IDs already answered in the
+output are skipped, failed ones are retried. Throughput and cache hit rates
+are logged as queries complete.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Any, AsyncIterator, Dict, Optional, Set, Tuple
+from config.caching.caching import memory_cache_stats, persistent_cache_stats
+from config.caching.semantic import semantic_cache
+from config.logs import configure_logging, fields, get_logger
+from config.pipeline import PipelineExecutor, QueryTimeline
+from config.synthesis import SynthesisStrategy
+from config.tracing import tracer
+from main import STAGE_LIMITS, add_limit_arguments, create_agent, limits_from_args, query_result, run_query
+
+log = get_logger(__name__)
+
+
+def completed_ids(output_path: str) -> Set[str]:
+    done: Set[str] = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # a line cut short by an interruption
+            if record.get("status") == "ok":
+                done.add(str(record["id"]))
+    return done
+
+
+def ends_mid_line(output_path: str) -> bool:
+    """Whether the output ends in a record cut short by an interruption (no trailing newline)."""
+    if not os.path.exists(output_path) or os.path.getsize(output_path) == 0:
+        return False
+    with open(output_path, "rb") as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) != b"\n"
+
+
+async def read_queries(input_path: str, skip: Set[str]) -> AsyncIterator[Tuple[str, str]]:
+    """Yield `(id, query)` pairs one line at a time, without loading the whole file."""
+    with open(input_path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                log.error(f"Skipping line {line_number}: {e}")
+                continue
+            query_id = str(record.get("id", f"line-{line_number}"))
+            query = record.get("query")
+            if query_id in skip or not query:
+                continue
+            yield query_id, query
+            await asyncio.sleep(0)
+
+
+class BatchProgress:
+    def __init__(self, skipped: int):
+        self.started_at = time.perf_counter()
+        self.skipped = skipped
+        self.completed = 0
+        self.failed = 0
+
+    def throughput(self) -> float:
+        elapsed = time.perf_counter() - self.started_at
+        return (self.completed + self.failed) / elapsed * 60 if elapsed else 0.0
+
+    def cache_summary(self) -> Dict[str, float]:
+        summary = {"persistent": persistent_cache_stats()["hit_rate"], "semantic": semantic_cache.stats()["hit_rate"]}
+        memory = memory_cache_stats()
+        lookups = sum(c["hits"] + c["misses"] + c["coalesced"] for c in memory)
+        summary["memory"] = sum(c["hits"] + c["coalesced"] for c in memory) / lookups if lookups else 0.0
+        return summary
+
+    def print_line(self, query_id: str, status: str, elapsed: float):
+        cache_hit_rates = self.cache_summary()
+        caches = ", ".join(f"{name} {rate:.0%}" for name, rate in cache_hit_rates.items())
+        log.log(logging.INFO if status == "ok" else logging.ERROR,
+                f"[batch] {query_id} {status} in {elapsed:.1f}s | {self.completed} ok, {self.failed} failed, "
+                f"{self.skipped} resumed | {self.throughput():.1f} queries/min | cache hit rate: {caches}",
+                extra=fields(id=query_id, status=status, elapsed=elapsed, queries_per_minute=round(self.throughput(), 2),
+                             cache_hit_rates=cache_hit_rates))
+
+
+async def run_batch(input_path: str, output_path: str, concurrency: int = 8,
+                    host_limits: Optional[Dict[str, int]] = None,
+                    synthesis_strategy: Optional[SynthesisStrategy] = None,
+                    metrics_path: Optional[str] = None,
+                    stage_limits: Optional[Dict[str, int]] = None) -> BatchProgress:
+    skip = completed_ids(output_path)
+    progress = BatchProgress(len(skip))
+    if skip:
+        log.warning(f"Resuming: {len(skip)} queries already answered in {output_path}")
+
+    agent = create_agent(host_limits)
+    executor = PipelineExecutor(agent, stage_limits or STAGE_LIMITS)
+    # Bounded so the reader stays only a little ahead of the workers
+    queue: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+    done = object()
+
+    async def answer(output, query_id: str, query: str):
+        timeline = QueryTimeline(query)
+        started = time.perf_counter()
+        try:
+            final_answer, responses, report = await run_query(agent, executor, query, None, synthesis_strategy, timeline)
+            record: Dict[str, Any] = {"id": query_id, "status": "ok", **query_result(query, final_answer, responses, report, timeline)}
+            # Provider failures come back as an "Error: ..." answer rather than an exception; retry those on resume
+            if final_answer.startswith("Error:"):
+                record.update(status="error", error=final_answer)
+                progress.failed += 1
+            else:
+                progress.completed += 1
+        except Exception as e:
+            record = {"id": query_id, "status": "error", "query": query, "error": str(e)}
+            progress.failed += 1
+        record["elapsed"] = round(time.perf_counter() - started, 3)
+        output.write(json.dumps(record) + "\n")
+        output.flush()
+        progress.print_line(query_id, record["status"], record["elapsed"])
+
+    async def worker(output):
+        while True:
+            item = await queue.get()
+            if item is done:
+                return
+            await answer(output, *item)
+
+    try:
+        with open(output_path, "a", encoding="utf-8") as output:
+            if ends_mid_line(output_path):
+                # Start on a fresh line, so the first new record is not appended to the cut-off one
+                output.write("\n")
+            workers = [asyncio.create_task(worker(output)) for _ in range(concurrency)]
+            try:
+                async for item in read_queries(input_path, skip):
+                    await queue.put(item)
+                for _ in workers:
+                    await queue.put(done)
+                await asyncio.gather(*workers)
+            finally:
+                for task in workers:
+                    task.cancel()
+    finally:
+        await agent.close()
+        if metrics_path:
+            with open(metrics_path, "w", encoding="utf-8") as f:
+                f.write(tracer.prometheus_text())
+
+    log.info(f"Batch finished: {progress.completed} ok, {progress.failed} failed, {progress.skipped} skipped; "
+             f"{progress.throughput():.1f} queries/min")
+    return progress
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="JSONL file of {\"id\", \"query\"} records")
+    parser.add_argument("output", help="JSONL file results are appended to (and resumed from)")
+    parser.add_argument("--concurrency", type=int, default=8, help="queries processed at once")
+    add_limit_arguments(parser)
+    parser.add_argument("--synthesis", help="synthesis strategy, e.g. full, first_k:2 or single")
+    parser.add_argument("--metrics-file", help="write Prometheus-format latency/token/cache metrics here when done")
+    args = parser.parse_args()
+
+    stage_limits, host_limits = limits_from_args(args)
+    strategy = SynthesisStrategy.from_spec(args.synthesis) if args.synthesis else None
+    configure_logging()
+    asyncio.run(run_batch(args.input, args.output, args.concurrency, host_limits, strategy, args.metrics_file,
+                          stage_limits))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+"""Offline end-to-end benchmark against local stand-ins for OpenAI, Anthropic and DuckDuckGo.
+
+    python benchmark.py --queries 40 --unique 20 --concurrency 8
+    python benchmark.py --openai "latency=0.4,429=0.05" --compare bench_results/<earlier>.json
+
+Runs `main`'s pipeline (decompose -> analyze -> search -> answer -> synthesis)
+against the mock providers in tools/mock_providers.py and reports queries/sec,
+p50/p95/p99 latency per stage, requests per provider and cache effectiveness.
+Each run is saved to --output-dir as JSON, named after the current commit, so
+runs from different commits can be compared with --compare.
+
+Provider profiles take comma-separated settings: latency (median seconds),
+jitter (log-normal shape), errors and 429 (rates), retry_after, chars (reply
+size), ttft (fraction of latency before the first streamed chunk) and chunk.
+The caches start cold in a temporary directory unless --cache-dir is given.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+from tools.mock_providers import MockProviders, ProviderProfile
+
+TOPICS = ["B-trees", "consistent hashing", "TCP congestion control", "garbage collection in the JVM", "vector clocks",
+          "LSM trees", "the Raft consensus algorithm", "CPU cache coherence", "HTTP/2 multiplexing", "bloom filters",
+          "copy-on-write file systems", "database query planners", "the Python GIL", "memory-mapped files",
+          "rate limiting algorithms", "CRDTs", "virtual memory paging", "TLS handshakes", "columnar storage",
+          "work-stealing schedulers"]
+TEMPLATES = ["Explain how {} work and when to use them", "What are the performance trade-offs of {}?",
+             "Compare {} with the main alternatives", "How would you implement {} in production?"]
+# Short factual queries that triage sends down the single-call fast path
+SIMPLE_QUERIES = ["What is the capital of France?", "When was the Eiffel Tower built?", "How many moons does Jupiter have?",
+                  "What is the population of Tokyo?", "Where is Mount Everest located?", "What is a B-tree?"]
+
+STAGES = ["decompose", "analyze", "search", "answer", "synthesis", "query"]
+
+
+def workload(queries: int, unique: int, seed: int, simple_share: float = 0.0) -> List[str]:
+    """`queries` queries drawn from a pool of `unique` distinct ones, so repeats exercise the caches.
+
+    With `simple_share`, that fraction of the queries is replaced by short factual ones from SIMPLE_QUERIES.
+    """
+    rng = random.Random(seed)
+    pool = [template.format(topic) for topic in TOPICS for template in TEMPLATES]
+    rng.shuffle(pool)
+    pool = pool[:max(1, unique)]
+    chosen = [pool[i] if i < len(pool) else rng.choice(pool) for i in range(queries)]
+    if simple_share > 0:
+        simple_rng = random.Random(seed + 1)
+        chosen = [simple_rng.choice(SIMPLE_QUERIES) if simple_rng.random() < simple_share else query for query in chosen]
+    return chosen
+
+
+def _percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    from config.hedging import percentile
+    return {"count": len(values), "p50": percentile(values, 0.5), "p95": percentile(values, 0.95),
+            "p99": percentile(values, 0.99)}
+
+
+def git_commit() -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True, text=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": "unknown", "dirty": None}
+    return {"commit": commit, "dirty": dirty}
+
+
+async def run_benchmark(args) -> Dict[str, Any]:
+    mocks = MockProviders(
+        openai=ProviderProfile.from_spec(args.openai),
+        anthropic=ProviderProfile.from_spec(args.anthropic, latency=0.3),
+        search=ProviderProfile.from_spec(args.search, latency=0.15, response_chars=200),
+        sub_questions=args.sub_questions, seed=args.seed)
+    urls = await mocks.start()
+
+    # Endpoints, cache locations and keys are read at import time, so configure them before importing the pipeline
+    cache_dir = args.cache_dir or tempfile.mkdtemp(prefix="bench-cache-")
+    os.environ.update({
+        "OPENAI_API_URL": urls["openai"], "ANTHROPIC_API_URL": urls["anthropic"], "SEARCH_URL": urls["search"],
+        "QUERY_CACHE_DB": os.path.join(cache_dir, "query_cache.db"),
+        "SEMANTIC_CACHE_FILE": os.path.join(cache_dir, "semantic_cache.json"),
+        "PAGE_FETCH_TOP_N": str(args.fetch_pages),
+    })
+    os.environ.setdefault("OPENAI_API_KEY", "bench")
+    os.environ.setdefault("ANTHROPIC_API_KEY", "bench")
+    from config.caching.caching import memory_cache_stats, persistent_cache_stats
+    from config.caching.semantic import semantic_cache
+    from config.logs import configure_logging, flush_logging
+    from config.pipeline import PipelineExecutor, QueryTimeline
+    from config.rate_limit import DEFAULT_LIMITS, RateLimiter
+    from config.synthesis import SynthesisStrategy
+    from config.tracing import tracer
+    from tools.page_fetch import page_fetcher
+    from tools.web_search import search_prefetcher
+    from main import STAGE_LIMITS, create_agent, run_query
+
+    queries = workload(args.queries, args.unique, args.seed, args.simple_share)
+    strategy = SynthesisStrategy.from_spec(args.synthesis)
+    # By default the providers' real rate limits are lifted so the benchmark measures the pipeline itself
+    rate_limiter = None if args.real_rate_limits else RateLimiter({key: (float("inf"), float("inf")) for key in DEFAULT_LIMITS})
+    stage_durations: Dict[str, List[float]] = defaultdict(list)
+    errors = 0
+
+    configure_logging(level="INFO" if args.verbose else "CRITICAL")
+    agent = create_agent(rate_limiter=rate_limiter)
+    executor = PipelineExecutor(agent, STAGE_LIMITS)
+    slots = asyncio.Semaphore(args.concurrency)
+
+    async def one(query: str):
+        nonlocal errors
+        async with slots:
+            timeline = QueryTimeline(query)
+            started = time.perf_counter()
+            try:
+                answer, _, _ = await run_query(agent, executor, query, None, strategy, timeline)
+                errors += answer.startswith("Error:")
+            except Exception:
+                errors += 1
+            stage_durations["query"].append(time.perf_counter() - started)
+            for _, stage, start, end in timeline.events:
+                stage_durations[stage].append(end - start)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(query) for query in queries))
+    wall_time = time.perf_counter() - started
+    http_stats = agent.http.pool_stats()
+    rate_limit_stats = agent.rate_limiter.stats()
+    fast_path = dict(agent.fast_path_stats)
+    triage = agent.triage.stats()
+    await agent.close()
+    flush_logging()
+    await mocks.stop()
+
+    return {
+        **git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "config": {
+            "queries": args.queries, "unique": args.unique, "simple_share": args.simple_share, "concurrency": args.concurrency,
+            "sub_questions": args.sub_questions, "synthesis": strategy.describe(), "seed": args.seed,
+            "real_rate_limits": args.real_rate_limits, "fetch_pages": args.fetch_pages, "cold_cache": args.cache_dir is None,
+            "profiles": {name: profile.to_dict() for name, profile in mocks.profiles.items()},
+        },
+        "results": {
+            "wall_time": wall_time,
+            "qps": len(queries) / wall_time if wall_time else 0.0,
+            "errors": errors,
+            "stages": {stage: _percentiles(stage_durations[stage]) for stage in STAGES if stage_durations[stage]},
+            "provider_requests": mocks.stats(),
+            "http": {"requests": http_stats["requests"], "connections_opened": http_stats["connections_opened"],
+                     "reuse_ratio": http_stats["reuse_ratio"]},
+            "rate_limits": rate_limit_stats,
+            "tokens": tracer.token_stats(),
+            "triage": triage,
+            "caches": {
+                "persistent": persistent_cache_stats(),
+                "memory": {cache["name"]: {k: cache[k] for k in ("hits", "misses", "coalesced", "hit_rate")} for cache in memory_cache_stats()},
+                "semantic": {k: v for k, v in semantic_cache.stats().items() if k != "similarity_histogram"},
+                "search_prefetch": search_prefetcher.stats(),
+                "page_fetch": page_fetcher.stats(),
+                "fast_path": fast_path,
+            },
+        },
+    }
+
+
+def _fmt(value: Optional[float]) -> str:
+    return "     -" if value is None else f"{value:6.3f}"
+
+
+def print_report(run: Dict[str, Any], baseline: Optional[Dict[str, Any]] = None):
+    results = run["results"]
+    base = baseline["results"] if baseline else None
+    dirty = " (uncommitted changes)" if run.get("dirty") else ""
+    print(f"\nBenchmark @ {run['commit']}{dirty}: {run['config']['queries']} queries, "
+          f"concurrency {run['config']['concurrency']}, synthesis {run['config']['synthesis']}")
+    line = f"  {results['qps']:.2f} queries/sec ({results['wall_time']:.1f}s wall), {results['errors']} errors"
+    if base:
+        line += f"   [baseline {baseline['commit']}: {base['qps']:.2f} q/s, {(results['qps'] / base['qps'] - 1) if base['qps'] else 0:+.1%}]"
+    print(line)
+
+    print(f"\n  {'stage':<10} {'count':>5} {'p50':>7} {'p95':>7} {'p99':>7}" + ("   baseline p50/p95/p99" if base else ""))
+    for stage, entry in results["stages"].items():
+        line = f"  {stage:<10} {entry['count']:>5} {_fmt(entry['p50'])}s {_fmt(entry['p95'])}s {_fmt(entry['p99'])}s"
+        if base and stage in base["stages"]:
+            previous = base["stages"][stage]
+            line += f"   {_fmt(previous['p50'])} {_fmt(previous['p95'])} {_fmt(previous['p99'])}"
+        print(line)
+
+    print("\n  provider requests:")
+    for provider, counts in results["provider_requests"].items():
+        print(f"    {provider:<10} " + ", ".join(f"{name} {count}" for name, count in sorted(counts.items())))
+
+    triage = results.get("triage")
+    if triage:
+        print(f"\n  triage: {triage['fast']} fast path, {triage['full']} full pipeline, {triage['fallback']} fell back; "
+              f"~{triage['estimated_saved_latency']:.1f}s saved")
+
+    tokens = results.get("tokens")
+    if tokens:
+        print(f"\n  tokens: {tokens['prompt']} prompt ({tokens['cached_prompt']} cached, {tokens['cached_ratio']:.0%}; "
+              f"{tokens['cache_write']} written to cache), {tokens['completion']} completion")
+
+    caches = results["caches"]
+    print("\n  caches:")
+    print(f"    persistent  {caches['persistent']['hits']} hits / {caches['persistent']['misses']} misses ({caches['persistent']['hit_rate']:.0%})")
+    for name, stats in caches["memory"].items():
+        print(f"    memory      {name}: {stats['hits']} hits, {stats['coalesced']} coalesced, {stats['misses']} misses ({stats['hit_rate']:.0%})")
+    print(f"    semantic    {caches['semantic']['hits']} / {caches['semantic']['lookups']} lookups ({caches['semantic']['hit_rate']:.0%})")
+    print(f"    search      {caches['search_prefetch']['searches']} searches, {caches['search_prefetch']['deduplicated']} deduplicated")
+    if run["config"].get("fetch_pages"):
+        pages = caches["page_fetch"]
+        print(f"    pages       {pages['fetched']} fetched ({pages['bytes'] / 1024:.0f} KiB, {pages['cut_short']} cut short), "
+              f"{pages['fresh']} fresh, {pages['not_modified']} not modified, {pages['over_budget']} over budget")
+    print(f"    fast path   {caches['fast_path'].get('local', 0)} local, {caches['fast_path'].get('llm', 0)} LLM analyses")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", type=int, default=40)
+    parser.add_argument("--unique", type=int, default=20, help="distinct queries in the workload (the rest are repeats)")
+    parser.add_argument("--concurrency", type=int, default=8, help="queries in flight at once")
+    parser.add_argument("--simple-share", type=float, default=0.0,
+                        help="fraction of queries replaced by short factual ones (exercises the triage fast path)")
+    parser.add_argument("--sub-questions", type=int, default=4, help="sub-questions per decomposition")
+    parser.add_argument("--synthesis", default="full", help="synthesis strategy, e.g. full, first_k:2 or single")
+    parser.add_argument("--openai", help="OpenAI stand-in profile, e.g. latency=0.3,jitter=0.4,429=0.02")
+    parser.add_argument("--anthropic", help="Anthropic stand-in profile")
+    parser.add_argument("--search", help="search stand-in profile")
+    parser.add_argument("--fetch-pages", type=int, default=0, help="fetch the top N result pages per search (PAGE_FETCH_TOP_N)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--real-rate-limits", action="store_true", help="keep the providers' real request/token budgets")
+    parser.add_argument("--cache-dir", help="reuse caches from this directory instead of starting cold")
+    parser.add_argument("--output-dir", default="bench_results")
+    parser.add_argument("--compare", help="earlier result file to compare against")
+    parser.add_argument("--verbose", action="store_true", help="show the pipeline's own console output")
+    args = parser.parse_args()
+
+    run = asyncio.run(run_benchmark(args))
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(run, baseline)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    stamp = run["timestamp"].replace(":", "").replace("-", "")
+    path = os.path.join(args.output_dir, f"{stamp}-{run['commit']}{'-dirty' if run.get('dirty') else ''}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(run, f, indent=2)
+    print(f"\nSaved to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,15 @@
 import asyncio
-import aiohttp
+import json
+import os
 from enum import Enum
-from typing import List, Tuple
-from .prompts import analyze_question_prompt
+from typing import List, Optional, Set, Tuple
+from .prompts import analyze_question_prompt, batch_analyze_question_prompt
+from .http_client import HttpClient
+from .rate_limit import RateLimiter, estimate_tokens
+from .prompt_caching import stable_prefix
+from .logs import fields, get_logger
+
+log = get_logger(__name__)
 
 class QuestionType(Enum):
     FACTUAL = 1
@@ -16,54 +23,198 @@ class Expertise(Enum):
     EXPERT = 3
 
 class QuestionAnalyzerAgent:
-    def __init__(self, openai_api_key: str):
+    def __init__(self, openai_api_key: str, http_client: HttpClient, batch_window: float = 0.05, max_batch_size: int = 20,
+                 rate_limiter: Optional[RateLimiter] = None, api_url: str = "https://api.openai.com/v1/chat/completions",
+                 max_batch_window: float = float(os.getenv('ANALYSIS_BATCH_WINDOW', '0.5'))):
         self.api_key = openai_api_key
-        self.api_url = "https://api.openai.com/v1/chat/completions"
+        self.api_url = api_url
+        self.http = http_client
+        self.rate_limiter = rate_limiter or RateLimiter()
+        # Sub-questions that arrive close together (from one streamed decomposition or from several
+        # concurrent queries) are classified in a single request. A streamed decomposition yields its
+        # lines a few hundred ms apart, so the window follows the observed gap between arrivals, between
+        # `batch_window` and `max_batch_window`; `decomposition_finished` cuts it short.
+        self.batch_window = batch_window
+        self.max_batch_window = max_batch_window
+        self.max_batch_size = max_batch_size
+        self._pending: List[Tuple[str, int, asyncio.Future]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._flush_at = 0.0
+        self._last_arrival: Optional[float] = None
+        self._arrival_gap: Optional[float] = None
+        # Strong references to running batches, so they are not garbage-collected mid-request
+        self._batches: Set[asyncio.Task] = set()
+        # When set, every LLM label is appended here as JSONL for offline evaluation of the local classifier
+        self.label_log_path = os.getenv('ANALYSIS_LABEL_LOG')
+        # Questions being shadow-labeled: the local classifier answered them, the LLM label is only recorded
+        self._shadow: Set[Tuple[str, int]] = set()
+
+    async def _record_labels(self, labeled: List[Tuple[str, int, Tuple[QuestionType, Expertise, bool]]]):
+        if not self.label_log_path:
+            return
+        records = []
+        for question, difficulty, labels in labeled:
+            # "fast": the local classifier handled the question and this label is a shadow sample;
+            # "llm": the local classifier declined it
+            path = "fast" if (question, difficulty) in self._shadow else "llm"
+            records.append(json.dumps({"question": question, "difficulty": difficulty, "question_type": labels[0].name,
+                                       "expertise": labels[1].name, "coding": labels[2], "path": path}) + "\n")
+        # Off the event loop, in one write per batch
+        await asyncio.to_thread(self._append_labels, "".join(records))
+
+    def _append_labels(self, text: str):
+        with open(self.label_log_path, 'a') as f:
+            f.write(text)
+
+    async def shadow_label(self, question: str, difficulty: int):
+        """Classify a question the local classifier already handled, only to record the LLM label for evaluation."""
+        self._shadow.add((question, difficulty))
+        try:
+            await self.analyze_question_batched(question, difficulty)
+        except Exception as e:
+            log.debug(f"Shadow analysis failed: {e}", extra=fields(question=question))
+        finally:
+            self._shadow.discard((question, difficulty))
+
+    def _headers(self) -> dict:
+        return {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+
+    async def _post(self, payload: dict) -> dict:
+        payload = {**payload, "messages": stable_prefix(payload["messages"])}
+        return await self.rate_limiter.run(
+            "openai", payload["model"], estimate_tokens(payload["messages"], 512),
+            lambda: self.http.post_json(self.api_url, self._headers(), payload))
 
     async def analyze_question(self, question: str, difficulty: int) -> Tuple[QuestionType, Expertise, bool]:
-        async with aiohttp.ClientSession() as session:
-            payload = {
-                "model": "gpt-4o",
-                "messages": [
-                    {"role": "system", "content": analyze_question_prompt},
-                    {"role": "user", "content": f"Analyze the following question (difficulty: {difficulty}/100) and determine its type (FACTUAL, ANALYTICAL, CREATIVE, TECHNICAL) and required expertise level (GENERAL, SPECIALIZED, EXPERT).\n\nQuestion: {question}"}
-                ],
-                "temperature": 0.3
-            }
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
-            }
-            
-            async with session.post(self.api_url, json=payload, headers=headers) as response:
-                result = await response.json()
-                analysis = result['choices'][0]['message']['content']
-                
-                # Parse the response to extract QuestionType and Expertise
-                question_type = QuestionType.ANALYTICAL  # Default
-                expertise = Expertise.GENERAL  # Default
-                is_coding_related = False
-                
-                if "FACTUAL" in analysis:
-                    question_type = QuestionType.FACTUAL
-                elif "CREATIVE" in analysis:
-                    question_type = QuestionType.CREATIVE
-                elif "TECHNICAL" in analysis:
-                    question_type = QuestionType.TECHNICAL
-                
-                if "EXPERT" in analysis:
-                    expertise = Expertise.EXPERT
-                elif "SPECIALIZED" in analysis:
-                    expertise = Expertise.SPECIALIZED
-                
-                if "CODING=TRUE" in analysis:
-                    is_coding_related = True
-                
-                return question_type, expertise, is_coding_related
-                
-
-    async def analyze_questions(self, questions: List[Tuple[str, int, bool]]) -> List[Tuple[str, int, QuestionType, Expertise]]:
-        tasks = [self.analyze_question(question, difficulty) for question, difficulty, _ in questions]
-        results = await asyncio.gather(*tasks)
-        
-        return [(q[0], q[1], r[0], r[1], r[2]) for q, r in zip(questions, results)]
+        payload = {
+            "model": "gpt-4o",
+            "messages": [
+                {"role": "system", "content": analyze_question_prompt},
+                {"role": "user", "content": f"Analyze the following question (difficulty: {difficulty}/100) and determine its type (FACTUAL, ANALYTICAL, CREATIVE, TECHNICAL) and required expertise level (GENERAL, SPECIALIZED, EXPERT).\n\nQuestion: {question}"}
+            ],
+            "temperature": 0.3
+        }
+
+        result = await self._post(payload)
+        analysis = result['choices'][0]['message']['content']
+
+        # Parse the response to extract QuestionType and Expertise
+        question_type = QuestionType.ANALYTICAL  # Default
+        expertise = Expertise.GENERAL  # Default
+        is_coding_related = False
+
+        if "FACTUAL" in analysis:
+            question_type = QuestionType.FACTUAL
+        elif "CREATIVE" in analysis:
+            question_type = QuestionType.CREATIVE
+        elif "TECHNICAL" in analysis:
+            question_type = QuestionType.TECHNICAL
+
+        if "EXPERT" in analysis:
+            expertise = Expertise.EXPERT
+        elif "SPECIALIZED" in analysis:
+            expertise = Expertise.SPECIALIZED
+
+        if "CODING=TRUE" in analysis:
+            is_coding_related = True
+
+        await self._record_labels([(question, difficulty, (question_type, expertise, is_coding_related))])
+        return question_type, expertise, is_coding_related
+
+    async def analyze_questions_batch(self, questions: List[Tuple[str, int]]) -> List[Tuple[QuestionType, Expertise, bool]]:
+        """Classify several questions with one request; raises ValueError if the reply is malformed."""
+        numbered = "\n".join(f"{i}. (difficulty: {difficulty}/100) {question}" for i, (question, difficulty) in enumerate(questions, 1))
+        payload = {
+            "model": "gpt-4o",
+            "messages": [
+                {"role": "system", "content": batch_analyze_question_prompt},
+                {"role": "user", "content": f"Questions:\n{numbered}"}
+            ],
+            "temperature": 0.3,
+            "response_format": {"type": "json_object"}
+        }
+
+        result = await self._post(payload)
+        try:
+            analyses = json.loads(result['choices'][0]['message']['content'])['analyses']
+            by_index = {int(item['index']): item for item in analyses}
+            parsed = []
+            for i in range(1, len(questions) + 1):
+                item = by_index[i]
+                coding = item.get('coding', False)
+                parsed.append((QuestionType[item['question_type']], Expertise[item['expertise']],
+                               coding is True or str(coding).lower() == "true"))
+        except (KeyError, TypeError, ValueError, IndexError) as e:
+            raise ValueError(f"Malformed batched analysis response: {e}") from e
+        await self._record_labels([(question, difficulty, labels) for (question, difficulty), labels in zip(questions, parsed)])
+        return parsed
+
+    async def _analyze_with_fallback(self, questions: List[Tuple[str, int]]) -> List[Tuple[QuestionType, Expertise, bool]]:
+        if len(questions) > 1:
+            try:
+                return await self.analyze_questions_batch(questions)
+            except Exception as e:
+                log.warning(f"Batched analysis failed ({e}); falling back to per-question analysis")
+        return list(await asyncio.gather(*[self.analyze_question(question, difficulty) for question, difficulty in questions]))
+
+    def _window(self) -> float:
+        if self._arrival_gap is None:
+            return self.batch_window
+        return min(self.max_batch_window, max(self.batch_window, 1.5 * self._arrival_gap))
+
+    def _observe_arrival(self, now: float):
+        if self._last_arrival is not None and now - self._last_arrival <= self.max_batch_window:
+            gap = now - self._last_arrival
+            self._arrival_gap = gap if self._arrival_gap is None else 0.8 * self._arrival_gap + 0.2 * gap
+        self._last_arrival = now
+
+    def _schedule_flush(self, delay: float):
+        loop = asyncio.get_running_loop()
+        if self._flush_handle is not None:
+            if self._flush_at <= loop.time() + delay:
+                return
+            self._flush_handle.cancel()
+        self._flush_at = loop.time() + delay
+        self._flush_handle = loop.call_at(self._flush_at, self._flush)
+
+    async def analyze_question_batched(self, question: str, difficulty: int) -> Tuple[QuestionType, Expertise, bool]:
+        loop = asyncio.get_running_loop()
+        self._observe_arrival(loop.time())
+        future = loop.create_future()
+        self._pending.append((question, difficulty, future))
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        else:
+            self._schedule_flush(self._window())
+        return await future
+
+    def decomposition_finished(self):
+        """No more sub-questions are coming from a decomposition; stop waiting for them (briefly, for the last few to arrive)."""
+        if self._pending:
+            self._schedule_flush(self.batch_window)
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._run_batch(batch))
+            self._batches.add(task)
+            task.add_done_callback(self._batches.discard)
+
+    async def _run_batch(self, batch: List[Tuple[str, int, asyncio.Future]]):
+        try:
+            results = await self._analyze_with_fallback([(question, difficulty) for question, difficulty, _ in batch])
+        except Exception as e:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, _, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
@@ -1,40 +1,144 @@
-import requests 
-import json
-from colorama import Fore, Style
 from .prompts import query_context_prompt, final_check_prompt, decision_prompt
 from .Analyzer import QuestionType, Expertise, QuestionAnalyzerAgent
-from tools.web_search import web_search_tool
-from .caching.caching import persistent_cache_decorator, memory_cache_decorator
-from typing import List, Tuple
-from tenacity import retry, stop_after_attempt, wait_exponential
-import aiohttp
+from .fast_classifier import classify_question
+from tools.web_search import web_search_tool, set_http_client, search_prefetcher
+from .caching.caching import LIVE_DATA_TTL, persistent_cache_decorator, memory_cache_decorator, flush_persistent_cache, succeeded
+from .caching.keys import PROMPTS_VERSION, normalize_text
+from .caching.semantic import semantic_cache_decorator, save_semantic_cache
+from .http_client import HttpClient
+from .streaming import TokenStream
+from .rate_limit import RateLimiter, estimate_tokens
+from .models import provider_for
+from .synthesis import SynthesisStrategy, Synthesizer
+from .hedging import Hedger
+from .routing import ModelRouter
+from .context_packing import budget_for, count_tokens, pack_responses
+from .prompt_caching import anthropic_system, stable_prefix
+from .triage import Triage
+from .tracing import tracer
+from .logs import fields, get_logger
+from typing import AsyncIterator, Callable, List, Optional, Set, Tuple
 import asyncio
+import os
+import random
+import time
+
+log = get_logger(__name__)
+
+def answer_cache_fields(agent: "Agent", full_query: str, sub_question: str, difficulty: int, question_type: QuestionType,
+                        expertise: Expertise, is_coding_related: bool, needs_web_search: bool) -> dict:
+    # Only what changes the answer: the agent instance and raw enum reprs are left out so keys hit across restarts
+    return {
+        "full_query": normalize_text(full_query),
+        "sub_question": normalize_text(sub_question),
+        "difficulty_bucket": difficulty // 10,
+        "model": agent.select_model(difficulty, question_type, expertise, is_coding_related),
+        "needs_web_search": needs_web_search,
+        "prompt_version": PROMPTS_VERSION,
+    }
+
+def answer_cache_ttl(agent: "Agent", full_query: str, sub_question: str, difficulty: int, question_type: QuestionType,
+                     expertise: Expertise, is_coding_related: bool, needs_web_search: bool) -> Optional[float]:
+    # Answers that needed a search (including triage's recent-events questions) are about the present
+    return LIVE_DATA_TTL if needs_web_search else None
+
+def answer_semantic_scope(agent: "Agent", full_query: str, sub_question: str, difficulty: int, question_type: QuestionType,
+                          expertise: Expertise, is_coding_related: bool, needs_web_search: bool) -> Optional[str]:
+    if needs_web_search:
+        # The semantic cache has no expiry, so answers about the present are not kept in it
+        return None
+    # Per model tier, so near-duplicate sub-questions from different user queries share answers; `key_terms`
+    # and the similarity threshold keep questions about different things apart
+    model = agent.select_model(difficulty, question_type, expertise, is_coding_related)
+    return f"{model}|prompts={PROMPTS_VERSION}"
 
 class Agent:
-    def __init__(self, openai_endpoint: str, anthropic_endpoint: str, openai_api_key: str, anthropic_api_key: str):
+    def __init__(self, openai_endpoint: str, anthropic_endpoint: str, openai_api_key: str, anthropic_api_key: str,
+                 http_client: Optional[HttpClient] = None, rate_limiter: Optional[RateLimiter] = None):
         self.openai_endpoint = openai_endpoint
         self.anthropic_endpoint = anthropic_endpoint
         self.openai_api_key = openai_api_key
         self.anthropic_api_key = anthropic_api_key
-        self.question_analyzer = QuestionAnalyzerAgent(openai_api_key)
-        print(f"{Fore.CYAN}Agent initialized with OpenAI and Anthropic endpoints.{Style.RESET_ALL}")
+        # One pooled transport shared by every provider, analyzer and search call
+        self.http = http_client or HttpClient()
+        set_http_client(self.http)
+        # Request/token budgets and Retry-After aware retries for every provider call
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.question_analyzer = QuestionAnalyzerAgent(openai_api_key, self.http, rate_limiter=self.rate_limiter,
+                                                       api_url=openai_endpoint)
+        self.synthesizer = Synthesizer(self)
+        # Per-model latency/error/cost statistics and circuit breakers; the hedger reads the same latencies
+        self.router = ModelRouter()
+        self.hedger = Hedger(tracker=self.router.latency, backup_filter=self.router.is_available)
+        # Complexity gate: simple queries skip decomposition and synthesis (used by main.run_query)
+        self.triage = Triage()
+        # Questions the local classifier labels with at least this confidence skip the LLM analyzer
+        self.fast_path_threshold = float(os.getenv('FAST_CLASSIFIER_THRESHOLD', '0.8'))
+        self.fast_path_stats = {"local": 0, "llm": 0, "shadow": 0}
+        # With ANALYSIS_LABEL_LOG set, this fraction of locally classified questions is also labeled by the LLM
+        # in the background, so the evaluation sees the fast path's own questions, not just the ones it declined
+        self.shadow_rate = float(os.getenv('ANALYSIS_SHADOW_RATE', '0.1')) if self.question_analyzer.label_log_path else 0.0
+        self._shadow_tasks: Set[asyncio.Task] = set()
+        log.info("Agent initialized with OpenAI and Anthropic endpoints")
 
-    def print_colored(self, message, color=Fore.WHITE, style=Style.NORMAL):
-        print(f"{style}{color}{message}{Style.RESET_ALL}")
+    async def close(self):
+        for task in list(self._shadow_tasks):
+            task.cancel()
+        self.http.print_pool_stats()
+        self.print_rate_limit_stats()
+        self.hedger.print_stats()
+        self.router.print_stats()
+        set_http_client(None)
+        search_prefetcher.clear()
+        await self.http.close()
+        await asyncio.to_thread(flush_persistent_cache)
+        await save_semantic_cache()
 
+    async def __aenter__(self):
+        return self
 
-    async def analyze_and_select_model(self, sub_questions: List[Tuple[str, int, bool]]):
-        analyzed_questions = await self.question_analyzer.analyze_questions(sub_questions)
-        
-        for question, difficulty, question_type, expertise, is_coding_related in analyzed_questions:
-            model = self.select_model(difficulty, question_type, expertise, is_coding_related)
-            self.print_colored(f"Question: {question}", Fore.CYAN)
-            self.print_colored(f"Selected model: {model} for difficulty: {difficulty}, "
-                               f"question type: {question_type.name}, "
-                               f"required expertise: {expertise.name}, "
-                               f"coding-related: {is_coding_related}", Fore.YELLOW)    
-        
-        return analyzed_questions
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    def print_rate_limit_stats(self):
+        for name, stats in self.rate_limiter.stats().items():
+            log.info(f"Rate limiter {name}: {stats['admitted']} admitted, "
+                     f"{stats['throttled_requests']} throttled ({stats['throttle_time']:.2f}s), "
+                     f"{stats['retries']} retries, {stats['rate_limited']} rate-limited, "
+                     f"{stats['failures']} failed, queue depth {stats['queue_depth']}")
+
+
+    async def analyze_sub_question(self, sub_question: Tuple[str, int, bool]):
+        question, difficulty, _ = sub_question
+        with tracer.span("analyze", difficulty=difficulty):
+            analyzed_question = self._analyze_locally(question, difficulty)
+            tracer.annotate(classifier="llm" if analyzed_question is None else "local")
+            if analyzed_question is None:
+                question_type, expertise, is_coding_related = await self.question_analyzer.analyze_question_batched(question, difficulty)
+                analyzed_question = (question, difficulty, question_type, expertise, is_coding_related)
+            self.report_model_selection(analyzed_question)
+            return analyzed_question
+
+    def _analyze_locally(self, question: str, difficulty: int) -> Optional[Tuple]:
+        local = classify_question(question, difficulty)
+        if local.confidence < self.fast_path_threshold:
+            self.fast_path_stats["llm"] += 1
+            return None
+        self.fast_path_stats["local"] += 1
+        if self.shadow_rate and random.random() < self.shadow_rate:
+            self.fast_path_stats["shadow"] += 1
+            task = asyncio.ensure_future(self.question_analyzer.shadow_label(question, difficulty))
+            self._shadow_tasks.add(task)
+            task.add_done_callback(self._shadow_tasks.discard)
+        log.debug("Local classifier fast path", extra=fields(confidence=round(local.confidence, 2), question=question))
+        return (question, difficulty, local.question_type, local.expertise, local.is_coding_related)
+
+    def report_model_selection(self, analyzed_question: Tuple):
+        question, difficulty, question_type, expertise, is_coding_related = analyzed_question
+        model = self.select_model(difficulty, question_type, expertise, is_coding_related)
+        log.info(f"Selected model {model} for: {question}",
+                 extra=fields(model=model, difficulty=difficulty, question_type=question_type.name,
+                              expertise=expertise.name, coding=is_coding_related))
 
 
     def select_model(self, difficulty: int, question_type: QuestionType, expertise: Expertise, is_coding_related: bool) -> str:
@@ -53,24 +157,28 @@ class Agent:
         else:
             return "gpt-4o"  # Default to GPT-4o for any other case
 
-    @persistent_cache_decorator
-    @memory_cache_decorator
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
+    @tracer.traced("answer")
+    @persistent_cache_decorator(key=answer_cache_fields, accept=succeeded, ttl=answer_cache_ttl)
+    @memory_cache_decorator(key=answer_cache_fields, accept=succeeded, ttl=answer_cache_ttl)
+    @semantic_cache_decorator(text=lambda agent, full_query, sub_question, *args, **kwargs: sub_question,
+                              scope=answer_semantic_scope, accept=succeeded)
     async def query_model_with_context(self, full_query: str, sub_question: str, difficulty: int, question_type: QuestionType, expertise: Expertise, is_coding_related: bool, needs_web_search: bool):
-        model = self.select_model(difficulty, question_type, expertise, is_coding_related)
-        self.print_colored(f"Selected model: {model} for difficulty: {difficulty}, "
-                           f"question type: {question_type.name}, "
-                           f"required expertise: {expertise.name}, "
-                           f"coding-related: {is_coding_related}", Fore.YELLOW)
+        selected = self.select_model(difficulty, question_type, expertise, is_coding_related)
+        # The static rules fix the tier; the router picks the model within it from observed latency and errors
+        model = self.router.choose(selected)
+        tracer.annotate(selected_model=selected, difficulty=difficulty, question_type=question_type.name,
+                        expertise=expertise.name, web_search=needs_web_search)
+        if model != selected:
+            log.info(f"Routing to {model} instead of {selected}", extra=fields(policy=self.router.policy.name))
 
         context = f"Full Query Context: {full_query}\n\nSpecific Question to Answer: {sub_question}"
         if needs_web_search:
-            self.print_colored("Performing web search for additional context...", Fore.CYAN)
+            log.debug("Performing web search for additional context", extra=fields(question=sub_question))
             try:
                 search_results = await web_search_tool(sub_question)
                 context += f"\n\nWeb Search Results:\n{search_results}"
             except Exception as e:
-                self.print_colored(f"Web search failed: {str(e)}", Fore.RED)
+                log.warning(f"Web search failed: {e}", extra=fields(question=sub_question))
                 context += "\n\nWeb Search Results: Unable to perform web search due to an error."
 
         messages = [
@@ -78,20 +186,40 @@ class Agent:
             {"role": "user", "content": context}
         ]
         
+        async def query(model_to_query: str) -> str:
+            return await self.call_model(model_to_query, messages)
+
         try:
-            if model.startswith("claude"):
-                self.print_colored(f"Querying Anthropic API with model: {model}", Fore.MAGENTA)
-                content = await self.query_anthropic(model, messages)
-            else:  # OpenAI model
-                self.print_colored(f"Querying OpenAI API with model: {model}", Fore.MAGENTA)
-                content = await self.query_openai(model, messages)
+            # A slow primary is raced against an equivalent-tier backup model
+            content, model = await self.hedger.run(model, query)
+            tracer.annotate(model=model, provider=provider_for(model))
             return content, model
         except Exception as e:
-            self.print_colored(f"An error occurred while querying {model}: {str(e)}", Fore.RED)
+            log.error(f"An error occurred while querying {model}: {e}", extra=fields(model=model))
+            tracer.fail(str(e))
             return f"Error: Failed to query {model}", model
         
     
 
+    async def call_model(self, model: str, messages: list) -> str:
+        """Query `model` with its provider and report the latency, outcome and token counts to the router."""
+        started = time.perf_counter()
+        try:
+            if model.startswith("claude"):
+                content = await self.query_anthropic(model, messages)
+            else:
+                content = await self.query_openai(model, messages)
+        except asyncio.CancelledError:
+            # A hedged request that lost the race says nothing about the model's health
+            self.router.abandon(model)
+            raise
+        except Exception:
+            self.router.record(model, time.perf_counter() - started, ok=False)
+            raise
+        self.router.record(model, time.perf_counter() - started, ok=True,
+                           prompt_tokens=estimate_tokens(messages, 0), completion_tokens=count_tokens(content))
+        return content
+
     async def query_openai(self, model: str, messages: list):
         headers = {
             'Content-Type': 'application/json',
@@ -99,14 +227,14 @@ class Agent:
         }
         payload = {
             'model': model,
-            'messages': messages
+            'messages': stable_prefix(messages)
         }
-        self.print_colored("Sending request to OpenAI API...", Fore.CYAN)
-        async with aiohttp.ClientSession() as session:
-            async with session.post(self.openai_endpoint, headers=headers, json=payload) as response:
-                response_json = await response.json()
-                self.print_colored("Received response from OpenAI API", Fore.GREEN)
-                return response_json['choices'][0]['message']['content']
+        log.debug("Sending request to OpenAI API", extra=fields(model=model))
+        response_json = await self.rate_limiter.run(
+            "openai", model, estimate_tokens(messages),
+            lambda: self.http.post_json(self.openai_endpoint, headers, payload))
+        log.debug("Received response from OpenAI API", extra=fields(model=model, usage=response_json.get('usage')))
+        return response_json['choices'][0]['message']['content']
 
 
 
@@ -122,7 +250,7 @@ class Agent:
         payload = {
             'model': model,
             'max_tokens': 2048,
-            'system': system_message,
+            'system': anthropic_system(system_message),
             'messages': [
                 {"role": "user", "content": user_message}
             ]
@@ -130,29 +258,116 @@ class Agent:
         
         messages_endpoint = f"{self.anthropic_endpoint}/v1/messages"
         
-        async with aiohttp.ClientSession() as session:
-            async with session.post(messages_endpoint, headers=headers, json=payload) as response:
-                response_json = await response.json()
-                self.print_colored("Received response from Anthropic API", Fore.GREEN)
-                self.print_colored("Anthropic API Response:", Fore.YELLOW)
-                print(json.dumps(response_json, indent=2))
-                
-                if 'error' in response_json:
-                    raise Exception(response_json['error']['message'])
+        response_json = await self.rate_limiter.run(
+            "anthropic", model, estimate_tokens(messages, payload['max_tokens']),
+            lambda: self.http.post_json(messages_endpoint, headers, payload))
+        # The full response only at DEBUG, and truncated by the logging filter
+        log.debug("Received response from Anthropic API", extra=fields(model=model, response=response_json))
         
-                content = " ".join([item['text'] for item in response_json['content']])
-                return content
+        if 'error' in response_json:
+            raise Exception(response_json['error']['message'])
 
+        content = " ".join([item['text'] for item in response_json['content']])
+        return content
 
 
-    async def multiple_final_checks(self, full_query: str, sub_responses: list) -> str:
-        models = ["gpt-4o", "claude-3-5-sonnet-20240620", "gpt-3.5-turbo"]
-        final_check_tasks = [self.final_check(full_query, sub_responses, model) for model in models]
-        return await asyncio.gather(*final_check_tasks)
-    
 
+    def stream_openai(self, model: str, messages: list) -> TokenStream:
+        headers = {
+            'Content-Type': 'application/json',
+            'Authorization': f'Bearer {self.openai_api_key}',
+        }
+        payload = {
+            'model': model,
+            'messages': stable_prefix(messages),
+            'stream': True,
+            'stream_options': {'include_usage': True}
+        }
+
+        async def chunks() -> AsyncIterator[str]:
+            events = self.rate_limiter.run_stream(
+                "openai", model, estimate_tokens(messages),
+                lambda: self.http.stream_sse(self.openai_endpoint, headers, payload))
+            async for event in events:
+                if 'error' in event:
+                    raise Exception(event['error'].get('message', 'Unknown streaming error'))
+                if event.get('usage'):
+                    tracer.record_usage("openai", model, event['usage'])
+                choices = event.get('choices') or []
+                if choices:
+                    text = choices[0].get('delta', {}).get('content')
+                    if text:
+                        yield text
+
+        return TokenStream(model, chunks())
+
+    def stream_anthropic(self, model: str, messages: list) -> TokenStream:
+        headers = {
+            'Content-Type': 'application/json',
+            'x-api-key': self.anthropic_api_key,
+            'anthropic-version': '2023-06-01'
+        }
+        system_message = next((msg['content'] for msg in messages if msg['role'] == 'system'), '')
+        user_message = next((msg['content'] for msg in messages if msg['role'] == 'user'), '')
+
+        payload = {
+            'model': model,
+            'max_tokens': 2048,
+            'system': anthropic_system(system_message),
+            'messages': [
+                {"role": "user", "content": user_message}
+            ],
+            'stream': True
+        }
+
+        async def chunks() -> AsyncIterator[str]:
+            events = self.rate_limiter.run_stream(
+                "anthropic", model, estimate_tokens(messages, payload['max_tokens']),
+                lambda: self.http.stream_sse(f"{self.anthropic_endpoint}/v1/messages", headers, payload))
+            async for event in events:
+                if event.get('type') == 'error':
+                    raise Exception(event['error']['message'])
+                # message_start carries the input usage (its output count is a placeholder); the final
+                # message_delta carries the cumulative output count
+                if event.get('type') == 'message_start':
+                    usage = event['message'].get('usage') or {}
+                    tracer.record_usage("anthropic", model, {k: v for k, v in usage.items() if k != 'output_tokens'})
+                elif event.get('type') == 'message_delta':
+                    output_tokens = (event.get('usage') or {}).get('output_tokens')
+                    if output_tokens:
+                        tracer.record_usage("anthropic", model, {'output_tokens': output_tokens})
+                if event.get('type') == 'content_block_delta' and event['delta'].get('type') == 'text_delta':
+                    yield event['delta']['text']
+
+        return TokenStream(model, chunks())
+
+    def stream_model(self, model: str, messages: list) -> TokenStream:
+        if model.startswith("claude"):
+            return self.stream_anthropic(model, messages)
+        return self.stream_openai(model, messages)
+
+    async def synthesize(self, full_query: str, sub_responses: list, strategy: Optional[SynthesisStrategy] = None,
+                         on_token: Optional[Callable[[str, str], None]] = None):
+        """Final checks plus best-response selection under a configurable strategy.
+
+        Returns `(final_answer, final_check_responses, report)`.
+        """
+        return await self.synthesizer.synthesize(full_query, sub_responses, strategy or SynthesisStrategy(), on_token)
+
+    def pack_context(self, full_query: str, responses: List[str], model: str, reserved: str = "",
+                     dedupe: bool = True, label: str = "context") -> List[str]:
+        """Pack `responses` into `model`'s token budget, leaving room for the `reserved` prompt text."""
+        budget = max(1, budget_for(model) - count_tokens(reserved))
+        packed = pack_responses(full_query, responses, budget, dedupe=dedupe)
+        log.debug(f"Packed {label} for {model}: {packed.summary()}")
+        return packed.responses
+
+    @tracer.traced("final_check")
     async def final_check(self, full_query: str, sub_responses: list, model: str) -> str:
-        consolidated_responses = "\n".join(sub_responses)
+        tracer.annotate(model=model, provider=provider_for(model))
+        consolidated_responses = "\n".join(self.pack_context(full_query, sub_responses, model,
+                                                             reserved=final_check_prompt + full_query,
+                                                             label="sub-responses"))
         
         messages = [
             {"role": "system", "content": final_check_prompt},
@@ -160,21 +375,29 @@ class Agent:
         ]
         
         try:
-            self.print_colored(f"Performing final check with {model}...", Fore.CYAN)
-            if model.startswith("claude"):
-                content = await self.query_anthropic(model, messages)
-            else:
-                content = await self.query_openai(model, messages)
-            self.print_colored("Final check completed successfully", Fore.GREEN)
+            log.info(f"Performing final check with {model}")
+            content = await self.call_model(model, messages)
+            log.debug("Final check completed", extra=fields(model=model))
             return content
         except Exception as e:
-            self.print_colored(f"An error occurred during final check with {model}: {str(e)}", Fore.RED)
+            log.error(f"An error occurred during final check with {model}: {e}", extra=fields(model=model))
+            tracer.fail(str(e))
             return f"Error: Failed to perform final check with {model}"
         
     
-    async def decide_best_response(self, full_query: str, final_responses: List[str]) -> str:
+    async def decide_best_response(self, full_query: str, final_responses: List[str],
+                                   on_token: Optional[Callable[[str, str], None]] = None) -> str:
+        """Pick or synthesize the best final response, streaming it as it is generated.
+
+        `on_token(chunk, phase)` is called for every streamed chunk; `phase` is
+        "decision" for the decision call and "verification" if the decision
+        looked abbreviated and had to be regenerated.
+        """
         model = "claude-3-5-sonnet-20240620"
-        consolidated_responses = "\n\n".join([f"Response {i+1}:\n{response}" for i, response in enumerate(final_responses)])
+        # Candidates are compared against each other, so they are compressed but not deduplicated
+        packed_responses = self.pack_context(full_query, final_responses, model, reserved=decision_prompt + full_query,
+                                             dedupe=False, label="final responses")
+        consolidated_responses = "\n\n".join([f"Response {i+1}:\n{response}" for i, response in enumerate(packed_responses)])
         
         messages = [
             {"role": "system", "content": decision_prompt},
@@ -182,20 +405,60 @@ class Agent:
         ]
         
         try:
-            self.print_colored("Making final decision on best response...", Fore.CYAN)
-            content = await self.query_anthropic(model, messages)
-            self.print_colored("Final decision completed successfully", Fore.GREEN)
+            log.info("Making final decision on best response")
+            with tracer.span("decision", model=model, provider=provider_for(model)):
+                content = await self._consume_stream(self.stream_model(model, messages), on_token, "decision")
+            log.debug("Final decision completed")
             
             #Cheking to see if the chosen response gets shortened when it shouldnt be
             if len(content) < 0.8 * max(len(r) for r in final_responses):
-                self.print_colored("Warning: Chosen response seems abbreviated. Verifying content...", Fore.YELLOW)
+                log.warning("Chosen response seems abbreviated; verifying content")
+                packed_responses = self.pack_context(full_query, final_responses, model, reserved=content + full_query,
+                                                     dedupe=False, label="verification context")
+                consolidated_responses = "\n\n".join([f"Response {i+1}:\n{response}" for i, response in enumerate(packed_responses)])
                 verification_message = [
                     {"role": "system", "content": "You are a verification assistant. Your task is to ensure that the chosen response includes all necessary information, especially code snippets, from the original response. If any crucial information or code is missing, you must reincorporate it. MAKE SURE CODE FROM THE CHOSEN RESPONSE IS FULLY INCLUDED IN THE FINAL OUTPUT!!!!!!"},
                     {"role": "user", "content": f"Original responses:\n{consolidated_responses}\n\nChosen response:\n{content}\n\nPlease verify that the chosen response includes all necessary information, especially any code snippets, from the original responses. If anything crucial is missing, particularly code, please provide a corrected version that includes all necessary information and code."}
                 ]
-                content = await self.query_anthropic(model, verification_message)
-                self.print_colored("Content verification completed", Fore.GREEN)
+                with tracer.span("verification", model=model, provider=provider_for(model)):
+                    content = await self._consume_stream(self.stream_model(model, verification_message), on_token, "verification")
+                log.debug("Content verification completed")
             return content
         except Exception as e:
-            self.print_colored(f"An error occured during final decision: {str(e)}", Fore.RED)
+            log.error(f"An error occurred during final decision: {e}")
             return f"Error: Failed to make final decision"
+
+    async def stream_best_response(self, full_query: str, final_responses: List[str]) -> AsyncIterator[Tuple[str, str]]:
+        """Async-iterator form of `decide_best_response`, yielding `(phase, chunk)` pairs.
+
+        The last pair is `("result", final_answer)` with the complete answer that
+        `decide_best_response` would have returned.
+        """
+        chunk_queue: asyncio.Queue = asyncio.Queue()
+        done = object()
+
+        async def run():
+            try:
+                final_answer = await self.decide_best_response(full_query, final_responses,
+                                                               on_token=lambda chunk, phase: chunk_queue.put_nowait((phase, chunk)))
+                chunk_queue.put_nowait(("result", final_answer))
+            finally:
+                chunk_queue.put_nowait(done)
+
+        task = asyncio.create_task(run())
+        try:
+            while True:
+                item = await chunk_queue.get()
+                if item is done:
+                    break
+                yield item
+            await task
+        finally:
+            task.cancel()
+
+    async def _consume_stream(self, stream: TokenStream, on_token: Optional[Callable[[str, str], None]], phase: str) -> str:
+        async for chunk in stream:
+            if on_token is not None:
+                on_token(chunk, phase)
+        log.info(f"Streamed {phase} from {stream.timing_summary()}")
+        return stream.text
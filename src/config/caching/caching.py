@@ -1,58 +1,105 @@
-import json
 import os
 from functools import wraps
 import asyncio
-from typing import Any, Callable
+from typing import Any, Callable, Optional, Union
+from .store import CacheStore, SQLiteCacheStore
+from .memory import MemoryCache, register_cache, registered_caches
+from .keys import build_cache_key
+from ..logs import fields, get_logger
+from ..tracing import tracer
 
-CACHE_FILE = 'query_cache.json'
+log = get_logger(__name__)
 
-def load_cache():
-    if os.path.exists(CACHE_FILE):
-        with open(CACHE_FILE, 'r') as f:
-            return json.load(f)
-    return {}
+CACHE_DB = os.getenv('QUERY_CACHE_DB', 'query_cache.db')
+# Seconds that search results, and answers built on them, are cached: they describe the present and go stale
+LIVE_DATA_TTL = float(os.getenv('LIVE_DATA_CACHE_TTL', '900'))
 
-def save_cache(cache):
-    with open(CACHE_FILE, 'w') as f:
-        json.dump(cache, f, default=make_serializable)
+# The legacy `query_cache.json` is not imported: its entries are keyed by `str(args)`, which no current key matches
+persistent_cache: CacheStore = SQLiteCacheStore(CACHE_DB)
 
-persistent_cache = load_cache()
+# Lookups through `persistent_cache_decorator`, for hit-rate reporting
+_persistent_lookups = {"hits": 0, "misses": 0}
 
-def persistent_cache_decorator(func: Callable) -> Callable:
+def set_persistent_cache_store(store: CacheStore):
+    global persistent_cache
+    persistent_cache.close()
+    persistent_cache = store
+
+def succeeded(result: Any) -> bool:
+    """`accept` hook for cached model calls, which report failures as an "Error: ..." answer instead of raising."""
+    answer = result[0] if isinstance(result, (tuple, list)) and result else result
+    return not (isinstance(answer, str) and answer.startswith("Error:"))
+
+def entry_ttl(ttl: Union[float, Callable[..., Optional[float]], None], args: tuple, kwargs: dict) -> Optional[float]:
+    """`ttl` as given, or computed from the call's arguments when it is callable; None means no expiry."""
+    return ttl(*args, **kwargs) if callable(ttl) else ttl
+
+def persistent_cache_decorator(func: Optional[Callable] = None, *, key: Optional[Callable[..., dict]] = None,
+                               accept: Callable[[Any], bool] = lambda result: True,
+                               ttl: Union[float, Callable[..., Optional[float]], None] = None) -> Callable:
+    """Cache results in the persistent store; results for which `accept` is false are returned but not stored.
+
+    `ttl` is seconds or a function of the call's arguments; by default entries never expire.
+    """
+    if func is None:
+        return lambda f: persistent_cache_decorator(f, key=key, accept=accept, ttl=ttl)
+    
     @wraps(func)
     async def wrapper(*args, **kwargs):
-        key = f"{func.__name__}:{str(args)}:{str(kwargs)}"
+        cache_key = build_cache_key(func, args, kwargs, key)
         
-        if key in persistent_cache:
-            print(f"Cache hit for {key}")
-            return persistent_cache[key]
+        found, value = await persistent_cache.get(cache_key)
+        tracer.record_cache("persistent", found)
+        if found:
+            _persistent_lookups["hits"] += 1
+            # The key is a hash of the semantically relevant arguments, not the prompt itself
+            log.debug("Persistent cache hit", extra=fields(function=func.__qualname__, key=cache_key))
+            return value
+        _persistent_lookups["misses"] += 1
         
         result = await func(*args, **kwargs)
-        persistent_cache[key] = result
-        save_cache(persistent_cache)
+        if accept(result):
+            persistent_cache.set(cache_key, make_serializable(result), entry_ttl(ttl, args, kwargs))
         return result
         
     return wrapper
 
-def memory_cache_decorator(func: Callable) -> Any:
-    cache = {}
+def memory_cache_decorator(func: Optional[Callable] = None, *, key: Optional[Callable[..., dict]] = None,
+                           max_entries: Optional[int] = 1024, max_bytes: Optional[int] = 64 * 1024 * 1024,
+                           ttl: Union[float, Callable[..., Optional[float]], None] = 3600,
+                           accept: Callable[[Any], bool] = lambda result: True) -> Any:
+    if func is None:
+        return lambda f: memory_cache_decorator(f, key=key, max_entries=max_entries, max_bytes=max_bytes, ttl=ttl,
+                                                accept=accept)
+    
+    cache = register_cache(MemoryCache(func.__qualname__, max_entries=max_entries, max_bytes=max_bytes,
+                                       ttl=None if callable(ttl) else ttl))
     
     @wraps(func)
     async def wrapper(*args, **kwargs):
-        key = f"{func.__name__}:{str(args)}:{str(kwargs)}"
-        if key not in cache:
-            cache[key] = await func(*args, **kwargs)
-        return cache[key]
+        cache_key = build_cache_key(func, args, kwargs, key)
+        # Concurrent identical calls share one in-flight request
+        return await cache.get_or_load(cache_key, lambda: func(*args, **kwargs), accept, entry_ttl(ttl, args, kwargs))
     
+    wrapper.cache = cache
     return wrapper
 
 def clear_persistent_cache():
-    global persistent_cache
     persistent_cache.clear()
-    save_cache(persistent_cache)
+
+def flush_persistent_cache():
+    persistent_cache.flush()
 
 def clear_memory_cache():
-    print("Memory cache clearing is not fully implemented. You may need to restart the application.")
+    for cache in registered_caches():
+        cache.clear()
+
+def persistent_cache_stats():
+    lookups = _persistent_lookups["hits"] + _persistent_lookups["misses"]
+    return dict(_persistent_lookups, hit_rate=_persistent_lookups["hits"] / lookups if lookups else 0.0)
+
+def memory_cache_stats():
+    return [cache.stats() for cache in registered_caches()]
 
 def make_serializable(obj):
     if asyncio.iscoroutine(obj):
@@ -0,0 +1,61 @@
+import hashlib
+import inspect
+import json
+import os
+import re
+from enum import Enum
+from typing import Any, Callable, Dict, Optional
+
+PROMPTS_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'prompts.py')
+
+
+def _file_digest(path: str) -> str:
+    try:
+        with open(path, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()[:12]
+    except OSError:
+        return "unknown"
+
+
+# Changes whenever prompts.py changes, so entries produced by an old prompt are never served again
+PROMPTS_VERSION = _file_digest(PROMPTS_FILE)
+
+
+def normalize_text(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+def canonicalize(obj: Any) -> Any:
+    if isinstance(obj, Enum):
+        return obj.name
+    if isinstance(obj, str):
+        return obj
+    if isinstance(obj, (list, tuple)):
+        return [canonicalize(item) for item in obj]
+    if isinstance(obj, dict):
+        return {str(k): canonicalize(v) for k, v in obj.items()}
+    if isinstance(obj, (int, float, bool)) or obj is None:
+        return obj
+    # Arbitrary objects (e.g. an Agent instance) carry no stable identity worth keying on
+    return type(obj).__name__
+
+
+def make_cache_key(namespace: str, fields: Dict[str, Any]) -> str:
+    payload = json.dumps(canonicalize(fields), sort_keys=True, separators=(",", ":"))
+    return f"{namespace}:{hashlib.sha256(payload.encode('utf-8')).hexdigest()}"
+
+
+def default_key_fields(func: Callable, args: tuple, kwargs: dict) -> Dict[str, Any]:
+    try:
+        bound = inspect.signature(func).bind(*args, **kwargs)
+        bound.apply_defaults()
+        fields = {name: value for name, value in bound.arguments.items() if name not in ("self", "cls")}
+    except TypeError:
+        fields = {"args": list(args), "kwargs": kwargs}
+    fields["prompt_version"] = PROMPTS_VERSION
+    return fields
+
+
+def build_cache_key(func: Callable, args: tuple, kwargs: dict, key: Optional[Callable[..., Dict[str, Any]]] = None) -> str:
+    fields = key(*args, **kwargs) if key is not None else default_key_fields(func, args, kwargs)
+    return make_cache_key(func.__qualname__, fields)
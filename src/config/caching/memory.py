@@ -0,0 +1,166 @@
+import asyncio
+import sys
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from ..tracing import tracer
+
+
+def estimate_size(obj: Any) -> int:
+    if isinstance(obj, (list, tuple, set)):
+        return sys.getsizeof(obj) + sum(estimate_size(item) for item in obj)
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + sum(estimate_size(k) + estimate_size(v) for k, v in obj.items())
+    return sys.getsizeof(obj)
+
+
+class MemoryCache:
+    """Bounded in-process LRU cache with per-entry TTL and single-flight loading.
+
+    Entries are evicted least-recently-used first once either `max_entries` or
+    `max_bytes` is exceeded. `get_or_load` makes concurrent callers with the
+    same key share one in-flight load instead of each issuing their own call.
+    Cancelling one caller leaves the load running for the others; cancelling
+    the last one cancels the load too.
+    """
+
+    def __init__(self, name: str, max_entries: Optional[int] = 1024, max_bytes: Optional[int] = 64 * 1024 * 1024, ttl: Optional[float] = None):
+        self.name = name
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._waiters: Dict[asyncio.Future, int] = {}
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.coalesced = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            return default
+        value, expires_at, size = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            self._remove(key)
+            self.expirations += 1
+            return default
+        self._entries.move_to_end(key)
+        return value
+
+    def __contains__(self, key: str) -> bool:
+        marker = object()
+        return self.get(key, marker) is not marker
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        if key in self._entries:
+            self._remove(key)
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl else None
+        size = estimate_size(value)
+        self._entries[key] = (value, expires_at, size)
+        self.total_bytes += size
+        self._evict()
+
+    def _remove(self, key: str):
+        _, _, size = self._entries.pop(key)
+        self.total_bytes -= size
+
+    def _evict(self):
+        while self._entries and (
+            (self.max_entries is not None and len(self._entries) > self.max_entries) or
+            (self.max_bytes is not None and self.total_bytes > self.max_bytes)
+        ):
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def invalidate(self, key: str) -> bool:
+        if key in self._entries:
+            self._remove(key)
+            return True
+        return False
+
+    def clear(self):
+        self._entries.clear()
+        self.total_bytes = 0
+
+    async def get_or_load(self, key: str, loader: Callable[[], Awaitable[Any]],
+                          accept: Callable[[Any], bool] = lambda value: True, ttl: Optional[float] = None) -> Any:
+        """Cached value for `key`, or the result of `loader()` (stored for `ttl`, only if `accept(result)`)."""
+        marker = object()
+        value = self.get(key, marker)
+        if value is not marker:
+            self.hits += 1
+            tracer.record_cache("memory", True)
+            return value
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.coalesced += 1
+            tracer.record_cache("memory", True)
+            return await self._wait(key, inflight)
+
+        self.misses += 1
+        tracer.record_cache("memory", False)
+        task = asyncio.ensure_future(loader())
+        self._inflight[key] = task
+
+        def _done(fut: asyncio.Future):
+            # A cancelled load may already have been replaced by a newer one for the same key
+            if self._inflight.get(key) is fut:
+                del self._inflight[key]
+            if not fut.cancelled() and fut.exception() is None and accept(fut.result()):
+                self.set(key, fut.result(), ttl)
+
+        task.add_done_callback(_done)
+        return await self._wait(key, task)
+
+    async def _wait(self, key: str, task: asyncio.Future) -> Any:
+        self._waiters[task] = self._waiters.get(task, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if self._waiters[task] == 1:
+                # Forget the load now, not in its done callback, so a caller arriving meanwhile starts a fresh one
+                if self._inflight.get(key) is task:
+                    del self._inflight[key]
+                task.cancel()
+            raise
+        finally:
+            self._waiters[task] -= 1
+            if not self._waiters[task]:
+                del self._waiters[task]
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "name": self.name,
+            "entries": len(self._entries),
+            "bytes": self.total_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": (self.hits + self.coalesced) / lookups if lookups else 0.0,
+            "inflight": len(self._inflight),
+        }
+
+
+_registry: List[MemoryCache] = []
+
+
+def register_cache(cache: MemoryCache) -> MemoryCache:
+    _registry.append(cache)
+    return cache
+
+
+def registered_caches() -> List[MemoryCache]:
+    return list(_registry)
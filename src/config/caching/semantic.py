@@ -0,0 +1,258 @@
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+from collections import OrderedDict
+from functools import wraps
+from typing import Any, Callable, Dict, FrozenSet, List, Optional, Tuple
+from .caching import make_serializable
+from .keys import normalize_text
+from ..logs import fields, get_logger
+from ..tracing import tracer
+
+log = get_logger(__name__)
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+
+def shingles(text: str) -> FrozenSet[str]:
+    words = re.findall(r"[a-z0-9]+", normalize_text(text))
+    grams = set(words)
+    grams.update(f"{a} {b}" for a, b in zip(words, words[1:]))
+    return frozenset(grams)
+
+
+def key_terms(text: str) -> FrozenSet[str]:
+    """Numbers and named entities (capitalized words not starting a sentence, acronyms) in `text`, lower-cased.
+
+    Questions that differ in any of these ("... in the United States" vs "... in
+    the United Kingdom", "100 mg" vs "200 mg") are never treated as duplicates,
+    however similar the rest of the wording is.
+    """
+    terms = set(re.findall(r"\d+(?:[.,]\d+)*", text))
+    for sentence in re.split(r"(?<=[.?!])\s+|\n+", text):
+        words = re.findall(r"[A-Za-z][\w'-]*", sentence)
+        terms.update(word.lower() for word in words[1:] if word[0].isupper())
+        if words and (words[0].isupper() and len(words[0]) > 1):
+            terms.add(words[0].lower())
+    return frozenset(terms)
+
+
+def jaccard(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def _shingle_hash(shingle: str) -> int:
+    # Stable across processes (unlike hash()), so persisted signatures stay valid
+    return int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=4).digest(), 'big')
+
+
+class MinHashLSH:
+    """MinHash signatures bucketed into LSH bands for sub-linear near-duplicate lookup."""
+
+    def __init__(self, num_perm: int = 64, bands: int = 16, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        rng = random.Random(seed)
+        self._perms = [(rng.randrange(1, _MERSENNE_PRIME), rng.randrange(0, _MERSENNE_PRIME)) for _ in range(num_perm)]
+        self._buckets: List[Dict[Tuple[int, ...], set]] = [dict() for _ in range(bands)]
+
+    def signature(self, grams: FrozenSet[str]) -> Tuple[int, ...]:
+        hashes = [_shingle_hash(g) for g in grams] or [0]
+        return tuple(
+            min(((a * h + b) % _MERSENNE_PRIME) & _MAX_HASH for h in hashes)
+            for a, b in self._perms
+        )
+
+    def _bands(self, signature: Tuple[int, ...]):
+        for band in range(self.bands):
+            yield band, signature[band * self.rows:(band + 1) * self.rows]
+
+    def add(self, entry_id: str, signature: Tuple[int, ...]):
+        for band, chunk in self._bands(signature):
+            self._buckets[band].setdefault(chunk, set()).add(entry_id)
+
+    def remove(self, entry_id: str, signature: Tuple[int, ...]):
+        for band, chunk in self._bands(signature):
+            bucket = self._buckets[band].get(chunk)
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._buckets[band][chunk]
+
+    def candidates(self, signature: Tuple[int, ...]) -> set:
+        found = set()
+        for band, chunk in self._bands(signature):
+            found.update(self._buckets[band].get(chunk, ()))
+        return found
+
+    def clear(self):
+        for bucket in self._buckets:
+            bucket.clear()
+
+
+class SemanticCache:
+    """Near-duplicate answer cache keyed on question text within a scope (e.g. model tier).
+
+    A lookup returns a stored answer when a cached question in the same scope
+    has exactly the same numbers and named entities (`key_terms`) and a
+    word/bigram Jaccard similarity of at least `threshold`. Candidates
+    come from a MinHash/LSH index, so lookups do not scan every entry. The
+    index holds at most `max_entries` questions (LRU) and is persisted to
+    `path` as JSON. The similarity of the best candidate is recorded for every
+    lookup, so the threshold can be tuned from `stats()`.
+
+    Word overlap cannot tell apart questions that differ in one qualifier
+    ("recommended" vs "maximum" dose), so the threshold is kept high; set
+    `enabled` to False to turn the cache off.
+    """
+
+    def __init__(self, path: Optional[str] = None, threshold: float = 0.95, max_entries: int = 5000,
+                 num_perm: int = 64, bands: int = 16, enabled: bool = True):
+        self.path = path
+        self.threshold = threshold
+        self.enabled = enabled
+        self.max_entries = max_entries
+        self.index = MinHashLSH(num_perm=num_perm, bands=bands)
+        self._entries: "OrderedDict[str, dict]" = OrderedDict()
+        self._loaded = False
+        self._dirty = False
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.hits = 0
+        self.similarity_histogram = [0] * 10
+
+    @staticmethod
+    def _entry_id(scope: str, text: str) -> str:
+        return hashlib.sha256(f"{scope}\x00{normalize_text(text)}".encode('utf-8')).hexdigest()
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r') as f:
+                stored = json.load(f)
+        except (OSError, ValueError) as e:
+            log.warning(f"Could not load semantic cache from {self.path}: {e}")
+            return
+        for item in stored.get("entries", [])[-self.max_entries:]:
+            self._insert(item["scope"], item["text"], item["answer"])
+        self._dirty = False
+
+    def _insert(self, scope: str, text: str, answer: Any):
+        entry_id = self._entry_id(scope, text)
+        if entry_id in self._entries:
+            self._remove(entry_id)
+        grams = shingles(text)
+        signature = self.index.signature(grams)
+        self._entries[entry_id] = {"scope": scope, "text": text, "answer": answer, "grams": grams, "terms": key_terms(text),
+                                   "signature": signature}
+        self.index.add(entry_id, signature)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+        self._dirty = True
+
+    def _remove(self, entry_id: str):
+        entry = self._entries.pop(entry_id)
+        self.index.remove(entry_id, entry["signature"])
+
+    def lookup(self, scope: str, text: str) -> Tuple[bool, Any, float]:
+        with self._lock:
+            self._ensure_loaded()
+            self.lookups += 1
+            grams, terms = shingles(text), key_terms(text)
+            best_id, best_score = None, 0.0
+            for entry_id in self.index.candidates(self.index.signature(grams)):
+                entry = self._entries.get(entry_id)
+                if entry is None or entry["scope"] != scope or entry["terms"] != terms:
+                    continue
+                score = jaccard(grams, entry["grams"])
+                if score > best_score:
+                    best_id, best_score = entry_id, score
+            self.similarity_histogram[min(int(best_score * 10), 9)] += 1
+            if best_id is not None and best_score >= self.threshold:
+                self.hits += 1
+                self._entries.move_to_end(best_id)
+                return True, self._entries[best_id]["answer"], best_score
+            return False, None, best_score
+
+    def add(self, scope: str, text: str, answer: Any):
+        with self._lock:
+            self._ensure_loaded()
+            self._insert(scope, text, make_serializable(answer))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.index.clear()
+            self._loaded = True
+            self._dirty = True
+
+    def save(self):
+        with self._lock:
+            if not self.path or not self._dirty:
+                return
+            entries = [{"scope": e["scope"], "text": e["text"], "answer": e["answer"]} for e in self._entries.values()]
+            self._dirty = False
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({"entries": entries}, f)
+        os.replace(tmp_path, self.path)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "hit_rate": self.hits / self.lookups if self.lookups else 0.0,
+            "threshold": self.threshold,
+            # best-candidate similarity per lookup, in 0.1-wide buckets from [0.0, 0.1) to [0.9, 1.0]
+            "similarity_histogram": list(self.similarity_histogram),
+        }
+
+
+SEMANTIC_CACHE_FILE = os.getenv('SEMANTIC_CACHE_FILE', 'semantic_cache.json')
+semantic_cache = SemanticCache(SEMANTIC_CACHE_FILE, threshold=float(os.getenv('SEMANTIC_CACHE_THRESHOLD', '0.95')),
+                               enabled=os.getenv('SEMANTIC_CACHE', '1') != '0')
+
+
+def semantic_cache_decorator(*, text: Callable[..., str], scope: Callable[..., Optional[str]],
+                             accept: Callable[[Any], bool] = lambda result: True,
+                             cache: Optional[SemanticCache] = None) -> Callable:
+    def decorator(func: Callable) -> Callable:
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            target = cache or semantic_cache
+            question_scope = scope(*args, **kwargs) if target.enabled else None
+            # No scope: this call's result is not cacheable
+            if question_scope is None:
+                return await func(*args, **kwargs)
+            question = text(*args, **kwargs)
+            found, answer, similarity = target.lookup(question_scope, question)
+            tracer.record_cache("semantic", found)
+            if found:
+                log.debug("Semantic cache hit", extra=fields(similarity=round(similarity, 2), question=question))
+                return answer
+            result = await func(*args, **kwargs)
+            if accept(result):
+                target.add(question_scope, question, result)
+            return result
+        return wrapper
+    return decorator
+
+
+async def save_semantic_cache():
+    await asyncio.to_thread(semantic_cache.save)
@@ -0,0 +1,240 @@
+import asyncio
+import atexit
+import json
+import queue
+import sqlite3
+import threading
+import time
+from typing import Any, Optional, Tuple
+from ..logs import get_logger
+
+log = get_logger(__name__)
+
+
+class CacheStore:
+    """Interface for persistent cache backends used by `persistent_cache_decorator`."""
+
+    async def get(self, key: str) -> Tuple[bool, Any]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class SQLiteCacheStore(CacheStore):
+    """SQLite (WAL mode) cache store shared safely by several processes.
+
+    Lookups hit the primary-key index and never load the whole cache into memory.
+    Writes and access-time updates are queued and committed in batches by a
+    background thread, so callers on the event loop never wait on disk I/O.
+    The same thread periodically compacts the database: expired entries are
+    dropped, the least recently used entries beyond `max_entries` are evicted
+    and the WAL is checkpointed.
+    """
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS cache (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            expires_at REAL,
+            last_access REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS cache_last_access ON cache(last_access);
+        CREATE INDEX IF NOT EXISTS cache_expires_at ON cache(expires_at);
+    """
+
+    def __init__(self, path: str,
+                 ttl: Optional[float] = None,
+                 max_entries: Optional[int] = 100_000,
+                 batch_size: int = 256,
+                 flush_interval: float = 0.05,
+                 compaction_interval: float = 300.0):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.compaction_interval = compaction_interval
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._initialized = False
+        self._queue: "queue.Queue[tuple]" = queue.Queue()
+        # Values queued for writing but not yet committed, so reads see their own writes
+        self._pending = {}
+        self._pending_seq = 0
+        self._pending_lock = threading.Lock()
+        self._writer: Optional[threading.Thread] = None
+        self._closed = False
+
+    # -- connections -------------------------------------------------------
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    def _ensure_initialized(self):
+        if self._initialized:
+            return
+        with self._init_lock:
+            if self._initialized:
+                return
+            conn = self._connection()
+            conn.executescript(self._SCHEMA)
+            self._writer = threading.Thread(target=self._write_loop, name="cache-writer", daemon=True)
+            self._writer.start()
+            atexit.register(self.close)
+            self._initialized = True
+
+    # -- reads -------------------------------------------------------------
+
+    def _get_sync(self, key: str) -> Tuple[bool, Any]:
+        self._ensure_initialized()
+        row = self._connection().execute(
+            "SELECT value, expires_at FROM cache WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return False, None
+        value, expires_at = row
+        now = time.time()
+        if expires_at is not None and expires_at <= now:
+            self._queue.put(("delete", key))
+            return False, None
+        self._queue.put(("touch", key, now))
+        return True, json.loads(value)
+
+    async def get(self, key: str) -> Tuple[bool, Any]:
+        with self._pending_lock:
+            if key in self._pending:
+                return True, self._pending[key][1]
+        return await asyncio.to_thread(self._get_sync, key)
+
+    # -- writes ------------------------------------------------------------
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        self._ensure_initialized()
+        ttl = self.ttl if ttl is None else ttl
+        now = time.time()
+        expires_at = now + ttl if ttl else None
+        with self._pending_lock:
+            self._pending_seq += 1
+            self._pending[key] = (self._pending_seq, value)
+            self._queue.put(("set", key, json.dumps(value), now, expires_at, self._pending_seq))
+
+    def delete(self, key: str):
+        self._ensure_initialized()
+        with self._pending_lock:
+            self._pending.pop(key, None)
+        self._queue.put(("delete", key))
+
+    def clear(self):
+        self._ensure_initialized()
+        self.flush()
+        with self._pending_lock:
+            self._pending.clear()
+        self._connection().execute("DELETE FROM cache")
+
+    def flush(self):
+        if self._initialized and self._writer is not None and self._writer.is_alive():
+            self._queue.join()
+
+    def _write_loop(self):
+        conn = self._connection()
+        last_compaction = time.monotonic()
+        while True:
+            try:
+                ops = [self._queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                ops = []
+            while ops and len(ops) < self.batch_size:
+                try:
+                    ops.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if ops:
+                self._apply(conn, ops)
+            if time.monotonic() - last_compaction >= self.compaction_interval:
+                self._compact(conn)
+                last_compaction = time.monotonic()
+            if any(op[0] == "stop" for op in ops):
+                return
+
+    def _apply(self, conn: sqlite3.Connection, ops: list):
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for op in ops:
+                if op[0] == "set":
+                    _, key, value, created_at, expires_at, _ = op
+                    conn.execute(
+                        "INSERT OR REPLACE INTO cache (key, value, created_at, expires_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                        (key, value, created_at, expires_at, created_at)
+                    )
+                elif op[0] == "touch":
+                    conn.execute("UPDATE cache SET last_access = ? WHERE key = ?", (op[2], op[1]))
+                elif op[0] == "delete":
+                    conn.execute("DELETE FROM cache WHERE key = ?", (op[1],))
+            conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            log.error(f"Persistent cache write failed: {e}")
+        finally:
+            with self._pending_lock:
+                for op in ops:
+                    if op[0] == "set" and self._pending.get(op[1], (None,))[0] == op[5]:
+                        del self._pending[op[1]]
+            for _ in ops:
+                self._queue.task_done()
+
+    def _compact(self, conn: sqlite3.Connection):
+        try:
+            conn.execute("DELETE FROM cache WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),))
+            if self.max_entries is not None:
+                conn.execute(
+                    "DELETE FROM cache WHERE key IN ("
+                    "SELECT key FROM cache ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,)
+                )
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        except sqlite3.Error as e:
+            log.error(f"Persistent cache compaction failed: {e}")
+
+    def compact(self):
+        self._ensure_initialized()
+        self.flush()
+        self._compact(self._connection())
+
+    def stats(self) -> dict:
+        self._ensure_initialized()
+        count, = self._connection().execute("SELECT COUNT(*) FROM cache").fetchone()
+        return {"entries": count, "pending_writes": self._queue.qsize(), "path": self.path}
+
+    def close(self):
+        if self._closed or not self._initialized:
+            return
+        self._closed = True
+        if self._writer is not None and self._writer.is_alive():
+            self._queue.put(("stop",))
+            self._writer.join(timeout=10)
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
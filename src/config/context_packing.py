@@ -0,0 +1,191 @@
+import math
+import re
+from typing import Dict, List, Set
+from .caching.semantic import shingles, jaccard
+
+# Input-token budget for the packed context of each model (the prompt and the answer need room too)
+MODEL_CONTEXT_BUDGETS: Dict[str, int] = {
+    "gpt-3.5-turbo": 10_000,
+    "gpt-4o": 24_000,
+    "claude-3-5-sonnet-20240620": 24_000,
+    "claude-3-haiku-20240307": 24_000,
+}
+DEFAULT_CONTEXT_BUDGET = 10_000
+
+# Routing metadata that `main` attaches to each sub-response; useful in logs, noise to the model
+METADATA_LINE = re.compile(r"^(Difficulty|Question Type|Expertise|Coding-related|Model used):.*$")
+HEADER_LINE = re.compile(r"^(Sub-question \d+:|Response \d+:|#)")
+ANSWER_LABEL = re.compile(r"^Answer:\s*")
+CODE_FENCE = re.compile(r"^\s*(```|~~~)")
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9\"'(\[])")
+_TOKEN_PIECES = re.compile(r"[A-Za-z]+|\d+|[^\sA-Za-z\d]")
+
+
+def count_tokens(text: str) -> int:
+    """Local BPE-ish token estimate: ~4 characters per word piece, one token per digit run or symbol."""
+    tokens = 0
+    for piece in _TOKEN_PIECES.findall(text):
+        tokens += math.ceil(len(piece) / 4) if piece[0].isalpha() else max(1, len(piece) // 3)
+    return tokens
+
+
+def budget_for(model: str) -> int:
+    return MODEL_CONTEXT_BUDGETS.get(model, DEFAULT_CONTEXT_BUDGET)
+
+
+def strip_metadata(text: str) -> str:
+    """Drop routing metadata lines from the header of each sub-response (between "Sub-question N:" and "Answer:").
+
+    Lines in the answer itself, and anything inside a fenced code block, are left byte-for-byte intact:
+
+    >>> strip_metadata("Sub-question 1: Q\\nDifficulty: 3\\nAnswer: A\\n```python\\nDifficulty: 3\\n```")
+    'Sub-question 1: Q\\nAnswer: A\\n```python\\nDifficulty: 3\\n```'
+    """
+    kept = []
+    in_header = in_code = False
+    for line in text.split("\n"):
+        if CODE_FENCE.match(line):
+            in_code = not in_code
+        elif not in_code:
+            stripped = line.strip()
+            if stripped.startswith("Sub-question ") and HEADER_LINE.match(stripped):
+                in_header = True
+            elif ANSWER_LABEL.match(stripped):
+                in_header = False
+            elif in_header and METADATA_LINE.match(stripped):
+                continue
+        kept.append(line)
+    return "\n".join(kept)
+
+
+class _Unit:
+    """A sentence, header or whole code block; the granularity at which packing keeps or drops text."""
+    __slots__ = ("text", "protected", "code", "line", "position", "tokens", "score", "keep")
+
+    def __init__(self, text: str, protected: bool, code: bool, line: int, position: int):
+        self.text = text
+        self.protected = protected
+        self.code = code
+        self.line = line
+        self.position = position
+        self.tokens = count_tokens(text)
+        self.score = 0.0
+        self.keep = True
+
+
+def _split_units(text: str) -> List[_Unit]:
+    units: List[_Unit] = []
+    lines = text.split("\n")
+    line_index = 0
+    position = 0
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        if CODE_FENCE.match(line):
+            # Code blocks are kept (or dropped as duplicates) as a whole, never cut
+            block = [line]
+            i += 1
+            while i < len(lines):
+                block.append(lines[i])
+                i += 1
+                if CODE_FENCE.match(block[-1]):
+                    break
+            units.append(_Unit("\n".join(block), True, True, line_index, position))
+        elif HEADER_LINE.match(line.strip()) or not line.strip():
+            units.append(_Unit(line, True, False, line_index, position))
+            i += 1
+        else:
+            label = ANSWER_LABEL.match(line)
+            if label:
+                units.append(_Unit(label.group(0).strip(), True, False, line_index, position))
+                line = line[label.end():]
+            for sentence in SENTENCE_END.split(line):
+                units.append(_Unit(sentence, False, False, line_index, position))
+                position += 1
+            i += 1
+        line_index += 1
+    return units
+
+
+def _render(units: List[_Unit]) -> str:
+    lines: List[List[str]] = []
+    current_line = None
+    for unit in units:
+        if not unit.keep:
+            continue
+        if unit.line != current_line:
+            lines.append([])
+            current_line = unit.line
+        lines[-1].append(unit.text)
+    text = "\n".join(" ".join(parts) for parts in lines)
+    return re.sub(r"\n{3,}", "\n\n", text).strip()
+
+
+class PackedContext:
+    def __init__(self, responses: List[str], tokens_before: int, tokens_after: int, budget: int,
+                 duplicates_removed: int, sentences_dropped: int):
+        self.responses = responses
+        self.tokens_before = tokens_before
+        self.tokens_after = tokens_after
+        self.budget = budget
+        self.duplicates_removed = duplicates_removed
+        self.sentences_dropped = sentences_dropped
+
+    def summary(self) -> str:
+        saved = 1 - self.tokens_after / self.tokens_before if self.tokens_before else 0.0
+        return (f"{self.tokens_before} -> {self.tokens_after} input tokens ({saved:.0%} smaller, budget {self.budget}); "
+                f"{self.duplicates_removed} duplicates removed, {self.sentences_dropped} sentences compressed away")
+
+
+def pack_responses(query: str, responses: List[str], budget: int, dedupe: bool = True,
+                   similarity_threshold: float = 0.8) -> PackedContext:
+    """Fit `responses` into `budget` tokens without touching code blocks.
+
+    Routing metadata is stripped first. With `dedupe`, sentences that nearly
+    repeat an earlier one (word/bigram Jaccard) and repeated code blocks are
+    dropped across responses. If the result is still over budget, the prose
+    sentences least related to the query are dropped, later sentences of an
+    answer before its opening ones, until it fits.
+    """
+    tokens_before = sum(count_tokens(response) for response in responses)
+    per_response = [_split_units(strip_metadata(response)) for response in responses]
+
+    duplicates_removed = 0
+    if dedupe:
+        seen_code: Set[str] = set()
+        seen_sentences: List = []
+        for units in per_response:
+            for unit in units:
+                if unit.code:
+                    normalized = " ".join(unit.text.split())
+                    if normalized in seen_code:
+                        unit.keep = False
+                        duplicates_removed += 1
+                    seen_code.add(normalized)
+                elif not unit.protected and len(unit.text.split()) >= 6:
+                    grams = shingles(unit.text)
+                    if any(jaccard(grams, other) >= similarity_threshold for other in seen_sentences):
+                        unit.keep = False
+                        duplicates_removed += 1
+                    else:
+                        seen_sentences.append(grams)
+
+    sentences_dropped = 0
+    kept = [unit for units in per_response for unit in units if unit.keep]
+    total = sum(unit.tokens for unit in kept) + len(kept)
+    if total > budget:
+        query_terms = shingles(query)
+        candidates = [unit for unit in kept if not unit.protected]
+        for unit in candidates:
+            relevance = len(shingles(unit.text) & query_terms) / (len(query_terms) or 1)
+            unit.score = relevance + 1.0 / (1 + unit.position)
+        for unit in sorted(candidates, key=lambda u: u.score):
+            if total <= budget:
+                break
+            unit.keep = False
+            total -= unit.tokens + 1
+            sentences_dropped += 1
+
+    packed = [_render(units) for units in per_response]
+    tokens_after = sum(count_tokens(response) for response in packed)
+    return PackedContext(packed, tokens_before, tokens_after, budget, duplicates_removed, sentences_dropped)
@@ -0,0 +1,103 @@
+import math
+import re
+from typing import Dict, List, NamedTuple, Tuple
+from .Analyzer import QuestionType, Expertise
+
+
+class LocalAnalysis(NamedTuple):
+    question_type: QuestionType
+    expertise: Expertise
+    is_coding_related: bool
+    confidence: float
+
+
+# (pattern, weight) features per label; patterns are matched against the lower-cased question
+_TYPE_FEATURES: Dict[QuestionType, List[Tuple[str, float]]] = {
+    QuestionType.FACTUAL: [
+        (r"^(what|who|when|where|which) (is|are|was|were|did)\b", 2.0),
+        (r"^(who|when|where)\b", 1.5),
+        (r"\bhow (many|much|long|old|far|tall)\b", 2.0),
+        (r"^(name|list|define|identify)\b", 1.5),
+        (r"\b(capital|population|date|year|founded|located|definition|stand for)\b", 1.0),
+    ],
+    QuestionType.ANALYTICAL: [
+        (r"^why\b|\bwhy (is|are|do|does|did)\b", 2.0),
+        (r"\b(compare|comparison|contrast|difference|differ|versus|vs\.?)\b", 2.0),
+        (r"\b(analy[sz]e|analysis|evaluate|assess|impact|effect|implications?|trade-?offs?)\b", 1.5),
+        (r"\b(pros and cons|advantages|disadvantages|benefits|drawbacks|relationship)\b", 1.5),
+        (r"\bhow (does|do|did|can|could|would|should)\b", 1.0),
+        (r"\b(explain|interpret|significance|cause[sd]?)\b", 1.0),
+    ],
+    QuestionType.CREATIVE: [
+        (r"\bwrite (a|an|me)\b.*\b(story|poem|song|lyrics|essay|joke|haiku|script)\b", 3.0),
+        (r"\b(imagine|invent|brainstorm|come up with|fictional|creative|slogan|tagline)\b", 2.0),
+        (r"\b(story|poem|song|haiku|narrative)\b", 1.0),
+        (r"\bdesign (a|an)\b(?!.*\b(api|database|schema|system|algorithm)\b)", 1.0),
+    ],
+    QuestionType.TECHNICAL: [
+        (r"\b(implement|configure|install|deploy|debug|compile|optimi[sz]e|refactor)\b", 2.0),
+        (r"\b(algorithm|architecture|protocol|database|schema|kernel|compiler|api|framework|library)\b", 1.5),
+        (r"\b(equation|derive|derivation|integral|theorem|proof|calculate|formula)\b", 1.5),
+        (r"\b(python|javascript|typescript|java|rust|golang|c\+\+|sql|bash|html|css|docker|kubernetes)\b", 1.5),
+    ],
+}
+
+_CODING_FEATURES: List[Tuple[str, float]] = [
+    (r"\b(code|coding|program|programming|script|function|method|class|variable|snippet)\b", 1.0),
+    (r"\b(python|javascript|typescript|java|rust|golang|c\+\+|c#|sql|bash|regex|html|css)\b", 2.0),
+    (r"\b(bug|stack ?trace|exception|compile|syntax|refactor|unit test|api endpoint|library|framework)\b", 1.0),
+    (r"```|\w+\(\)|\bdef |\bimport \w+", 3.0),
+]
+
+_JARGON = re.compile(
+    r"\b(quantum|thermodynamic|stochastic|eigen\w*|asymptotic|bayesian|regression|genomic|pharmaco\w*|"
+    r"jurisprudence|macroeconomic|cryptograph\w*|distributed|concurrency|topolog\w*|neural|transformer|"
+    r"differential|manifold|protein|clinical|derivative|litigation|monetary)\b"
+)
+
+
+def jargon_count(text: str) -> int:
+    """Number of specialist terms in lower-cased `text`; each one makes a question read as harder."""
+    return len(_JARGON.findall(text))
+
+
+def _score(text: str, features: List[Tuple[str, float]]) -> float:
+    return sum(weight for pattern, weight in features if re.search(pattern, text))
+
+
+def classify_question(question: str, difficulty: int) -> LocalAnalysis:
+    """Keyword/regex classifier for the labels `Agent.select_model` needs.
+
+    Runs in microseconds. `confidence` is in [0, 1]; low values mean the
+    question should be sent to the LLM analyzer instead.
+    """
+    text = question.lower().strip()
+
+    scores = {question_type: _score(text, features) for question_type, features in _TYPE_FEATURES.items()}
+    ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    (best_type, best), (_, runner_up) = ranked[0], ranked[1]
+    if best == 0:
+        best_type, type_confidence = QuestionType.ANALYTICAL, 0.0
+    else:
+        # Logistic on the score margin: a 2-point lead is ~0.88, a tie is 0.5
+        type_confidence = 1 / (1 + math.exp(-(best - runner_up)))
+        type_confidence *= min(1.0, best / 2.0)
+
+    coding_score = _score(text, _CODING_FEATURES)
+    is_coding_related = coding_score >= 2.0
+    coding_confidence = 1.0 if coding_score >= 3.0 or coding_score == 0 else 0.6
+
+    jargon = jargon_count(text)
+    adjusted = difficulty + 10 * jargon
+    if adjusted < 35:
+        expertise = Expertise.GENERAL
+        expertise_confidence = 1.0 if adjusted < 25 else 0.7
+    elif adjusted < 65:
+        expertise = Expertise.SPECIALIZED
+        expertise_confidence = 0.8 if 40 <= adjusted < 60 else 0.6
+    else:
+        expertise = Expertise.EXPERT
+        expertise_confidence = 1.0 if adjusted >= 75 else 0.7
+
+    confidence = min(type_confidence, coding_confidence, expertise_confidence)
+    return LocalAnalysis(best_type, expertise, is_coding_related, round(confidence, 3))
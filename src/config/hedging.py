@@ -0,0 +1,144 @@
+import asyncio
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+from .logs import fields, get_logger
+from .models import equivalent_models
+
+log = get_logger(__name__)
+
+
+def percentile(values: List[float], fraction: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(fraction * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+class LatencyTracker:
+    """Rolling window of observed request latencies per model."""
+
+    def __init__(self, window: int = 200):
+        self.window = window
+        self._samples: Dict[str, Deque[float]] = {}
+
+    def observe(self, model: str, seconds: float):
+        self._samples.setdefault(model, deque(maxlen=self.window)).append(seconds)
+
+    def samples(self, model: str) -> List[float]:
+        return list(self._samples.get(model, ()))
+
+    def percentile(self, model: str, fraction: float, min_samples: int = 1) -> Optional[float]:
+        samples = self.samples(model)
+        if len(samples) < min_samples:
+            return None
+        return percentile(samples, fraction)
+
+
+class Hedger:
+    """Sends a backup request to an equivalent-tier model when the primary is slow.
+
+    The backup fires once the primary has been outstanding for longer than the
+    model's `hedge_percentile` latency. The first successful response wins and
+    the other request is cancelled. At most `max_hedge_rate` of recent requests
+    may be hedged, so a provider-wide slowdown cannot double the load.
+
+    A shared `tracker` is assumed to be fed by its owner; only a private one is
+    updated here. `backup_filter` can rule out backups (e.g. models whose
+    circuit breaker is open).
+    """
+
+    def __init__(self, hedge_percentile: float = 0.95, max_hedge_rate: float = 0.1, min_samples: int = 20,
+                 window: int = 200, tracker: Optional[LatencyTracker] = None,
+                 backup_filter: Optional[Callable[[str], bool]] = None):
+        self.hedge_percentile = hedge_percentile
+        self.max_hedge_rate = max_hedge_rate
+        self.min_samples = min_samples
+        self.tracker = tracker or LatencyTracker(window)
+        self._owns_tracker = tracker is None
+        self.backup_filter = backup_filter
+        self._recent_hedges: Deque[bool] = deque(maxlen=window)
+        self.hedges_sent = 0
+        self.hedges_won = 0
+        # Latency callers actually saw vs. what the primary alone took (a lower bound when it was cancelled)
+        self.effective_latencies: Deque[float] = deque(maxlen=window)
+        self.primary_latencies: Deque[float] = deque(maxlen=window)
+
+    def _may_hedge(self) -> bool:
+        if not self._recent_hedges:
+            return True
+        return sum(self._recent_hedges) / len(self._recent_hedges) < self.max_hedge_rate
+
+    async def _timed(self, model: str, call: Callable[[str], Awaitable[Any]]) -> Tuple[Any, float]:
+        started = time.perf_counter()
+        result = await call(model)
+        elapsed = time.perf_counter() - started
+        if self._owns_tracker:
+            self.tracker.observe(model, elapsed)
+        return result, elapsed
+
+    async def run(self, model: str, call: Callable[[str], Awaitable[Any]]) -> Tuple[Any, str]:
+        """Run `call(model)`, possibly racing it against `call(backup_model)`; returns `(result, model_used)`."""
+        started = time.perf_counter()
+        primary = asyncio.ensure_future(self._timed(model, call))
+        delay = self.tracker.percentile(model, self.hedge_percentile, self.min_samples)
+        backups = [m for m in equivalent_models(model) if self.backup_filter is None or self.backup_filter(m)]
+
+        hedged = False
+        if delay is not None and backups:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            hedged = not done and self._may_hedge()
+        self._recent_hedges.append(hedged)
+
+        if not hedged:
+            result, elapsed = await primary
+            self.primary_latencies.append(elapsed)
+            self.effective_latencies.append(elapsed)
+            return result, model
+
+        backup_model = min(backups, key=lambda m: self.tracker.percentile(m, 0.5) or float("inf"))
+        self.hedges_sent += 1
+        log.info(f"{model} exceeded p{int(self.hedge_percentile * 100)} ({delay:.2f}s); hedging with {backup_model}",
+                 extra=fields(model=model, backup_model=backup_model, delay=round(delay, 3)))
+        backup = asyncio.ensure_future(self._timed(backup_model, call))
+        pending = {primary: model, backup: backup_model}
+        try:
+            while pending:
+                done, _ = await asyncio.wait(set(pending), return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    used_model = pending.pop(task)
+                    if task.exception() is not None and pending:
+                        continue  # let the other request finish
+                    result, _ = task.result()
+                    total = time.perf_counter() - started
+                    self.effective_latencies.append(total)
+                    self.primary_latencies.append(primary.result()[1] if primary.done() and not primary.exception() else total)
+                    if task is backup:
+                        self.hedges_won += 1
+                    return result, used_model
+        finally:
+            for task in (primary, backup):
+                if not task.done():
+                    task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        primary = list(self.primary_latencies)
+        effective = list(self.effective_latencies)
+        return {
+            "hedges_sent": self.hedges_sent,
+            "hedges_won": self.hedges_won,
+            "hedge_rate": sum(self._recent_hedges) / len(self._recent_hedges) if self._recent_hedges else 0.0,
+            "primary_p50": percentile(primary, 0.5),
+            "primary_p99": percentile(primary, 0.99),
+            "effective_p50": percentile(effective, 0.5),
+            "effective_p99": percentile(effective, 0.99),
+        }
+
+    def print_stats(self):
+        stats = self.stats()
+        if stats["primary_p50"] is None:
+            return
+        log.info(f"Hedging: {stats['hedges_sent']} hedges sent ({stats['hedge_rate']:.0%} of recent requests), "
+                 f"{stats['hedges_won']} won; p50 {stats['primary_p50']:.2f}s -> {stats['effective_p50']:.2f}s, "
+                 f"p99 {stats['primary_p99']:.2f}s -> {stats['effective_p99']:.2f}s")
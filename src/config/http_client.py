@@ -0,0 +1,185 @@
+import asyncio
+import json
+import time
+import aiohttp
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional
+from yarl import URL
+from .rate_limit import error_for_status
+from .logs import get_logger
+
+log = get_logger(__name__)
+
+
+def host_key(url) -> str:
+    """Key for per-host limits and metrics: the host name, plus the port when it is not the scheme's default."""
+    url = URL(url)
+    return url.host if url.is_default_port() else f"{url.host}:{url.port}"
+
+
+class HttpClient:
+    """Shared, pooled HTTP transport used by the agent, the analyzer and web search.
+
+    A single `aiohttp.ClientSession` is created lazily on first use (it must be
+    bound to the running event loop) and kept open until `close()` is called,
+    so TCP/TLS connections are reused across requests instead of being
+    re-established for every sub-question.
+    """
+
+    def __init__(self,
+                 limit: int = 100,
+                 limit_per_host: int = 20,
+                 keepalive_timeout: float = 30.0,
+                 dns_cache_ttl: int = 300,
+                 connect_timeout: float = 10.0,
+                 read_timeout: float = 120.0,
+                 total_timeout: Optional[float] = None,
+                 host_limits: Optional[Dict[str, int]] = None):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_cache_ttl = dns_cache_ttl
+        self.timeout = aiohttp.ClientTimeout(total=total_timeout, sock_connect=connect_timeout, sock_read=read_timeout)
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._lock = asyncio.Lock()
+        self.metrics: Dict[str, int] = {
+            "requests": 0,
+            "connections_opened": 0,
+            "connections_reused": 0,
+            "dns_cache_hits": 0,
+            "dns_cache_misses": 0,
+        }
+        self.host_metrics: Dict[str, Dict[str, int]] = {}
+        # Per-provider concurrency caps, keyed by host (e.g. {"api.anthropic.com": 8})
+        self.host_limits = dict(host_limits or {})
+        self._host_semaphores: Dict[str, asyncio.Semaphore] = {}
+        self.host_wait_time: Dict[str, float] = {}
+
+    def _count(self, name: str, host: Optional[str] = None):
+        self.metrics[name] += 1
+        if host is not None:
+            per_host = self.host_metrics.setdefault(host, {"requests": 0, "connections_opened": 0, "connections_reused": 0})
+            if name in per_host:
+                per_host[name] += 1
+
+    def _trace_config(self) -> aiohttp.TraceConfig:
+        trace_config = aiohttp.TraceConfig()
+
+        async def on_request_start(session, ctx, params):
+            ctx.host = host_key(params.url)
+            self._count("requests", ctx.host)
+
+        async def on_connection_create_end(session, ctx, params):
+            self._count("connections_opened", getattr(ctx, "host", None))
+
+        async def on_connection_reuseconn(session, ctx, params):
+            self._count("connections_reused", getattr(ctx, "host", None))
+
+        async def on_dns_cache_hit(session, ctx, params):
+            self._count("dns_cache_hits")
+
+        async def on_dns_cache_miss(session, ctx, params):
+            self._count("dns_cache_misses")
+
+        trace_config.on_request_start.append(on_request_start)
+        trace_config.on_connection_create_end.append(on_connection_create_end)
+        trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+        trace_config.on_dns_cache_hit.append(on_dns_cache_hit)
+        trace_config.on_dns_cache_miss.append(on_dns_cache_miss)
+        return trace_config
+
+    async def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            async with self._lock:
+                if self._session is None or self._session.closed:
+                    connector = aiohttp.TCPConnector(
+                        limit=self.limit,
+                        limit_per_host=self.limit_per_host,
+                        keepalive_timeout=self.keepalive_timeout,
+                        ttl_dns_cache=self.dns_cache_ttl,
+                        use_dns_cache=True,
+                    )
+                    self._session = aiohttp.ClientSession(
+                        connector=connector,
+                        timeout=self.timeout,
+                        trace_configs=[self._trace_config()],
+                    )
+        return self._session
+
+    @asynccontextmanager
+    async def host_slot(self, url: str):
+        host = host_key(url)
+        limit = self.host_limits.get(host)
+        if limit is None:
+            yield
+            return
+        semaphore = self._host_semaphores.get(host)
+        if semaphore is None:
+            semaphore = self._host_semaphores[host] = asyncio.Semaphore(limit)
+        waited_from = time.perf_counter()
+        async with semaphore:
+            self.host_wait_time[host] = self.host_wait_time.get(host, 0.0) + time.perf_counter() - waited_from
+            yield
+
+    async def post_json(self, url: str, headers: dict, payload: dict) -> dict:
+        session = await self.session()
+        async with self.host_slot(url):
+            async with session.post(url, headers=headers, json=payload) as response:
+                if response.status >= 400:
+                    try:
+                        body = await response.json(content_type=None)
+                    except ValueError:
+                        body = await response.text()
+                    raise error_for_status(response.status, response.headers, body, url)
+                return await response.json(content_type=None)
+
+    async def stream_sse(self, url: str, headers: dict, payload: dict) -> AsyncIterator[dict]:
+        """POST `payload` and yield each server-sent event's JSON `data` as soon as its line arrives."""
+        session = await self.session()
+        async with self.host_slot(url):
+            async with session.post(url, headers=headers, json=payload) as response:
+                if response.status >= 400:
+                    raise error_for_status(response.status, response.headers, await response.text(), url)
+                async for raw_line in response.content:
+                    line = raw_line.decode('utf-8').strip()
+                    if not line.startswith('data:'):
+                        continue
+                    data = line[len('data:'):].strip()
+                    if not data or data == '[DONE]':
+                        continue
+                    yield json.loads(data)
+
+    async def get_text(self, url: str, headers: Optional[dict] = None, params: Optional[dict] = None) -> str:
+        session = await self.session()
+        async with self.host_slot(url):
+            async with session.get(url, headers=headers, params=params) as response:
+                response.raise_for_status()
+                return await response.text()
+
+    @asynccontextmanager
+    async def get_stream(self, url: str, headers: Optional[dict] = None) -> AsyncIterator[aiohttp.ClientResponse]:
+        """GET `url` and yield the response with its body unread, so the caller can stream it and stop early."""
+        session = await self.session()
+        async with self.host_slot(url):
+            async with session.get(url, headers=headers) as response:
+                yield response
+
+    def pool_stats(self) -> Dict[str, object]:
+        stats = dict(self.metrics)
+        stats["reuse_ratio"] = (self.metrics["connections_reused"] / self.metrics["requests"]) if self.metrics["requests"] else 0.0
+        stats["hosts"] = {host: dict(values) for host, values in self.host_metrics.items()}
+        stats["host_wait_time"] = dict(self.host_wait_time)
+        return stats
+
+    def print_pool_stats(self):
+        stats = self.pool_stats()
+        log.info(f"HTTP pool: {stats['requests']} requests, "
+                 f"{stats['connections_opened']} connections opened, "
+                 f"{stats['connections_reused']} reused ({stats['reuse_ratio']:.0%})")
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+            # Give the SSL transports a moment to shut down cleanly (see aiohttp docs on graceful shutdown).
+            await asyncio.sleep(0.25)
+        self._session = None
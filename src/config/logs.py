@@ -0,0 +1,190 @@
+"""Structured, non-blocking logging for the pipeline.
+
+Loggers under the `pipeline` namespace hand records to a `QueueHandler`; a
+`QueueListener` thread formats and writes them, so the event loop never waits
+on stdout or a log file. Structured fields are passed with `extra=fields(...)`.
+Long fields and messages are truncated before they are queued, and DEBUG
+records can be sampled.
+
+Configuration (arguments to `configure_logging` or environment variables):
+    LOG_LEVEL        DEBUG, INFO (default), WARNING or ERROR
+    LOG_FORMAT       color (default on a terminal), text, or json (one object per line)
+    LOG_FILE         also append JSON lines to this file
+    LOG_MAX_FIELD    characters kept per field/message before truncation (default 500)
+    LOG_DEBUG_SAMPLE fraction of DEBUG records kept (default 1.0)
+"""
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Optional
+from colorama import Fore, Style
+
+ROOT_LOGGER = "pipeline"
+
+_LEVEL_COLORS = {
+    logging.DEBUG: Style.DIM,
+    logging.INFO: "",
+    logging.WARNING: Fore.YELLOW,
+    logging.ERROR: Fore.RED,
+    logging.CRITICAL: Fore.RED + Style.BRIGHT,
+}
+
+_listener: Optional[QueueListener] = None
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Logger for a module, e.g. `get_logger(__name__)` -> `pipeline.config.agent`."""
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+
+def fields(**values) -> Dict[str, Any]:
+    """`extra=` argument carrying structured fields: `log.info("Cache hit", extra=fields(layer="memory"))`."""
+    return {"fields": {k: v for k, v in values.items() if v is not None}}
+
+
+def truncate(value: Any, limit: int) -> Any:
+    if isinstance(value, str) and len(value) > limit:
+        return f"{value[:limit]}... [{len(value) - limit} more chars]"
+    if isinstance(value, (dict, list, tuple)):
+        text = json.dumps(value, default=str)
+        return truncate(text, limit) if len(text) > limit else value
+    return value
+
+
+class PayloadFilter(logging.Filter):
+    """Truncates large fields and messages and samples DEBUG records, before they reach the queue."""
+
+    def __init__(self, max_chars: int = 500, debug_sample_rate: float = 1.0):
+        super().__init__()
+        self.max_chars = max_chars
+        self.debug_sample_rate = debug_sample_rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno <= logging.DEBUG and self.debug_sample_rate < 1.0 and random.random() >= self.debug_sample_rate:
+            return False
+        record.msg = truncate(record.getMessage(), self.max_chars * 4)
+        record.args = None
+        record.fields = {k: truncate(v, self.max_chars) for k, v in getattr(record, "fields", {}).items()}
+        return True
+
+
+class ConsoleFormatter(logging.Formatter):
+    """Human-readable lines; colored by level with dimmed fields when `color` is set (interactive use)."""
+
+    def __init__(self, color: bool):
+        super().__init__()
+        self.color = color
+
+    def format(self, record: logging.LogRecord) -> str:
+        message = record.getMessage()
+        extra = " ".join(f"{k}={v}" for k, v in getattr(record, "fields", {}).items())
+        if self.color:
+            line = f"{_LEVEL_COLORS.get(record.levelno, '')}{message}{Style.RESET_ALL}"
+            if extra:
+                line += f" {Style.DIM}{extra}{Style.RESET_ALL}"
+        else:
+            stamp = time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created))
+            line = f"{stamp} {record.levelname:<7} {record.name[len(ROOT_LOGGER) + 1:]}: {message}"
+            if extra:
+                line += f" {extra}"
+        if record.exc_text:
+            line += "\n" + record.exc_text
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            **getattr(record, "fields", {}),
+        }
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class _Enqueue(QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Unlike the base class, leave formatting to the listener's handlers; only the
+        # traceback is rendered here, since exception objects should not cross threads
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        record.stack_info = None
+        return record
+
+
+class _Stdout(logging.StreamHandler):
+    """Writes to whatever `sys.stdout` is at the time, so `contextlib.redirect_stdout` still works."""
+
+    @property
+    def stream(self):
+        return sys.stdout
+
+    @stream.setter
+    def stream(self, value):
+        pass
+
+
+def configure_logging(level: Optional[str] = None, log_format: Optional[str] = None, log_file: Optional[str] = None,
+                      max_chars: Optional[int] = None, debug_sample_rate: Optional[float] = None):
+    """(Re)configure the `pipeline` loggers; call once from each entry point."""
+    global _listener
+    level = (level or os.getenv('LOG_LEVEL', 'INFO')).upper()
+    log_format = log_format or os.getenv('LOG_FORMAT') or ("color" if sys.stdout.isatty() else "text")
+    log_file = log_file or os.getenv('LOG_FILE')
+    max_chars = max_chars or int(os.getenv('LOG_MAX_FIELD', '500'))
+    debug_sample_rate = debug_sample_rate if debug_sample_rate is not None else float(os.getenv('LOG_DEBUG_SAMPLE', '1.0'))
+
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+    console = _Stdout()
+    console.setFormatter(JsonFormatter() if log_format == "json" else ConsoleFormatter(color=log_format == "color"))
+    handlers = [console]
+    if log_file:
+        file_handler = logging.FileHandler(log_file, encoding="utf-8")
+        file_handler.setFormatter(JsonFormatter())
+        handlers.append(file_handler)
+
+    records: "queue.Queue[logging.LogRecord]" = queue.Queue()
+    enqueue = _Enqueue(records)
+    enqueue.addFilter(PayloadFilter(max_chars, debug_sample_rate))
+    root = logging.getLogger(ROOT_LOGGER)
+    root.handlers = [enqueue]
+    root.setLevel(level)
+    root.propagate = False
+
+    _listener = QueueListener(records, *handlers, respect_handler_level=False)
+    _listener.start()
+
+
+def flush_logging():
+    """Write out everything queued so far (the listener keeps running)."""
+    if _listener is not None:
+        _listener.stop()
+        _listener.start()
+
+
+@atexit.register
+def _stop_listener():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
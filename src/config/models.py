@@ -0,0 +1,29 @@
+def provider_for(model: str) -> str:
+    return "anthropic" if model.startswith("claude") else "openai"
+
+# Models that `Agent.select_model` treats as interchangeable quality levels
+MODEL_TIERS = {
+    "claude-3-haiku-20240307": "fast",
+    "gpt-3.5-turbo": "fast",
+    "gpt-4o": "strong",
+    "claude-3-5-sonnet-20240620": "strong",
+}
+
+def tier_of(model: str) -> str:
+    return MODEL_TIERS.get(model, model)
+
+def equivalent_models(model: str) -> list:
+    tier = tier_of(model)
+    return [other for other, other_tier in MODEL_TIERS.items() if other_tier == tier and other != model]
+
+# USD per million (input, output) tokens, used by cost-aware routing
+MODEL_PRICES = {
+    "gpt-4o": (5.0, 15.0),
+    "gpt-3.5-turbo": (0.5, 1.5),
+    "claude-3-5-sonnet-20240620": (3.0, 15.0),
+    "claude-3-haiku-20240307": (0.25, 1.25),
+}
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    input_price, output_price = MODEL_PRICES.get(model, (0.0, 0.0))
+    return (prompt_tokens * input_price + completion_tokens * output_price) / 1_000_000
@@ -0,0 +1,122 @@
+import asyncio
+import time
+from collections import defaultdict
+from typing import Any, Awaitable, Dict, List, Optional, Tuple
+from tools.web_search import search_prefetcher
+from .logs import get_logger
+from .tracing import tracer
+
+log = get_logger(__name__)
+
+DEFAULT_STAGE_LIMITS = {
+    "analyze": 16,
+    "search": 16,
+    "answer": 8,
+    "synthesis": 4,
+}
+
+
+class QueryTimeline:
+    """Per-query record of when each stage ran for each sub-question."""
+
+    def __init__(self, query: str):
+        self.query = query
+        self.started_at = time.perf_counter()
+        self.events: List[Tuple[str, str, float, float]] = []
+
+    def record(self, label: str, stage: str, start: float, end: float):
+        self.events.append((label, stage, start - self.started_at, end - self.started_at))
+
+    @property
+    def wall_time(self) -> float:
+        return max((end for _, _, _, end in self.events), default=0.0)
+
+    def stage_summary(self) -> Dict[str, Dict[str, float]]:
+        summary: Dict[str, Dict[str, float]] = defaultdict(lambda: {"count": 0, "busy": 0.0, "max": 0.0, "first_start": float("inf"), "last_end": 0.0})
+        for _, stage, start, end in self.events:
+            entry = summary[stage]
+            entry["count"] += 1
+            entry["busy"] += end - start
+            entry["max"] = max(entry["max"], end - start)
+            entry["first_start"] = min(entry["first_start"], start)
+            entry["last_end"] = max(entry["last_end"], end)
+        return dict(summary)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "query": self.query,
+            "wall_time": self.wall_time,
+            "events": [{"label": label, "stage": stage, "start": start, "end": end} for label, stage, start, end in self.events],
+            "stages": self.stage_summary(),
+        }
+
+    def print_summary(self):
+        lines = [f"Query timeline ({self.wall_time:.2f}s wall time):"]
+        for stage, entry in sorted(self.stage_summary().items(), key=lambda item: item[1]["first_start"]):
+            lines.append(f"  {stage:<12} x{entry['count']:<3} "
+                         f"window {entry['first_start']:6.2f}s -> {entry['last_end']:6.2f}s  "
+                         f"busy {entry['busy']:6.2f}s  slowest {entry['max']:6.2f}s")
+        log.info("\n".join(lines))
+
+
+class PipelineExecutor:
+    """Dataflow executor: each sub-question moves through analyze -> search -> answer on its own.
+
+    There are no barriers between stages. A sub-question starts its next stage as
+    soon as its previous one finishes, bounded only by the per-stage concurrency
+    limits. The limits are shared by every query that runs through this
+    executor, so concurrent queries compete fairly for the same slots.
+    """
+
+    def __init__(self, agent, stage_limits: Optional[Dict[str, int]] = None):
+        self.agent = agent
+        limits = dict(DEFAULT_STAGE_LIMITS)
+        limits.update(stage_limits or {})
+        self.stage_limits = limits
+        self._semaphores = {stage: asyncio.Semaphore(limit) for stage, limit in limits.items()}
+
+    def slot(self, stage: str) -> asyncio.Semaphore:
+        semaphore = self._semaphores.get(stage)
+        if semaphore is None:
+            semaphore = self._semaphores[stage] = asyncio.Semaphore(self.stage_limits.get(stage, 8))
+        return semaphore
+
+    async def run_stage(self, timeline: QueryTimeline, stage: str, label: str, awaitable: Awaitable) -> Any:
+        async with self.slot(stage):
+            return await self.wait_stage(timeline, stage, label, awaitable)
+
+    async def wait_stage(self, timeline: QueryTimeline, stage: str, label: str, awaitable: Awaitable) -> Any:
+        """Record the wait for work that holds its own stage slot (see `run_stage` for work that does not)."""
+        start = time.perf_counter()
+        try:
+            return await awaitable
+        finally:
+            timeline.record(label, stage, start, time.perf_counter())
+
+    async def run_sub_question(self, timeline: QueryTimeline, index: int, full_query: str, sub_question: Tuple[str, int, bool]):
+        with tracer.span("sub_question", index=index, question=sub_question[0]):
+            return await self._run_sub_question(timeline, index, full_query, sub_question)
+
+    async def _run_sub_question(self, timeline: QueryTimeline, index: int, full_query: str, sub_question: Tuple[str, int, bool]):
+        sub_q, difficulty, needs_web_search = sub_question
+        label = f"q{index}"
+
+        # Start the search right away so it overlaps with analysis; the answering call reuses its result.
+        # The search task holds the "search" slot itself, so the limit applies from the moment it starts.
+        search = search_prefetcher.prefetch(sub_q, limit=self.slot("search")) if needs_web_search else None
+
+        _, _, question_type, expertise, is_coding_related = await self.run_stage(
+            timeline, "analyze", label, self.agent.analyze_sub_question(sub_question))
+
+        if search is not None:
+            # Only the part of the search that outlasted analysis shows up as time on the critical path
+            try:
+                await self.wait_stage(timeline, "search", label, asyncio.shield(search))
+            except Exception as e:
+                log.warning(f"Web search failed: {e}")
+
+        response, model_used = await self.run_stage(
+            timeline, "answer", label,
+            self.agent.query_model_with_context(full_query, sub_q, difficulty, question_type, expertise, is_coding_related, needs_web_search))
+
+        return (sub_q, difficulty, question_type, expertise, is_coding_related, model_used, response)
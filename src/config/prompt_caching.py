@@ -0,0 +1,33 @@
+"""Request shaping that lets providers cache the static prompt prefix.
+
+The system prompts in `prompts.py` are identical on every call; only the user
+message changes. Both providers can reuse work for a repeated prefix:
+
+- Anthropic caches up to a `cache_control` breakpoint, so the system prompt is
+  sent as a text block marked `{"type": "ephemeral"}` rather than a string.
+- OpenAI caches automatically on an exact prefix match, so the static system
+  messages always go first and nothing per-query is ever put into them.
+
+Cached input is reported in the usage fields (`cache_read_input_tokens` /
+`cache_creation_input_tokens`, `prompt_tokens_details.cached_tokens`) and
+counted by `tracer.record_usage`. Both providers only cache prefixes above a
+minimum length (1024 tokens for most models), so short prompts are sent the
+same way but simply report no cached tokens. Set PROMPT_CACHING=0 to send
+plain string system prompts.
+"""
+import os
+from typing import List, Union
+
+PROMPT_CACHING = os.getenv('PROMPT_CACHING', '1') != '0'
+
+
+def anthropic_system(system: str) -> Union[str, List[dict]]:
+    """The `system` field for an Anthropic request, with a cache breakpoint after the static prompt."""
+    if not PROMPT_CACHING or not system:
+        return system
+    return [{"type": "text", "text": system, "cache_control": {"type": "ephemeral"}}]
+
+
+def stable_prefix(messages: list) -> list:
+    """System messages first, in their original order, so the static part is an exact prefix of every request."""
+    return [m for m in messages if m['role'] == 'system'] + [m for m in messages if m['role'] != 'system']
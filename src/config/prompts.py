@@ -119,3 +119,29 @@ decision_prompt = (
     """
 )
 
+
+batch_analyze_question_prompt = (
+    """
+    You are an advanced AI system designed to analyze questions and determine their characteristics. You will receive a numbered list of questions, each with a difficulty score from 1-100.
+
+    For each question, determine:
+
+    1. question_type, one of:
+       - FACTUAL: Requires recall of specific information or facts.
+       - ANALYTICAL: Involves analysis, comparison, or interpretation of information.
+       - CREATIVE: Requires imaginative or innovative thinking.
+       - TECHNICAL: Involves specialized knowledge, particularly in fields like science, engineering, or programming.
+
+    2. expertise, one of:
+       - GENERAL: Can be answered with common knowledge or easily accessible information.
+       - SPECIALIZED: Requires in-depth knowledge of a specific field or topic.
+       - EXPERT: Demands extensive expertise and possibly cutting-edge knowledge in a particular domain.
+
+    3. coding: true if the question is related to coding or programming, otherwise false.
+
+    Respond with a single JSON object and nothing else, in exactly this shape, with one entry per question in the same order:
+    {"analyses": [{"index": 1, "question_type": "FACTUAL", "expertise": "GENERAL", "coding": false}]}
+
+    Remember, your analysis will be used to select the most appropriate AI model to answer each question, so accuracy is crucial.
+    """
+)
@@ -1,27 +1,62 @@
-import openai
-from typing import List, Tuple
+import os
+from typing import AsyncIterator, Optional, Tuple
 from .prompts import decomp_prompt
+from .http_client import HttpClient
+from .rate_limit import RateLimiter, estimate_tokens
+from .tracing import tracer
 
+OPENAI_CHAT_ENDPOINT = os.getenv('OPENAI_API_URL', "https://api.openai.com/v1/chat/completions")
 
-def decompose_question(api_key: str, model: str, query: str) -> List[Tuple[str, int]]:
-    client = openai.OpenAI(api_key=api_key)
-    response = client.chat.completions.create(
-        model=model,
-        messages=[
+
+def parse_sub_question_line(line: str) -> Optional[Tuple[str, int, bool]]:
+    parts = line.strip().split(" | ")
+    if len(parts) != 3:
+        return None
+    question = parts[0].replace("Question: ", "").strip()
+    try:
+        difficulty = int(parts[1].replace("Difficulty: ", "").strip())
+    except ValueError:
+        return None
+    needs_web_search = parts[2].replace("Needs Web Search: ", "").strip().lower() == "true"
+    return question, difficulty, needs_web_search
+
+
+async def decompose_question_stream(http: HttpClient, api_key: str, model: str, query: str,
+                                    endpoint: str = OPENAI_CHAT_ENDPOINT,
+                                    rate_limiter: Optional[RateLimiter] = None) -> AsyncIterator[Tuple[str, int, bool]]:
+    """Stream the decomposition and yield each sub-question as soon as its line is complete."""
+    headers = {
+        'Content-Type': 'application/json',
+        'Authorization': f'Bearer {api_key}',
+    }
+    payload = {
+        'model': model,
+        'messages': [
             {"role": "system", "content": decomp_prompt},
             {"role": "user", "content": query}
         ],
-        max_tokens=2048,
-        temperature=0.2,
-        n=1
-    )
-    sub_questions_with_difficulty = response.choices[0].message.content.strip().split("\n")
-    result = []
-    for item in sub_questions_with_difficulty:
-        parts = item.split(" | ")
-        if len(parts) == 3:
-            question = parts[0].replace("Question: ", "").strip()
-            difficulty = int(parts[1].replace("Difficulty: ", "").strip())
-            needs_web_search = parts[2].replace("Needs Web Search: ", "").strip().lower() == "true"
-            result.append((question, difficulty, needs_web_search))
-    return result
+        'max_tokens': 2048,
+        'temperature': 0.2,
+        'n': 1,
+        'stream': True,
+        'stream_options': {'include_usage': True}
+    }
+    buffer = ""
+    rate_limiter = rate_limiter or RateLimiter()
+    events = rate_limiter.run_stream("openai", model, estimate_tokens(payload['messages'], payload['max_tokens']),
+                                     lambda: http.stream_sse(endpoint, headers, payload))
+    async for event in events:
+        if event.get('usage'):
+            tracer.record_usage("openai", model, event['usage'])
+        choices = event.get('choices') or []
+        if not choices:
+            continue
+        buffer += choices[0].get('delta', {}).get('content') or ""
+        while "\n" in buffer:
+            line, buffer = buffer.split("\n", 1)
+            parsed = parse_sub_question_line(line)
+            if parsed is not None:
+                yield parsed
+    parsed = parse_sub_question_line(buffer)
+    if parsed is not None:
+        yield parsed
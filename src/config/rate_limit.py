@@ -0,0 +1,248 @@
+import asyncio
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from tenacity import AsyncRetrying, retry_if_exception, stop_after_attempt, wait_exponential
+from .tracing import tracer
+
+RETRYABLE_STATUSES = {408, 409, 429, 500, 502, 503, 504, 529}
+
+# (requests per minute, tokens per minute), keyed by "provider" or "provider:model"
+DEFAULT_LIMITS: Dict[str, Tuple[float, float]] = {
+    "openai": (500, 150_000),
+    "openai:gpt-4o": (500, 30_000),
+    "anthropic": (50, 40_000),
+}
+
+
+class ProviderError(Exception):
+    def __init__(self, message: str, status: Optional[int] = None, retryable: bool = False, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status = status
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+
+def parse_retry_after(headers) -> Optional[float]:
+    if headers is None:
+        return None
+    retry_after_ms = headers.get('retry-after-ms')
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+    retry_after = headers.get('retry-after')
+    if not retry_after:
+        return None
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        try:
+            return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+
+def error_for_status(status: int, headers, body: Any, url: str) -> ProviderError:
+    message = body
+    if isinstance(body, dict) and 'error' in body:
+        error = body['error']
+        message = error.get('message', error) if isinstance(error, dict) else error
+    return ProviderError(f"HTTP {status} from {url}: {str(message)[:500]}", status=status,
+                         retryable=status in RETRYABLE_STATUSES, retry_after=parse_retry_after(headers))
+
+
+def is_retryable(exc: BaseException) -> bool:
+    if isinstance(exc, ProviderError):
+        return exc.retryable
+    # Transport-level failures (timeouts, dropped connections) are worth another try
+    return isinstance(exc, (asyncio.TimeoutError, ConnectionError)) or type(exc).__module__.startswith("aiohttp")
+
+
+def estimate_tokens(messages: list, max_tokens: int = 1024) -> int:
+    prompt_chars = sum(len(str(message.get('content', ''))) for message in messages)
+    return prompt_chars // 4 + max_tokens
+
+
+def usage_tokens(response: Any) -> Optional[int]:
+    usage = response.get('usage') if isinstance(response, dict) else None
+    if not usage:
+        return None
+    if 'total_tokens' in usage:
+        return usage['total_tokens']
+    return usage.get('input_tokens', 0) + usage.get('output_tokens', 0)
+
+
+class TokenBucket:
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        if self.capacity == float("inf"):
+            return 0.0
+        self._refill()
+        # Requests larger than the whole bucket only wait for a full bucket
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount: float):
+        if self.capacity != float("inf"):
+            self._refill()
+            self.level -= amount
+
+    def give_back(self, amount: float):
+        if self.capacity != float("inf"):
+            self.level = min(self.capacity, self.level + amount)
+
+
+class ProviderLimiter:
+    """Requests/min and tokens/min buckets for one provider (or provider + model).
+
+    Callers are admitted strictly in arrival order (asyncio.Lock is FIFO), so a
+    large request cannot be starved by a stream of small ones. A Retry-After
+    from the provider pauses admission for everyone sharing the limiter.
+    """
+
+    def __init__(self, name: str, requests_per_minute: float, tokens_per_minute: float):
+        self.name = name
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self._lock = asyncio.Lock()
+        self.blocked_until = 0.0
+        self.waiting = 0
+        self.throttle_time = 0.0
+        self.throttled_requests = 0
+        self.admitted = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.failures = 0
+
+    async def acquire(self, tokens: int):
+        self.waiting += 1
+        started = time.monotonic()
+        try:
+            async with self._lock:
+                while True:
+                    delay = max(self.blocked_until - time.monotonic(),
+                                self.requests.wait_time(1),
+                                self.tokens.wait_time(tokens))
+                    if delay <= 0:
+                        break
+                    await asyncio.sleep(delay)
+                self.requests.take(1)
+                self.tokens.take(tokens)
+        finally:
+            self.waiting -= 1
+        waited = time.monotonic() - started
+        self.admitted += 1
+        if waited > 0.001:
+            self.throttled_requests += 1
+            self.throttle_time += waited
+
+    def settle(self, estimated: int, actual: Optional[int]):
+        if actual is None:
+            return
+        if actual < estimated:
+            self.tokens.give_back(estimated - actual)
+        else:
+            self.tokens.take(actual - estimated)
+
+    def pause(self, seconds: float):
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queue_depth": self.waiting,
+            "admitted": self.admitted,
+            "throttled_requests": self.throttled_requests,
+            "throttle_time": round(self.throttle_time, 3),
+            "retries": self.retries,
+            "rate_limited": self.rate_limited,
+            "failures": self.failures,
+        }
+
+
+class RateLimiter:
+    """Shared limiter for every provider call, with Retry-After aware retries."""
+
+    def __init__(self, limits: Optional[Dict[str, Tuple[float, float]]] = None, max_attempts: int = 3):
+        self.limits = dict(DEFAULT_LIMITS)
+        self.limits.update(limits or {})
+        self.max_attempts = max_attempts
+        self._limiters: Dict[str, ProviderLimiter] = {}
+
+    def limiter(self, provider: str, model: Optional[str] = None) -> ProviderLimiter:
+        key = f"{provider}:{model}" if model and f"{provider}:{model}" in self.limits else provider
+        if key not in self._limiters:
+            requests_per_minute, tokens_per_minute = self.limits.get(key, (float("inf"), float("inf")))
+            self._limiters[key] = ProviderLimiter(key, requests_per_minute, tokens_per_minute)
+        return self._limiters[key]
+
+    def _wait(self, retry_state) -> float:
+        exc = retry_state.outcome.exception()
+        if isinstance(exc, ProviderError) and exc.retry_after is not None:
+            return exc.retry_after
+        return wait_exponential(multiplier=1, min=1, max=10)(retry_state)
+
+    def _retrying(self, limiter: ProviderLimiter, provider: str, model: Optional[str]) -> AsyncRetrying:
+        def before_sleep(retry_state):
+            exc = retry_state.outcome.exception()
+            limiter.retries += 1
+            tracer.record_retry(provider, model, exc.status if isinstance(exc, ProviderError) else None)
+            if isinstance(exc, ProviderError) and exc.status == 429:
+                limiter.rate_limited += 1
+                limiter.pause(self._wait(retry_state))
+
+        return AsyncRetrying(
+            stop=stop_after_attempt(self.max_attempts),
+            wait=self._wait,
+            retry=retry_if_exception(is_retryable),
+            before_sleep=before_sleep,
+            reraise=True,
+        )
+
+    async def run(self, provider: str, model: Optional[str], tokens: int, call: Callable[[], Awaitable[Any]]) -> Any:
+        limiter = self.limiter(provider, model)
+        with tracer.span("provider_call", provider=provider, model=model):
+            try:
+                async for attempt in self._retrying(limiter, provider, model):
+                    with attempt:
+                        await limiter.acquire(tokens)
+                        result = await call()
+                        limiter.settle(tokens, usage_tokens(result))
+                        tracer.record_usage(provider, model, result.get('usage') if isinstance(result, dict) else None)
+                        return result
+            except Exception:
+                limiter.failures += 1
+                raise
+
+    async def run_stream(self, provider: str, model: Optional[str], tokens: int, open_stream: Callable[[], Any]):
+        """Yield from `open_stream()`, retrying only failures that happen before the first item."""
+        limiter = self.limiter(provider, model)
+        try:
+            async for attempt in self._retrying(limiter, provider, model):
+                with attempt:
+                    await limiter.acquire(tokens)
+                    stream = open_stream()
+                    try:
+                        first = await stream.__anext__()
+                    except StopAsyncIteration:
+                        return
+        except Exception:
+            limiter.failures += 1
+            raise
+        yield first
+        async for item in stream:
+            yield item
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {key: limiter.stats() for key, limiter in self._limiters.items()}
@@ -0,0 +1,251 @@
+import os
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional
+from .hedging import LatencyTracker
+from .logs import fields, get_logger
+from .models import equivalent_models, estimate_cost
+
+log = get_logger(__name__)
+
+
+class CircuitBreaker:
+    """Takes a model out of rotation after repeated failures.
+
+    After `failure_threshold` consecutive failures the circuit opens for
+    `cooldown` seconds. Then a single trial request is let through (half-open):
+    success closes the circuit, failure reopens it with the cooldown doubled,
+    up to `max_cooldown`.
+    """
+
+    def __init__(self, failure_threshold: int = 3, cooldown: float = 30.0, max_cooldown: float = 300.0):
+        self.failure_threshold = failure_threshold
+        self.base_cooldown = cooldown
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        self.times_opened = 0
+
+    def available(self, now: Optional[float] = None) -> bool:
+        if self.state == "closed":
+            return True
+        now = time.monotonic() if now is None else now
+        return now >= self.opened_at + self.cooldown and not self.trial_in_flight
+
+    def dispatched(self):
+        if self.state != "closed":
+            self.state = "half_open"
+            self.trial_in_flight = True
+
+    def record(self, ok: bool):
+        if ok:
+            self.state = "closed"
+            self.consecutive_failures = 0
+            self.cooldown = self.base_cooldown
+            self.trial_in_flight = False
+            return
+        self.consecutive_failures += 1
+        if self.state == "half_open":
+            self._open(min(self.max_cooldown, self.cooldown * 2))
+        elif self.state == "closed" and self.consecutive_failures >= self.failure_threshold:
+            self._open(self.base_cooldown)
+
+    def abandoned(self):
+        """The trial request was cancelled before it finished; let another one through."""
+        self.trial_in_flight = False
+
+    def _open(self, cooldown: float):
+        self.state = "open"
+        self.cooldown = cooldown
+        self.opened_at = time.monotonic()
+        self.trial_in_flight = False
+        self.times_opened += 1
+
+
+class ModelStats:
+    """Rolling per-model outcomes: error rate and cost here, latency in the shared `LatencyTracker`."""
+
+    def __init__(self, model: str, latency: LatencyTracker, window: int = 100):
+        self.model = model
+        self.latency = latency
+        self.outcomes: Deque[bool] = deque(maxlen=window)
+        self.costs: Deque[float] = deque(maxlen=window)
+        self.requests = 0
+        self.failures = 0
+
+    def record(self, seconds: float, ok: bool, cost: float):
+        self.requests += 1
+        self.outcomes.append(ok)
+        if ok:
+            self.latency.observe(self.model, seconds)
+            self.costs.append(cost)
+        else:
+            self.failures += 1
+
+    @property
+    def error_rate(self) -> float:
+        return self.outcomes.count(False) / len(self.outcomes) if self.outcomes else 0.0
+
+    def p50(self, min_samples: int = 1) -> Optional[float]:
+        return self.latency.percentile(self.model, 0.5, min_samples)
+
+    def expected_latency(self, min_samples: int = 5) -> Optional[float]:
+        """Median latency inflated by the error rate (a failure costs roughly one more attempt)."""
+        p50 = self.p50(min_samples)
+        return None if p50 is None else p50 * (1 + self.error_rate)
+
+    def expected_cost(self) -> Optional[float]:
+        return sum(self.costs) / len(self.costs) if self.costs else None
+
+
+class RoutingPolicy:
+    """Chooses one of `candidates` (all in the static rules' tier and with closed circuits).
+
+    `preferred` is the model the static rules picked; it is always among the candidates
+    unless its circuit is open.
+    """
+
+    name = "base"
+
+    def choose(self, preferred: str, candidates: List[str], stats: Dict[str, ModelStats]) -> str:
+        raise NotImplementedError
+
+
+class StaticPolicy(RoutingPolicy):
+    """The static rules' choice, falling back to an equivalent model only while its circuit is open."""
+
+    name = "static"
+
+    def choose(self, preferred: str, candidates: List[str], stats: Dict[str, ModelStats]) -> str:
+        return preferred if preferred in candidates else candidates[0]
+
+
+class ScoredPolicy(RoutingPolicy):
+    """Lowest score wins; models without enough data score None and are only used as a fallback.
+
+    The preferred model keeps the traffic unless another is better by more than
+    `switch_margin`, so routing does not flap between near-equal models.
+    """
+
+    def __init__(self, switch_margin: float = 0.1):
+        self.switch_margin = switch_margin
+
+    def score(self, model: str, stats: Dict[str, ModelStats]) -> Optional[float]:
+        raise NotImplementedError
+
+    def choose(self, preferred: str, candidates: List[str], stats: Dict[str, ModelStats]) -> str:
+        default = preferred if preferred in candidates else candidates[0]
+        default_score = self.score(default, stats)
+        if default_score is None:
+            # Let the default model build up its statistics first
+            return default
+        scored = sorted((score, model) for model in candidates if (score := self.score(model, stats)) is not None)
+        best_score, best = scored[0]
+        return best if best_score < default_score * (1 - self.switch_margin) else default
+
+
+class LatencyPolicy(ScoredPolicy):
+    name = "latency"
+
+    def score(self, model: str, stats: Dict[str, ModelStats]) -> Optional[float]:
+        return stats[model].expected_latency() if model in stats else None
+
+
+class CostPolicy(ScoredPolicy):
+    name = "cost"
+
+    def score(self, model: str, stats: Dict[str, ModelStats]) -> Optional[float]:
+        if model not in stats or stats[model].expected_cost() is None:
+            return None
+        # A failed request is paid for again on retry
+        return stats[model].expected_cost() * (1 + stats[model].error_rate)
+
+
+POLICIES = {policy.name: policy for policy in (StaticPolicy, LatencyPolicy, CostPolicy)}
+
+
+class ModelRouter:
+    """Adaptive routing within the tier `Agent.select_model` picked.
+
+    Every model call reports its latency, outcome and token counts through
+    `record`. `choose` then drops models whose circuit breaker is open and lets
+    the policy (ROUTING_POLICY: static, latency or cost) pick among the rest.
+    """
+
+    def __init__(self, policy: Optional[RoutingPolicy] = None, failure_threshold: int = 3, cooldown: float = 30.0,
+                 window: int = 100, latency: Optional[LatencyTracker] = None):
+        self.policy = policy or POLICIES[os.getenv('ROUTING_POLICY', 'latency')]()
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.window = window
+        self.latency = latency or LatencyTracker(window)
+        self.stats: Dict[str, ModelStats] = {}
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.rerouted = 0
+
+    def _model_stats(self, model: str) -> ModelStats:
+        if model not in self.stats:
+            self.stats[model] = ModelStats(model, self.latency, self.window)
+        return self.stats[model]
+
+    def breaker(self, model: str) -> CircuitBreaker:
+        if model not in self.breakers:
+            self.breakers[model] = CircuitBreaker(self.failure_threshold, self.cooldown)
+        return self.breakers[model]
+
+    def is_available(self, model: str) -> bool:
+        return self.breaker(model).available()
+
+    def choose(self, preferred: str) -> str:
+        candidates = [model for model in [preferred] + equivalent_models(preferred) if self.is_available(model)]
+        if not candidates:
+            # Every model in the tier is failing; the preferred one is as good a bet as any
+            return preferred
+        for model in candidates:
+            self._model_stats(model)
+        chosen = self.policy.choose(preferred, candidates, self.stats)
+        self.breaker(chosen).dispatched()
+        if chosen != preferred:
+            self.rerouted += 1
+        return chosen
+
+    def record(self, model: str, seconds: float, ok: bool, prompt_tokens: int = 0, completion_tokens: int = 0):
+        breaker = self.breaker(model)
+        was_open = breaker.state != "closed"
+        self._model_stats(model).record(seconds, ok, estimate_cost(model, prompt_tokens, completion_tokens))
+        breaker.record(ok)
+        if breaker.state == "open" and not was_open:
+            log.warning(f"Circuit opened for {model} after {breaker.consecutive_failures} consecutive failures; "
+                        f"routing around it for {breaker.cooldown:.0f}s", extra=fields(model=model, circuit="open"))
+        elif was_open and breaker.state == "closed":
+            log.info(f"Circuit closed for {model}", extra=fields(model=model, circuit="closed"))
+
+    def abandon(self, model: str):
+        self.breaker(model).abandoned()
+
+    def summary(self) -> Dict[str, Dict[str, object]]:
+        return {
+            model: {
+                "requests": stats.requests,
+                "error_rate": round(stats.error_rate, 3),
+                "p50": stats.p50(),
+                "expected_cost": stats.expected_cost(),
+                "circuit": self.breaker(model).state,
+                "times_opened": self.breaker(model).times_opened,
+            }
+            for model, stats in self.stats.items()
+        }
+
+    def print_stats(self):
+        summary = self.summary()
+        if not any(entry["requests"] for entry in summary.values()):
+            return
+        log.info(f"Routing [{self.policy.name}]: {self.rerouted} requests rerouted")
+        for model, entry in summary.items():
+            p50 = "n/a" if entry["p50"] is None else f"{entry['p50']:.2f}s"
+            cost = "n/a" if entry["expected_cost"] is None else f"${entry['expected_cost']:.5f}"
+            log.info(f"  {model}: {entry['requests']} requests, {entry['error_rate']:.0%} errors, "
+                     f"p50 {p50}, {cost}/request, circuit {entry['circuit']}")
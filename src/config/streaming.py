@@ -0,0 +1,58 @@
+import time
+from typing import AsyncIterator, Optional
+
+
+class TokenStream:
+    """Async iterator over streamed text chunks that records its own timing.
+
+    `time_to_first_token` and `total_latency` are measured from construction,
+    i.e. from just before the request is sent. The full text is available in
+    `text` once the stream has been consumed.
+    """
+
+    def __init__(self, model: str, chunks: AsyncIterator[str]):
+        self.model = model
+        self._chunks = chunks
+        self.started_at = time.perf_counter()
+        self.first_token_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._parts = []
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> str:
+        try:
+            chunk = await self._chunks.__anext__()
+        except StopAsyncIteration:
+            if self.finished_at is None:
+                self.finished_at = time.perf_counter()
+            raise
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+        self._parts.append(chunk)
+        return chunk
+
+    async def collect(self) -> str:
+        async for _ in self:
+            pass
+        return self.text
+
+    @property
+    def text(self) -> str:
+        return "".join(self._parts)
+
+    @property
+    def time_to_first_token(self) -> Optional[float]:
+        return None if self.first_token_at is None else self.first_token_at - self.started_at
+
+    @property
+    def total_latency(self) -> Optional[float]:
+        return None if self.finished_at is None else self.finished_at - self.started_at
+
+    def timing_summary(self) -> str:
+        ttft = self.time_to_first_token
+        total = self.total_latency
+        return (f"{self.model}: time to first token "
+                f"{'n/a' if ttft is None else f'{ttft:.2f}s'}, total "
+                f"{'n/a' if total is None else f'{total:.2f}s'}")
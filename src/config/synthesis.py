@@ -0,0 +1,191 @@
+import asyncio
+import os
+import time
+from itertools import combinations
+from typing import Callable, Dict, List, Optional, Tuple
+from .caching.semantic import shingles, jaccard
+from .logs import get_logger
+from .prompts import final_check_prompt, decision_prompt
+
+log = get_logger(__name__)
+
+FINAL_CHECK_MODELS = ["gpt-4o", "claude-3-5-sonnet-20240620", "gpt-3.5-turbo"]
+
+
+def estimate_text_tokens(text: str) -> int:
+    return len(text) // 4
+
+
+class SynthesisStrategy:
+    """How final checks are combined into one answer.
+
+    mode:
+      - "full": run every final-check model, then the decision call (the original behaviour).
+      - "first_k": use the first `k` successful final checks and cancel the rest.
+      - "single": one final check with `single_model`, no decision call.
+
+    If `agreement_threshold` is set, the decision call is skipped whenever every
+    pair of candidates is at least that similar (word/bigram Jaccard).
+    """
+
+    def __init__(self, mode: str = "full", k: int = 2, models: Optional[List[str]] = None,
+                 agreement_threshold: Optional[float] = None, single_model: str = "gpt-4o"):
+        if mode not in ("full", "first_k", "single"):
+            raise ValueError(f"Unknown synthesis mode: {mode}")
+        self.mode = mode
+        self.models = list(models or FINAL_CHECK_MODELS)
+        self.k = max(1, min(k, len(self.models)))
+        self.agreement_threshold = agreement_threshold
+        self.single_model = single_model
+
+    @classmethod
+    def from_env(cls) -> "SynthesisStrategy":
+        """Read SYNTHESIS_STRATEGY and SYNTHESIS_AGREEMENT."""
+        agreement = os.getenv('SYNTHESIS_AGREEMENT')
+        return cls.from_spec(os.getenv('SYNTHESIS_STRATEGY', 'full'), float(agreement) if agreement else None)
+
+    @classmethod
+    def from_spec(cls, spec: str, agreement_threshold: Optional[float] = None) -> "SynthesisStrategy":
+        """Parse "full", "first_k:2" or "single[:model]"."""
+        mode, _, arg = spec.partition(':')
+        kwargs = {"agreement_threshold": agreement_threshold}
+        if mode == "first_k" and arg:
+            kwargs["k"] = int(arg)
+        elif mode == "single" and arg:
+            kwargs["single_model"] = arg
+        return cls(mode, **kwargs)
+
+    def describe(self) -> str:
+        if self.mode == "first_k":
+            return f"first {self.k} of {len(self.models)}"
+        if self.mode == "single":
+            return f"single ({self.single_model})"
+        return f"full ({len(self.models)} final checks + decision)"
+
+
+class SynthesisReport:
+    def __init__(self, strategy: SynthesisStrategy):
+        self.strategy = strategy
+        self.final_check_latency = 0.0
+        self.decision_latency = 0.0
+        self.final_checks_completed = 0
+        self.final_checks_cancelled = 0
+        self.decision_skipped = False
+        self.agreement: Optional[float] = None
+        self.saved_tokens = 0
+        self.saved_latency = 0.0
+
+    def to_dict(self) -> Dict[str, object]:
+        return {
+            "strategy": self.strategy.describe(),
+            "final_check_latency": round(self.final_check_latency, 3),
+            "decision_latency": round(self.decision_latency, 3),
+            "final_checks_completed": self.final_checks_completed,
+            "final_checks_cancelled": self.final_checks_cancelled,
+            "decision_skipped": self.decision_skipped,
+            "agreement": self.agreement,
+            "estimated_saved_tokens": self.saved_tokens,
+            "estimated_saved_latency": round(self.saved_latency, 3),
+        }
+
+    def print_summary(self):
+        agreement = "n/a" if self.agreement is None else f"{self.agreement:.2f}"
+        log.info(f"Synthesis [{self.strategy.describe()}]: "
+                 f"{self.final_checks_completed} final checks ({self.final_check_latency:.2f}s), "
+                 f"{self.final_checks_cancelled} cancelled, agreement {agreement}, "
+                 f"decision {'skipped' if self.decision_skipped else f'{self.decision_latency:.2f}s'}; "
+                 f"saved ~{self.saved_tokens} tokens, ~{self.saved_latency:.2f}s")
+
+
+class Synthesizer:
+    """Runs a `SynthesisStrategy` against an Agent and estimates what it saved.
+
+    Latency savings are estimated from running averages of the full path (all
+    final checks, and the decision call) observed whenever those do run.
+    """
+
+    def __init__(self, agent):
+        self.agent = agent
+        self._avg_latency: Dict[str, float] = {}
+
+    def _observe(self, name: str, seconds: float):
+        previous = self._avg_latency.get(name)
+        self._avg_latency[name] = seconds if previous is None else 0.8 * previous + 0.2 * seconds
+
+    async def _first_k(self, full_query: str, sub_responses: List[str], models: List[str], k: int,
+                       report: SynthesisReport) -> List[str]:
+        tasks = [asyncio.ensure_future(self.agent.final_check(full_query, sub_responses, model)) for model in models]
+        results: List[str] = []
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                response = await next_done
+                report.final_checks_completed += 1
+                if not response.startswith("Error:"):
+                    results.append(response)
+                if len(results) >= k:
+                    break
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+                    report.final_checks_cancelled += 1
+        # Fall back to whatever came back (errors included) if too few succeeded
+        return results or [task.result() for task in tasks if task.done() and not task.cancelled()]
+
+    @staticmethod
+    def agreement(candidates: List[str]) -> float:
+        if len(candidates) < 2:
+            return 1.0
+        grams = [shingles(candidate) for candidate in candidates]
+        return min(jaccard(a, b) for a, b in combinations(grams, 2))
+
+    async def synthesize(self, full_query: str, sub_responses: List[str], strategy: SynthesisStrategy,
+                         on_token: Optional[Callable[[str, str], None]] = None) -> Tuple[str, List[str], SynthesisReport]:
+        report = SynthesisReport(strategy)
+        context_tokens = estimate_text_tokens(final_check_prompt + full_query + "\n".join(sub_responses))
+
+        started = time.perf_counter()
+        if strategy.mode == "single":
+            candidates = [await self.agent.final_check(full_query, sub_responses, strategy.single_model)]
+            report.final_checks_completed = 1
+        elif strategy.mode == "first_k":
+            candidates = await self._first_k(full_query, sub_responses, strategy.models, strategy.k, report)
+        else:
+            candidates = list(await asyncio.gather(*[self.agent.final_check(full_query, sub_responses, model) for model in strategy.models]))
+            report.final_checks_completed = len(candidates)
+        report.final_check_latency = time.perf_counter() - started
+        if strategy.mode == "full":
+            self._observe("final_checks", report.final_check_latency)
+        else:
+            report.saved_latency += max(0.0, self._avg_latency.get("final_checks", report.final_check_latency) - report.final_check_latency)
+            # Final checks that never started save their whole prompt; cancelled ones save only their output
+            not_started = len(strategy.models) - report.final_checks_completed - report.final_checks_cancelled
+            average_output = sum(estimate_text_tokens(c) for c in candidates) // max(1, len(candidates))
+            report.saved_tokens += max(0, not_started) * (context_tokens + average_output)
+            report.saved_tokens += report.final_checks_cancelled * average_output
+
+        successful = [candidate for candidate in candidates if not candidate.startswith("Error:")]
+        if strategy.mode == "single" or len(successful) == 1:
+            answer = successful[0] if successful else candidates[0]
+            report.decision_skipped = True
+        elif strategy.agreement_threshold is not None and successful:
+            report.agreement = self.agreement(successful)
+            report.decision_skipped = report.agreement >= strategy.agreement_threshold
+            answer = max(successful, key=len) if report.decision_skipped else None
+        else:
+            answer = None
+
+        if report.decision_skipped:
+            decision_input = estimate_text_tokens(decision_prompt + full_query + "\n\n".join(candidates))
+            report.saved_tokens += decision_input + estimate_text_tokens(answer)
+            report.saved_latency += self._avg_latency.get("decision", 0.0)
+            if on_token is not None:
+                on_token(answer, "decision")
+        else:
+            started = time.perf_counter()
+            answer = await self.agent.decide_best_response(full_query, candidates, on_token=on_token)
+            report.decision_latency = time.perf_counter() - started
+            self._observe("decision", report.decision_latency)
+
+        report.print_summary()
+        return answer, candidates, report
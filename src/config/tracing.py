@@ -0,0 +1,271 @@
+import asyncio
+import itertools
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_ids = itertools.count(1)
+
+
+class Span:
+    """One timed operation, with attributes and token/retry counts that roll up to its ancestors."""
+
+    def __init__(self, name: str, parent: Optional["Span"] = None, **attributes):
+        self.name = name
+        self.parent = parent
+        self.span_id = next(_ids)
+        self.trace_id = parent.trace_id if parent is not None else self.span_id
+        self.attributes: Dict[str, Any] = {k: v for k, v in attributes.items() if v is not None}
+        self.children: List["Span"] = []
+        self.start = time.time()
+        self._started = time.perf_counter()
+        self.duration: Optional[float] = None
+        self.status = "running"
+        self.error: Optional[str] = None
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.completion_tokens = 0
+        self.retries = 0
+        if parent is not None:
+            parent.children.append(self)
+
+    def finish(self, status: str = "ok", error: Optional[str] = None):
+        self.duration = time.perf_counter() - self._started
+        self.status = status
+        self.error = error
+
+    def lineage(self) -> Iterator["Span"]:
+        span: Optional[Span] = self
+        while span is not None:
+            yield span
+            span = span.parent
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "span_id": self.span_id,
+            "trace_id": self.trace_id,
+            "start": self.start,
+            "duration": self.duration,
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes,
+            "prompt_tokens": self.prompt_tokens,
+            "cached_tokens": self.cached_tokens,
+            "completion_tokens": self.completion_tokens,
+            "retries": self.retries,
+            "children": [child.to_dict() for child in self.children],
+        }
+
+
+def _labels(**labels) -> Tuple[Tuple[str, str], ...]:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...], extra: str = "") -> str:
+    parts = [f'{k}="{v}"' for k, v in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    # Exact integers for token/request counts; `:g` would round them to 6 significant digits
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Metrics:
+    """Aggregate counters and latency histograms, rendered in the Prometheus text format."""
+
+    def __init__(self, prefix: str = "query_pipeline", buckets=LATENCY_BUCKETS):
+        self.prefix = prefix
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[tuple, float]] = defaultdict(lambda: defaultdict(float))
+        self._histograms: Dict[tuple, List[float]] = {}
+
+    def inc(self, name: str, value: float = 1, **labels):
+        with self._lock:
+            self._counters[name][_labels(**labels)] += value
+
+    def totals(self, name: str, by: str) -> Dict[str, float]:
+        """Counter `name` summed over every label except `by`."""
+        result: Dict[str, float] = defaultdict(float)
+        with self._lock:
+            for labels, value in self._counters.get(name, {}).items():
+                result[dict(labels).get(by, "")] += value
+        return dict(result)
+
+    def observe(self, seconds: float, **labels):
+        key = _labels(**labels)
+        with self._lock:
+            # bucket counts, then sum and count
+            histogram = self._histograms.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    histogram[i] += 1
+            histogram[-2] += seconds
+            histogram[-1] += 1
+
+    def prometheus_text(self) -> str:
+        lines: List[str] = []
+        with self._lock:
+            name = f"{self.prefix}_span_duration_seconds"
+            lines.append(f"# TYPE {name} histogram")
+            for labels, histogram in sorted(self._histograms.items()):
+                for bound, count in zip(self.buckets, histogram):
+                    le = f'le="{bound}"'
+                    lines.append(f"{name}_bucket{_format_labels(labels, le)} {count}")
+                le = 'le="+Inf"'
+                lines.append(f"{name}_bucket{_format_labels(labels, le)} {histogram[-1]}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {histogram[-2]:.6f}")
+                lines.append(f"{name}_count{_format_labels(labels)} {histogram[-1]}")
+            for counter, values in sorted(self._counters.items()):
+                name = f"{self.prefix}_{counter}"
+                lines.append(f"# TYPE {name} counter")
+                for labels, value in sorted(values.items()):
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+class Tracer:
+    """Records spans through a context variable, so nested awaits (and tasks they start) nest their spans.
+
+    Finished root spans are kept in memory (the most recent `max_traces`) and,
+    if `export_path` is set, appended to it as JSON lines.
+    """
+
+    def __init__(self, max_traces: int = 100, export_path: Optional[str] = None):
+        self.metrics = Metrics()
+        self.export_path = export_path
+        self._current: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+        self._traces: Deque[Span] = deque(maxlen=max_traces)
+        self._export_lock = threading.Lock()
+
+    def current(self) -> Optional[Span]:
+        return self._current.get()
+
+    @contextmanager
+    def span(self, name: str, activate: bool = True, **attributes) -> Iterator[Span]:
+        """Time a block as a child of the current span.
+
+        With `activate=False` the span is recorded but does not become the
+        parent of spans (or tasks) started inside the block.
+        """
+        span = Span(name, self._current.get(), **attributes)
+        token = self._current.set(span) if activate else None
+        try:
+            yield span
+        except BaseException as e:
+            status = "cancelled" if isinstance(e, asyncio.CancelledError) else "error"
+            span.finish(status, None if status == "cancelled" else f"{type(e).__name__}: {e}")
+            raise
+        else:
+            # Code that handles its own errors can still mark the span failed via `fail`
+            span.finish("error" if span.error else "ok", span.error)
+        finally:
+            if token is not None:
+                self._current.reset(token)
+            self._record(span)
+
+    def _record(self, span: Span):
+        attributes = span.attributes
+        self.metrics.observe(span.duration, span=span.name, status=span.status)
+        self.metrics.inc("spans_total", span=span.name, status=span.status,
+                         provider=attributes.get("provider", ""), model=attributes.get("model", ""))
+        if span.parent is None:
+            self._traces.append(span)
+            if self.export_path:
+                with self._export_lock, open(self.export_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(span.to_dict(), default=str) + "\n")
+
+    def annotate(self, **attributes):
+        span = self._current.get()
+        if span is not None:
+            span.attributes.update({k: v for k, v in attributes.items() if v is not None})
+
+    def fail(self, error: str):
+        """Mark the current span failed without raising (for callers that turn errors into return values)."""
+        span = self._current.get()
+        if span is not None:
+            span.error = error
+
+    def record_usage(self, provider: str, model: str, usage: Optional[Dict[str, Any]]):
+        """Add provider-reported token usage (OpenAI or Anthropic field names) to the current span and its ancestors.
+
+        `prompt` counts all input tokens; `cached_prompt` the part read from the
+        provider's prompt cache and `cache_write` the part written to it.
+        """
+        if not usage:
+            return
+        cached = usage.get("cache_read_input_tokens") or (usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0
+        written = usage.get("cache_creation_input_tokens") or 0
+        if "prompt_tokens" in usage:
+            prompt = usage["prompt_tokens"] or 0
+        else:
+            # Anthropic's input_tokens leaves out what was read from or written to the cache
+            prompt = (usage.get("input_tokens") or 0) + cached + written
+        completion = usage.get("completion_tokens", usage.get("output_tokens", 0)) or 0
+        self.metrics.inc("tokens_total", prompt, provider=provider, model=model, kind="prompt")
+        self.metrics.inc("tokens_total", completion, provider=provider, model=model, kind="completion")
+        if cached:
+            self.metrics.inc("tokens_total", cached, provider=provider, model=model, kind="cached_prompt")
+        if written:
+            self.metrics.inc("tokens_total", written, provider=provider, model=model, kind="cache_write")
+        span = self._current.get()
+        if span is not None:
+            for ancestor in span.lineage():
+                ancestor.prompt_tokens += prompt
+                ancestor.cached_tokens += cached
+                ancestor.completion_tokens += completion
+
+    def token_stats(self) -> Dict[str, Any]:
+        """Provider-reported tokens by kind since startup, with the share of prompt tokens served from cache."""
+        totals = self.metrics.totals("tokens_total", by="kind")
+        stats = {kind: int(totals.get(kind, 0)) for kind in ("prompt", "cached_prompt", "cache_write", "completion")}
+        stats["cached_ratio"] = stats["cached_prompt"] / stats["prompt"] if stats["prompt"] else 0.0
+        return stats
+
+    def record_retry(self, provider: str, model: Optional[str], status: Optional[int] = None):
+        self.metrics.inc("retries_total", provider=provider, model=model or "", status=status or "")
+        span = self._current.get()
+        if span is not None:
+            for ancestor in span.lineage():
+                ancestor.retries += 1
+
+    def record_cache(self, layer: str, hit: bool):
+        self.metrics.inc("cache_lookups_total", layer=layer, result="hit" if hit else "miss")
+        span = self._current.get()
+        if span is not None:
+            span.attributes.setdefault("cache", {})[layer] = "hit" if hit else "miss"
+
+    def traced(self, name: str, **attributes) -> Callable:
+        """Decorator form of `span` for coroutine functions."""
+        def decorator(func):
+            @wraps(func)
+            async def wrapper(*args, **kwargs):
+                with self.span(name, **attributes):
+                    return await func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def traces(self) -> List[Dict[str, Any]]:
+        return [span.to_dict() for span in self._traces]
+
+    def export_json(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.traces(), f, indent=2, default=str)
+
+    def prometheus_text(self) -> str:
+        return self.metrics.prometheus_text()
+
+
+tracer = Tracer(export_path=os.getenv('TRACE_FILE'))
@@ -0,0 +1,135 @@
+"""Complexity gate in front of the full pipeline.
+
+Decomposition, analysis, answering, three final checks and the decision call
+are at least 7 LLM round trips. A short, single-part factual question such as
+"What is the capital of France?" would decompose into one easy sub-question,
+so it is answered with one `Agent.select_model`-routed call instead.
+
+The gate is local (regexes and `classify_question`, no LLM call) and
+conservative: anything with several parts, a request for explanation or
+comparison, code, or an uncertain classification takes the full pipeline.
+Questions about current events or live values ("current CEO", "today's
+weather", "last night's game") still take the fast path, but with a web search,
+since the model's own knowledge is out of date for them.
+
+Configuration (environment variables):
+    TRIAGE                 0 sends every query through the full pipeline
+    TRIAGE_MAX_WORDS       longest query considered for the fast path (default 12)
+    TRIAGE_MAX_DIFFICULTY  highest estimated difficulty for the fast path (default 30)
+    TRIAGE_MIN_CONFIDENCE  classifier confidence required (default 0.8)
+"""
+import os
+import re
+from typing import Any, Dict, NamedTuple, Optional
+from .Analyzer import Expertise, QuestionType
+from .fast_classifier import LocalAnalysis, classify_question, jargon_count
+
+TRIAGE_ENABLED = os.getenv('TRIAGE', '1') != '0'
+TRIAGE_MAX_WORDS = int(os.getenv('TRIAGE_MAX_WORDS', '12'))
+TRIAGE_MAX_DIFFICULTY = int(os.getenv('TRIAGE_MAX_DIFFICULTY', '30'))
+TRIAGE_MIN_CONFIDENCE = float(os.getenv('TRIAGE_MIN_CONFIDENCE', '0.8'))
+
+# (pattern, reason) signs that a query has several parts or asks for depth; matched against the lower-cased query
+_COMPLEX_FEATURES = [
+    (r"\?.*\S.*\?", "several questions"),
+    (r";|\n", "several clauses"),
+    (r"\b(and|or|also|then) (why|how|what|which|when|where|who)\b", "several questions"),
+    (r"\b(compare|comparison|contrast|versus|vs\.?|differences?|trade-?offs?|pros and cons|alternatives)\b", "comparison"),
+    (r"\b(explain|describe|discuss|analy[sz]e|evaluate|elaborate|in detail|step[- ]by[- ]step|walk me through)\b", "asks for depth"),
+    (r"^why\b|\bhow (does|do|did|would|should|can|could|to)\b", "asks how or why"),
+    (r"\b(implement|design|build|write|create|plan)\b", "asks for a work product"),
+]
+
+# Signs the answer depends on recent events or live data; such queries are answered with a web search
+_RECENCY = re.compile(
+    r"\b(current(ly)?|latest|recent(ly)?|now|today|today's|tonight|yesterday|tomorrow|this (week|month|year|season)|"
+    r"last (night|week|month|year|season)|last night's|right now|live|breaking|news|weather|forecast|price|stock|"
+    r"score|standings|exchange rate|election|20[2-9]\d)\b")
+
+_WORD = re.compile(r"\w+")
+_JARGON_WEIGHT = 15
+
+
+class TriageDecision(NamedTuple):
+    fast_path: bool
+    reason: str
+    difficulty: int
+    analysis: LocalAnalysis
+    needs_web_search: bool = False
+
+
+def needs_recent_information(query: str) -> bool:
+    return _RECENCY.search(query.lower()) is not None
+
+
+def estimate_difficulty(query: str) -> int:
+    """Rough 1-100 difficulty on the decomposition model's scale: longer and more specialized is harder."""
+    text = query.lower()
+    return max(1, min(100, 2 * len(_WORD.findall(text)) + _JARGON_WEIGHT * jargon_count(text)))
+
+
+def triage_query(query: str, max_words: int = TRIAGE_MAX_WORDS, max_difficulty: int = TRIAGE_MAX_DIFFICULTY,
+                 min_confidence: float = TRIAGE_MIN_CONFIDENCE) -> TriageDecision:
+    """Decide whether `query` can skip decomposition and synthesis."""
+    text = query.lower().strip()
+    difficulty = estimate_difficulty(text)
+    analysis = classify_question(text, difficulty)
+
+    def full(reason: str) -> TriageDecision:
+        return TriageDecision(False, reason, difficulty, analysis)
+
+    words = len(_WORD.findall(text))
+    if words > max_words:
+        return full(f"{words} words")
+    for pattern, reason in _COMPLEX_FEATURES:
+        if re.search(pattern, text):
+            return full(reason)
+    if analysis.is_coding_related:
+        return full("coding")
+    if analysis.question_type != QuestionType.FACTUAL or analysis.expertise != Expertise.GENERAL:
+        return full(f"{analysis.question_type.name.lower()}, {analysis.expertise.name.lower()} expertise")
+    if analysis.confidence < min_confidence:
+        return full(f"classifier confidence {analysis.confidence:.2f}")
+    if difficulty > max_difficulty:
+        return full(f"difficulty {difficulty}")
+    if needs_recent_information(text):
+        return TriageDecision(True, "single simple factual question about recent events", difficulty, analysis, True)
+    return TriageDecision(True, "single simple factual question", difficulty, analysis)
+
+
+class Triage:
+    """Routes queries and estimates the latency the fast path saves.
+
+    Savings are measured against a running average of full-pipeline query
+    latency, so they are only reported once a full query has run.
+    """
+
+    def __init__(self, enabled: bool = TRIAGE_ENABLED):
+        self.enabled = enabled
+        self.counts = {"fast": 0, "full": 0, "fallback": 0}
+        self.saved_latency = 0.0
+        self._avg_latency: Dict[str, float] = {}
+
+    def assess(self, query: str) -> TriageDecision:
+        if not self.enabled:
+            return TriageDecision(False, "triage disabled", 0, classify_question(query, 0))
+        return triage_query(query)
+
+    def observe(self, route: str, seconds: float) -> Optional[float]:
+        """Record a finished query on `route` ("fast" or "full"); for the fast path, returns the estimated seconds saved."""
+        self.counts[route] += 1
+        previous = self._avg_latency.get(route)
+        self._avg_latency[route] = seconds if previous is None else 0.8 * previous + 0.2 * seconds
+        if route != "fast" or "full" not in self._avg_latency:
+            return None
+        saved = self._avg_latency["full"] - seconds
+        self.saved_latency += saved
+        return saved
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            **self.counts,
+            "avg_latency": {route: round(seconds, 3) for route, seconds in self._avg_latency.items()},
+            "estimated_saved_latency": round(self.saved_latency, 3),
+        }
@@ -0,0 +1,84 @@
+"""Compare the local fast-path classifier with recorded LLM analyzer labels.
+
+Record labels by running the pipeline with ANALYSIS_LABEL_LOG=labels.jsonl, then:
+
+    python ./src/eval_fast_classifier.py labels.jsonl --threshold 0.8
+
+The LLM only labels the questions the local classifier declines ("path":
+"llm"), which are not the ones whose accuracy matters. While recording, a
+sample of the questions the fast path did answer is also labeled in the
+background ("path": "fast", ANALYSIS_SHADOW_RATE, default 0.1); agreement on
+that sample is what shows whether the running threshold is safe. To label
+every question instead, record with FAST_CLASSIFIER_THRESHOLD=1.1 (fast path
+off).
+"""
+import argparse
+import json
+from collections import Counter
+from config.fast_classifier import classify_question
+
+
+def load_labels(path: str):
+    with open(path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def evaluate(records, threshold: float):
+    totals = Counter()
+    confident = Counter()
+    shadow = Counter()
+    confusion = Counter()
+    for record in records:
+        local = classify_question(record["question"], int(record["difficulty"]))
+        matches = {
+            "question_type": local.question_type.name == record["question_type"],
+            "expertise": local.expertise.name == record["expertise"],
+            "coding": local.is_coding_related == bool(record["coding"]),
+        }
+        matches["all"] = all(matches.values())
+        confusion[(record["question_type"], local.question_type.name)] += 1
+        totals["n"] += 1
+        totals.update(label for label, ok in matches.items() if ok)
+        if local.confidence >= threshold:
+            confident["n"] += 1
+            confident.update(label for label, ok in matches.items() if ok)
+        if record.get("path") == "fast":
+            shadow["n"] += 1
+            shadow.update(label for label, ok in matches.items() if ok)
+    return totals, confident, shadow, confusion
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("labels", help="JSONL file of recorded LLM analyzer labels")
+    parser.add_argument("--threshold", type=float, default=0.8, help="fast-path confidence threshold")
+    args = parser.parse_args()
+
+    totals, confident, shadow, confusion = evaluate(load_labels(args.labels), args.threshold)
+    if not totals["n"]:
+        print("No labels found.")
+        return
+
+    def pct(part, whole):
+        return f"{100 * part / whole:.1f}%" if whole else "n/a"
+
+    print(f"Records: {totals['n']} ({shadow['n']} shadow-labeled fast-path questions)")
+    print(f"Fast-path coverage at threshold {args.threshold}: {confident['n']} ({pct(confident['n'], totals['n'])})")
+    print(f"{'label':<15}{'agreement (all)':>18}{'(>= threshold)':>18}{'(fast-path sample)':>21}")
+    for label in ("question_type", "expertise", "coding", "all"):
+        print(f"{label:<15}{pct(totals[label], totals['n']):>18}{pct(confident[label], confident['n']):>18}"
+              f"{pct(shadow[label], shadow['n']):>21}")
+    if not shadow["n"]:
+        print("\nNo fast-path samples: records cover only questions the fast path declined, so the threshold columns "
+              "are biased.\nRecord with ANALYSIS_SHADOW_RATE > 0, or with FAST_CLASSIFIER_THRESHOLD=1.1 to label every question.")
+
+    print("\nQuestion type confusion (LLM label -> local label):")
+    for (llm_label, local_label), count in sorted(confusion.items(), key=lambda item: -item[1]):
+        print(f"  {llm_label:<11} -> {local_label:<11} {count}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,18 @@
 import os
+import sys
+import time
 from typing import List, Tuple
-from config.question_decomp import decompose_question
-from tools.web_search import web_search_tool
+from config.question_decomp import OPENAI_CHAT_ENDPOINT, decompose_question_stream
 from config.agent import Agent
+from config.http_client import HttpClient, host_key
+from config.pipeline import PipelineExecutor, QueryTimeline, DEFAULT_STAGE_LIMITS
+from config.synthesis import SynthesisReport, SynthesisStrategy
+from config.logs import configure_logging, fields, flush_logging, get_logger
+from config.tracing import tracer
+from tools.web_search import SEARCH_URL
 from config.caching.caching import clear_persistent_cache, clear_memory_cache
 from colorama import init, Fore, Style
 import asyncio
-from config.agent import Agent
 
 
 from dotenv import load_dotenv
@@ -20,94 +26,221 @@ claude_key = os.getenv('ANTHROPIC_API_KEY')
 os.environ['ANTHROPIC_API_KEY'] = claude_key
 os.environ['OPENAI_API_KEY'] = api_key
 
+log = get_logger(__name__)
+
 def print_colored(message, color=Fore.WHITE, style=Style.NORMAL):
+    """Console output for interactive use (the answer itself); everything else goes through `log`."""
     print(f"{style}{color}{message}{Style.RESET_ALL}")
 
 
-async def process_sub_question(agent: Agent, full_query: str, sub_question: Tuple[str, int, bool], analyzed_question: Tuple):
-    sub_q, difficulty, needs_web_search = sub_question
-    question_type, expertise, is_coding_related = analyzed_question[2:]
-    
-    context = f"Full Query Context: {full_query}\n\nSpecific Question to Answer: {sub_q}"
-    
-    if needs_web_search:
-        print_colored(f"Performing web search for: {sub_q}", Fore.CYAN)
-        try:
-            search_results = await web_search_tool(sub_q)
-            context += f"\n\nWeb Search Results:\n{search_results}"
-        except Exception as e:
-            print_colored(f"Web search failed: {str(e)}", Fore.RED)
-            context += "\n\nWeb Search Results: Unable to perform web search due to an error."
-    
-    response, model_used = await agent.query_model_with_context(full_query, sub_q, difficulty, question_type, expertise, is_coding_related, needs_web_search)
-    
-    return (sub_q, difficulty, question_type, expertise, is_coding_related, model_used, response)
+# Per-stage and per-provider (host) concurrency limits for the dataflow executor, overridable with
+# STAGE_LIMIT_<STAGE> (e.g. STAGE_LIMIT_SEARCH=8) and <PROVIDER>_CONCURRENCY (e.g. ANTHROPIC_CONCURRENCY=4)
+STAGE_LIMITS = {stage: int(os.getenv(f'STAGE_LIMIT_{stage.upper()}', limit)) for stage, limit in DEFAULT_STAGE_LIMITS.items()}
+# Endpoints can be pointed elsewhere (e.g. at the benchmark's mock providers) with OPENAI_API_URL,
+# ANTHROPIC_API_URL and SEARCH_URL
+OPENAI_ENDPOINT = OPENAI_CHAT_ENDPOINT
+ANTHROPIC_ENDPOINT = os.getenv('ANTHROPIC_API_URL', "https://api.anthropic.com")
+PROVIDER_HOSTS = {"openai": host_key(OPENAI_ENDPOINT), "anthropic": host_key(ANTHROPIC_ENDPOINT), "search": host_key(SEARCH_URL)}
+PROVIDER_LIMITS = {PROVIDER_HOSTS[provider]: int(os.getenv(f'{provider.upper()}_CONCURRENCY', limit))
+                   for provider, limit in {"openai": 16, "anthropic": 8, "search": 4}.items()}
+DECOMP_MODEL = 'gpt-4o'
 
-async def main(full_query):
-    openai_endpoint = "https://api.openai.com/v1/chat/completions"
-    anthropic_endpoint = "https://api.anthropic.com"
-    decomp_model = 'gpt-4o' 
-    
-    print_colored("Starting question decomposition process...", Fore.CYAN, Style.BRIGHT)
-    print_colored(f"Using model: {decomp_model}", Fore.YELLOW)
-    
-    # Step 1: Decompose the question with difficulty scores and web search decision (synchronous)
-    sub_questions_with_info = decompose_question(api_key, decomp_model, full_query)
-    
-    print_colored("\nDecomposed sub-questions with difficulty and web search decision:", Fore.GREEN, Style.BRIGHT)
-    for i, (sub_question, difficulty, needs_web_search) in enumerate(sub_questions_with_info, 1):
-        print_colored(f"{i}. {sub_question} (Difficulty: {difficulty}, Needs Web Search: {needs_web_search})", Fore.GREEN)
-    
-    # Step 2: Create an agent and analyze each sub-question
-    print_colored("\nCreating Agent...", Fore.CYAN, Style.BRIGHT)
-    agent = Agent(openai_endpoint=openai_endpoint, anthropic_endpoint=anthropic_endpoint, 
-                  openai_api_key=api_key, anthropic_api_key=claude_key)
-    print_colored("Agent created successfully!", Fore.CYAN)
-    analyzed_questions = await agent.analyze_and_select_model(sub_questions_with_info)
-    
-    # Step 3: Query models for sub-questions (asynchronous)
-    print_colored("\nQuerying models for sub-questions...", Fore.MAGENTA, Style.BRIGHT)
-    query_tasks = [
-        process_sub_question(agent, full_query, sub_q_info, analyzed_q)
-        for sub_q_info, analyzed_q in zip(sub_questions_with_info, analyzed_questions)
-    ]
-    responses = await asyncio.gather(*query_tasks)
+def add_limit_arguments(parser):
+    """`--<provider>-concurrency` and `--<stage>-limit` flags, defaulting to PROVIDER_LIMITS and STAGE_LIMITS."""
+    for provider, host in PROVIDER_HOSTS.items():
+        parser.add_argument(f"--{provider}-concurrency", type=int, default=PROVIDER_LIMITS[host],
+                            help=f"concurrent requests to {host}")
+    for stage, limit in STAGE_LIMITS.items():
+        parser.add_argument(f"--{stage}-limit", type=int, default=limit, help=f"sub-questions in the {stage} stage at once")
+
+def limits_from_args(args) -> Tuple[dict, dict]:
+    """`(stage_limits, host_limits)` from flags added by `add_limit_arguments`."""
+    stage_limits = {stage: getattr(args, f"{stage}_limit") for stage in STAGE_LIMITS}
+    host_limits = {host: getattr(args, f"{provider}_concurrency") for provider, host in PROVIDER_HOSTS.items()}
+    return stage_limits, host_limits
+
+def create_agent(host_limits=None, rate_limiter=None) -> Agent:
+    log.debug("Creating Agent")
+    agent = Agent(openai_endpoint=OPENAI_ENDPOINT, anthropic_endpoint=ANTHROPIC_ENDPOINT,
+                  openai_api_key=api_key, anthropic_api_key=claude_key,
+                  http_client=HttpClient(host_limits=host_limits or PROVIDER_LIMITS),
+                  rate_limiter=rate_limiter)
+    return agent
+
+async def run_query(agent, executor, full_query, on_token=None, synthesis_strategy=None, timeline=None):
+    """Answer one query with an existing (warm) agent and executor; the agent is left open.
+
+    Returns `(final_answer, responses, synthesis_report)`, where `responses` holds
+    one `(sub_q, difficulty, question_type, expertise, is_coding, model, answer)`
+    tuple per sub-question.
+    """
+    synthesis_strategy = synthesis_strategy or SynthesisStrategy.from_env()
+    timeline = timeline or QueryTimeline(full_query)
+    with tracer.span("query", query=full_query, synthesis=synthesis_strategy.describe()) as span:
+        result = await _run_query(agent, executor, full_query, on_token, synthesis_strategy, timeline)
+    log.info(f"Used {span.prompt_tokens} prompt tokens ({span.cached_tokens} from provider prompt caches), "
+             f"{span.completion_tokens} completion tokens", extra=fields(query=full_query))
+    return result
+
+async def _run_query(agent, executor, full_query, on_token, synthesis_strategy, timeline):
+    started = time.perf_counter()
+    decision = agent.triage.assess(full_query)
+    tracer.annotate(route="fast" if decision.fast_path else "full", triage=decision.reason)
+    if decision.fast_path:
+        final_answer, responses, synthesis_report = await _answer_directly(
+            agent, executor, full_query, decision, on_token, synthesis_strategy, timeline)
+        if not final_answer.startswith("Error:"):
+            elapsed = time.perf_counter() - started
+            saved = agent.triage.observe("fast", elapsed)
+            log.info(f"Fast path answered in {elapsed:.2f}s"
+                     + (f", ~{saved:.2f}s faster than the full pipeline's average" if saved is not None else ""),
+                     extra=fields(route="fast", model=responses[0][5], saved_latency=saved and round(saved, 3)))
+            return final_answer, responses, synthesis_report
+        agent.triage.counts["fallback"] += 1
+        log.warning("Fast path failed; falling back to the full pipeline", extra=fields(query=full_query))
+        started = time.perf_counter()
+    else:
+        log.info(f"Triage: full pipeline ({decision.reason})", extra=fields(route="full", query=full_query))
+    result = await _run_full_pipeline(agent, executor, full_query, on_token, synthesis_strategy, timeline)
+    agent.triage.observe("full", time.perf_counter() - started)
+    return result
+
+async def _answer_directly(agent, executor, full_query, decision, on_token, synthesis_strategy, timeline):
+    """One `select_model`-routed call for a query triage judged simple; same return shape as the full pipeline."""
+    question_type, expertise, is_coding, _ = decision.analysis
+    model = agent.select_model(decision.difficulty, question_type, expertise, is_coding)
+    log.info(f"Triage: fast path with {model} ({decision.reason})",
+             extra=fields(route="fast", web_search=decision.needs_web_search, query=full_query))
+    try:
+        response, model_used = await executor.run_stage(
+            timeline, "answer", "q1",
+            agent.query_model_with_context(full_query, full_query, decision.difficulty, question_type, expertise, is_coding,
+                                           decision.needs_web_search))
+    finally:
+        timeline.print_summary()
+    if on_token is not None and not response.startswith("Error:"):
+        on_token(response, "answer")
+    responses = [(full_query, decision.difficulty, question_type, expertise, is_coding, model_used, response)]
+    return response, responses, SynthesisReport(synthesis_strategy)
+
+async def _run_full_pipeline(agent, executor, full_query, on_token, synthesis_strategy, timeline):
+    try:
+        log.info(f"Decomposing query with {DECOMP_MODEL}", extra=fields(query=full_query))
+        
+        # Steps 1-3: Stream the decomposition; each sub-question flows through
+        # analyze -> search -> answer on its own as soon as its line arrives.
+        query_tasks = []
+        decomp_started = time.perf_counter()
+        try:
+            # Not activated: the sub-question tasks started inside belong to the query span, not to decomposition
+            with tracer.span("decompose", activate=False, model=DECOMP_MODEL, provider="openai"):
+                async for sub_question, difficulty, needs_web_search in decompose_question_stream(agent.http, api_key, DECOMP_MODEL, full_query, OPENAI_ENDPOINT, agent.rate_limiter):
+                    log.info(f"{len(query_tasks) + 1}. {sub_question}", extra=fields(difficulty=difficulty, web_search=needs_web_search))
+                    query_tasks.append(asyncio.create_task(
+                        executor.run_sub_question(timeline, len(query_tasks) + 1, full_query, (sub_question, difficulty, needs_web_search))
+                    ))
+        except BaseException:
+            for task in query_tasks:
+                task.cancel()
+            raise
+        finally:
+            timeline.record("query", "decompose", decomp_started, time.perf_counter())
+            agent.question_analyzer.decomposition_finished()
+        
+        log.debug("Waiting for sub-question answers")
+        responses = await asyncio.gather(*query_tasks)
     
-    formatted_responses = []
-    for i, (sub_q, difficulty, q_type, expertise, is_coding, model, response) in enumerate(responses, 1):
-        formatted_responses.append(
-            f"Sub-question {i}: {sub_q}\n"
-            f"Difficulty: {difficulty}\n"
-            f"Question Type: {q_type}\n"
-            f"Expertise: {expertise}\n"
-            f"Coding-related: {is_coding}\n"
-            f"Model used: {model}\n"
-            f"Answer: {response}\n"
-        )
+        formatted_responses = []
+        for i, (sub_q, difficulty, q_type, expertise, is_coding, model, response) in enumerate(responses, 1):
+            formatted_responses.append(
+                f"Sub-question {i}: {sub_q}\n"
+                f"Difficulty: {difficulty}\n"
+                f"Question Type: {q_type}\n"
+                f"Expertise: {expertise}\n"
+                f"Coding-related: {is_coding}\n"
+                f"Model used: {model}\n"
+                f"Answer: {response}\n"
+            )
         
-    # Step 4: Combine the responses
-    print_colored("\nPerforming multiple final checks...", Fore.BLUE, Style.BRIGHT)
-    final_responses = await agent.multiple_final_checks(full_query, formatted_responses)
+        # Steps 4-5: Final checks and best-response selection under the configured synthesis strategy
+        log.info(f"Synthesizing final answer ({synthesis_strategy.describe()})")
+        final_answer, final_responses, synthesis_report = await executor.run_stage(
+            timeline, "synthesis", "query", agent.synthesize(full_query, formatted_responses, synthesis_strategy, on_token=on_token))
     
-    print_colored("\nFinal Responses from Different Models:", Fore.BLUE, Style.BRIGHT)
-    for i, response in enumerate(final_responses, 1):
-        print_colored(f"\nResponse {i}:", Fore.YELLOW)
-        print(response)
-
-    # Step 5: Decide on the best response
-    print_colored("\nMaking final decision on the best response...", Fore.CYAN, Style.BRIGHT)
-    final_answer = await agent.decide_best_response(full_query, final_responses)
+        # CACHE CLEARING ------------
+        # clear_memory_cache()
+        # clear_persistent_cache()
     
-    # CACHE CLEARING ------------
-    # clear_memory_cache()
-    # clear_persistent_cache()
+    finally:
+        timeline.print_summary()
     
-    print_colored("\nFinal Consolidated Answer:", Fore.GREEN, Style.BRIGHT)
+    return final_answer, responses, synthesis_report
+
+async def main(full_query, on_token=None, synthesis_strategy=None):
+    agent = create_agent()
+    executor = PipelineExecutor(agent, STAGE_LIMITS)
+    try:
+        final_answer, _, _ = await run_query(agent, executor, full_query, on_token, synthesis_strategy)
+    finally:
+        await agent.close()
+    
+    if on_token is None:
+        flush_logging()
+        print_colored("\nFinal Consolidated Answer:", Fore.GREEN, Style.BRIGHT)
     return final_answer
 
+def _label(value):
+    return getattr(value, "name", value)
+
+def query_result(query, final_answer, responses, synthesis_report, timeline):
+    """JSON-serializable record of one answered query (used by the server and batch modes)."""
+    return {
+        "query": query,
+        "answer": final_answer,
+        "sub_questions": [
+            {
+                "question": sub_q,
+                "difficulty": difficulty,
+                "question_type": _label(question_type),
+                "expertise": _label(expertise),
+                "coding_related": is_coding,
+                "model": model,
+                "answer": response,
+            }
+            for sub_q, difficulty, question_type, expertise, is_coding, model, response in responses
+        ],
+        "synthesis": synthesis_report.to_dict(),
+        "timeline": timeline.to_dict(),
+    }
+
+def console_token_printer():
+    current_phase = [None]
+
+    def on_token(chunk: str, phase: str):
+        if current_phase[0] is None:
+            current_phase[0] = phase
+            # Queued log lines first, so they do not land in the middle of the answer
+            flush_logging()
+            print_colored("\nFinal Consolidated Answer:", Fore.GREEN, Style.BRIGHT)
+        elif phase != current_phase[0]:
+            current_phase[0] = phase
+            print_colored("\n\n--- Verified answer ---", Fore.YELLOW, Style.BRIGHT)
+        print(chunk, end="", flush=True)
+
+    return on_token
+
 if __name__ == "__main__":
+    if "--profile-startup" in sys.argv[1:]:
+        from tools.startup_profile import print_startup_profile, profile_startup
+        print_startup_profile(profile_startup())
+        sys.exit(0)
+
+    configure_logging()
     print('\n\n\n\n\n')
     full_query = input(">>>>>>>>> QUERY: ")
     
-    result = asyncio.run(main(full_query))
-    print(result)
+    # Stream the final answer to the console as it is generated
+    result = asyncio.run(main(full_query, on_token=console_token_printer()))
+    print()
+    if result.startswith("Error:"):
+        print(result)
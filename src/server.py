@@ -0,0 +1,302 @@
+"""HTTP service mode: one warm Agent answering concurrent queries.
+
+    python server.py --port 8080
+
+    POST /query   {"query": "...", "stream": false, "synthesis": "first_k:2"}
+                  JSON answer, or server-sent events ("token" events, then one
+                  "result" event) when "stream" is true or the client accepts
+                  text/event-stream.
+    GET  /health  admission state
+    GET  /stats   admission, HTTP pool, rate-limit, hedging, routing, triage, token and cache stats
+    GET  /metrics span latency histograms and token/retry/cache counters (Prometheus text)
+    GET  /traces  the most recent query traces as JSON
+
+At most --max-in-flight queries run at once and at most --max-queue wait for a
+slot; anything beyond that gets a 503 with Retry-After. On SIGINT/SIGTERM the
+server stops accepting queries, lets in-flight ones finish (up to
+--drain-timeout) and then closes the agent, flushing the caches to disk.
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Optional
+from aiohttp import web
+from config.caching.caching import memory_cache_stats
+from config.logs import configure_logging, fields, get_logger
+from config.pipeline import PipelineExecutor, QueryTimeline
+from config.synthesis import SynthesisStrategy
+from config.tracing import tracer
+from main import STAGE_LIMITS, add_limit_arguments, create_agent, limits_from_args, query_result, run_query
+
+log = get_logger(__name__)
+
+
+class Overloaded(Exception):
+    pass
+
+
+class AdmissionController:
+    """Bounds in-flight queries and the queue of queries waiting for a slot."""
+
+    def __init__(self, max_in_flight: int = 8, max_queue: int = 32, queue_timeout: Optional[float] = 30.0):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self.draining = False
+        self.in_flight = 0
+        self.queued = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.completed = 0
+        self.failed = 0
+
+    @asynccontextmanager
+    async def admit(self):
+        if self.draining:
+            self.rejected += 1
+            raise Overloaded("server is shutting down")
+        # Own counters rather than the semaphore's state: `queued` already includes waiters not yet scheduled
+        if self.in_flight + self.queued >= self.max_in_flight + self.max_queue:
+            self.rejected += 1
+            raise Overloaded(f"at capacity ({self.in_flight} running, {self.queued} waiting)")
+
+        self.queued += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise Overloaded(f"no slot freed up within {self.queue_timeout}s")
+        finally:
+            self.queued -= 1
+
+        self.in_flight += 1
+        self.admitted += 1
+        self._idle.clear()
+        try:
+            yield
+            self.completed += 1
+        except BaseException:
+            self.failed += 1
+            raise
+        finally:
+            self.in_flight -= 1
+            self._slots.release()
+            if self.in_flight == 0:
+                self._idle.set()
+
+    async def drain(self, timeout: float) -> bool:
+        """Stop admitting queries and wait for in-flight ones; returns False on timeout."""
+        self.draining = True
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_in_flight": self.max_in_flight,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "completed": self.completed,
+            "failed": self.failed,
+            "draining": self.draining,
+        }
+
+
+def _overloaded(error: Overloaded) -> web.Response:
+    return web.json_response({"error": str(error)}, status=503, headers={"Retry-After": "5"})
+
+
+def _sse(event: str, data: Any) -> bytes:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n".encode("utf-8")
+
+
+async def handle_query(request: web.Request) -> web.StreamResponse:
+    try:
+        body = await request.json()
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return web.json_response({"error": "request body must be JSON"}, status=400)
+    query = body.get("query") if isinstance(body, dict) else None
+    if not isinstance(query, str) or not query.strip():
+        return web.json_response({"error": "'query' must be a non-empty string"}, status=400)
+    try:
+        strategy = SynthesisStrategy.from_spec(body["synthesis"]) if body.get("synthesis") else None
+    except ValueError as e:
+        return web.json_response({"error": str(e)}, status=400)
+    stream = bool(body.get("stream")) or "text/event-stream" in request.headers.get("Accept", "")
+
+    app = request.app
+    admission: AdmissionController = app["admission"]
+    timeline = QueryTimeline(query)
+    try:
+        async with admission.admit():
+            if stream:
+                return await _stream_query(request, query, strategy, timeline)
+            final_answer, responses, report = await run_query(app["agent"], app["executor"], query, None, strategy, timeline)
+    except Overloaded as e:
+        return _overloaded(e)
+    except Exception as e:
+        log.error(f"Query failed: {e}", extra=fields(query=query))
+        return web.json_response({"error": str(e)}, status=500)
+    return web.json_response(query_result(query, final_answer, responses, report, timeline))
+
+
+async def _stream_query(request: web.Request, query: str, strategy: Optional[SynthesisStrategy],
+                        timeline: QueryTimeline) -> web.StreamResponse:
+    response = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+    await response.prepare(request)
+
+    events: asyncio.Queue = asyncio.Queue()
+    done = object()
+
+    async def run():
+        try:
+            final_answer, responses, report = await run_query(
+                request.app["agent"], request.app["executor"], query,
+                lambda chunk, phase: events.put_nowait(_sse("token", {"phase": phase, "chunk": chunk})),
+                strategy, timeline)
+            events.put_nowait(_sse("result", query_result(query, final_answer, responses, report, timeline)))
+        except Exception as e:
+            log.error(f"Query failed: {e}", extra=fields(query=query))
+            events.put_nowait(_sse("error", {"error": str(e)}))
+        finally:
+            events.put_nowait(done)
+
+    task = asyncio.create_task(run())
+    try:
+        while True:
+            event = await events.get()
+            if event is done:
+                break
+            await response.write(event)
+        await task
+        await response.write_eof()
+    except ConnectionResetError:
+        log.warning("Client disconnected; cancelling its query", extra=fields(query=query))
+    finally:
+        # Stop spending tokens on a query nobody is listening to any more
+        task.cancel()
+    return response
+
+
+async def handle_health(request: web.Request) -> web.Response:
+    admission: AdmissionController = request.app["admission"]
+    return web.json_response({"status": "draining" if admission.draining else "ok", **admission.stats()})
+
+
+async def handle_stats(request: web.Request) -> web.Response:
+    agent = request.app["agent"]
+    return web.json_response({
+        "admission": request.app["admission"].stats(),
+        "http_pool": agent.http.pool_stats(),
+        "rate_limits": agent.rate_limiter.stats(),
+        "hedging": agent.hedger.stats(),
+        "routing": agent.router.summary(),
+        "tokens": tracer.token_stats(),
+        "triage": agent.triage.stats(),
+        "fast_path": agent.fast_path_stats,
+        "memory_caches": memory_cache_stats(),
+    })
+
+
+async def handle_metrics(request: web.Request) -> web.Response:
+    return web.Response(body=tracer.prometheus_text().encode("utf-8"),
+                        headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+
+async def handle_traces(request: web.Request) -> web.Response:
+    return web.json_response(tracer.traces(), dumps=lambda obj: json.dumps(obj, default=str))
+
+
+async def _start_agent(app: web.Application):
+    app["agent"] = create_agent(app["host_limits"])
+    app["executor"] = PipelineExecutor(app["agent"], app["stage_limits"] or STAGE_LIMITS)
+
+
+async def _drain(app: web.Application):
+    admission: AdmissionController = app["admission"]
+    if admission.draining:
+        return
+    log.warning(f"Shutting down; waiting for {admission.in_flight} in-flight queries")
+    if not await admission.drain(app["drain_timeout"]):
+        log.error(f"Drain timed out with {admission.in_flight} queries still running")
+
+
+async def _close_agent(app: web.Application):
+    # Flushes the persistent and semantic caches
+    await app["agent"].close()
+
+
+def create_app(max_in_flight: int = 8, max_queue: int = 32, queue_timeout: Optional[float] = 30.0,
+               drain_timeout: float = 30.0, stage_limits: Optional[Dict[str, int]] = None,
+               host_limits: Optional[Dict[str, int]] = None) -> web.Application:
+    app = web.Application()
+    app["admission"] = AdmissionController(max_in_flight, max_queue, queue_timeout)
+    app["drain_timeout"] = drain_timeout
+    app["stage_limits"] = stage_limits
+    app["host_limits"] = host_limits
+    app.router.add_post("/query", handle_query)
+    app.router.add_get("/health", handle_health)
+    app.router.add_get("/stats", handle_stats)
+    app.router.add_get("/metrics", handle_metrics)
+    app.router.add_get("/traces", handle_traces)
+    app.on_startup.append(_start_agent)
+    # `serve` drains before the listening sites close; this only covers apps run by aiohttp's own runner
+    app.on_shutdown.append(_drain)
+    app.on_cleanup.append(_close_agent)
+    return app
+
+
+async def serve(app: web.Application, host: str, port: int):
+    """Run `app` until SIGINT/SIGTERM, then drain in-flight queries before the sites stop.
+
+    `web.run_app` stops listening before `on_shutdown` runs, so a drain there
+    leaves streaming clients and health checks with a closed port.
+    """
+    runner = web.AppRunner(app, shutdown_timeout=app["drain_timeout"])
+    await runner.setup()
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    try:
+        await web.TCPSite(runner, host, port).start()
+        log.warning(f"Serving on http://{host}:{port}")
+        await stop.wait()
+        # New queries get 503 from here on, while /health keeps answering "draining"
+        await _drain(app)
+    finally:
+        await runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=os.getenv("SERVER_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("SERVER_PORT", "8080")))
+    parser.add_argument("--max-in-flight", type=int, default=int(os.getenv("SERVER_MAX_IN_FLIGHT", "8")),
+                        help="queries processed concurrently")
+    parser.add_argument("--max-queue", type=int, default=int(os.getenv("SERVER_MAX_QUEUE", "32")),
+                        help="queries allowed to wait for a slot before new ones get 503")
+    parser.add_argument("--queue-timeout", type=float, default=30.0, help="seconds a query may wait for a slot")
+    parser.add_argument("--drain-timeout", type=float, default=30.0, help="seconds to let in-flight queries finish on shutdown")
+    add_limit_arguments(parser)
+    args = parser.parse_args()
+
+    configure_logging()
+    stage_limits, host_limits = limits_from_args(args)
+    app = create_app(args.max_in_flight, args.max_queue, args.queue_timeout, args.drain_timeout, stage_limits, host_limits)
+    asyncio.run(serve(app, args.host, args.port))
+
+
+if __name__ == "__main__":
+    main()
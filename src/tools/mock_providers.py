@@ -0,0 +1,317 @@
+"""Local stand-ins for the OpenAI chat completions API, the Anthropic messages API,
+DuckDuckGo's HTML results and the result pages they link to, for benchmarking
+the pipeline without spending API money.
+
+Replies are shaped like the real services (including usage fields, streaming
+events and 429s with Retry-After) and deterministic for a given request and
+seed, so repeated queries exercise the caches just as real ones would.
+"""
+import asyncio
+import hashlib
+import html
+import json
+import math
+import random
+import re
+from collections import Counter, defaultdict
+from typing import Dict, Optional
+from urllib.parse import quote
+from aiohttp import web
+from config.prompts import analyze_question_prompt, batch_analyze_question_prompt, decomp_prompt
+
+_WORDS = ("system data model request latency cache query answer result search index tree node memory "
+          "thread process network protocol storage design balance performance throughput value key page "
+          "algorithm structure order time space update insert delete read write lock buffer stream").split()
+
+_ASPECTS = ["What is", "How does", "Why does", "What are the trade-offs of", "How is", "What are common mistakes with",
+            "How do you measure", "What alternatives exist to", "When should you use", "What is the history of"]
+
+
+class ProviderProfile:
+    """Behaviour of one stand-in provider.
+
+    Latency is log-normal around `latency` seconds with shape `jitter`; streamed
+    replies send their first chunk after `ttft` of that latency. `error_rate`
+    and `rate_limit_rate` are the chances of a 500 or a 429 (with `retry_after`).
+    """
+
+    def __init__(self, latency: float = 0.2, jitter: float = 0.3, error_rate: float = 0.0, rate_limit_rate: float = 0.0,
+                 retry_after: float = 1.0, response_chars: int = 1200, ttft: float = 0.3, chunk_chars: int = 40):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.response_chars = response_chars
+        self.ttft = ttft
+        self.chunk_chars = chunk_chars
+
+    _SPEC_KEYS = {"latency": "latency", "jitter": "jitter", "errors": "error_rate", "429": "rate_limit_rate",
+                  "retry_after": "retry_after", "chars": "response_chars", "ttft": "ttft", "chunk": "chunk_chars"}
+
+    @classmethod
+    def from_spec(cls, spec: Optional[str], **defaults) -> "ProviderProfile":
+        """Parse e.g. "latency=0.4,jitter=0.5,errors=0.01,429=0.02,chars=2000" on top of `defaults`."""
+        kwargs = dict(defaults)
+        for part in filter(None, (spec or "").split(",")):
+            name, _, value = part.partition("=")
+            if name.strip() not in cls._SPEC_KEYS:
+                raise ValueError(f"Unknown provider profile setting: {name}")
+            attribute = cls._SPEC_KEYS[name.strip()]
+            kwargs[attribute] = int(value) if attribute in ("response_chars", "chunk_chars") else float(value)
+        return cls(**kwargs)
+
+    def to_dict(self) -> Dict[str, float]:
+        return dict(vars(self))
+
+
+class MockProviders:
+    """Runs the three stand-in servers on ephemeral local ports."""
+
+    def __init__(self, openai: Optional[ProviderProfile] = None, anthropic: Optional[ProviderProfile] = None,
+                 search: Optional[ProviderProfile] = None, sub_questions: int = 4, search_results: int = 8,
+                 page_chars: int = 30000, seed: int = 0):
+        self.profiles = {
+            "openai": openai or ProviderProfile(),
+            "anthropic": anthropic or ProviderProfile(latency=0.3),
+            "search": search or ProviderProfile(latency=0.15, response_chars=200),
+        }
+        self.sub_questions = sub_questions
+        self.search_results = search_results
+        self.page_chars = page_chars
+        self.seed = seed
+        self._rng = random.Random(seed)
+        self.counts: Dict[str, Counter] = defaultdict(Counter)
+        # Prompt prefixes each (provider, model) has seen, standing in for the providers' prompt caches
+        self._prompt_cache: Dict[tuple, set] = defaultdict(set)
+        self._runners = []
+        self.urls: Dict[str, str] = {}
+
+    # --- helpers -----------------------------------------------------------
+
+    def _seeded(self, *parts) -> random.Random:
+        digest = hashlib.sha256("|".join(map(str, (self.seed,) + parts)).encode("utf-8")).digest()
+        return random.Random(int.from_bytes(digest[:8], "big"))
+
+    def _text(self, chars: int, *seed_parts) -> str:
+        rng = self._seeded(*seed_parts)
+        sentences, length = [], 0
+        while length < chars:
+            words = [rng.choice(_WORDS) for _ in range(rng.randint(8, 18))]
+            sentence = " ".join(words).capitalize() + "."
+            sentences.append(sentence)
+            length += len(sentence) + 1
+        return " ".join(sentences)
+
+    def _latency(self, provider: str) -> float:
+        profile = self.profiles[provider]
+        return max(0.0, profile.latency * math.exp(profile.jitter * self._rng.gauss(0, 1)))
+
+    def _failure(self, provider: str) -> Optional[web.Response]:
+        profile = self.profiles[provider]
+        roll = self._rng.random()
+        if roll < profile.rate_limit_rate:
+            self.counts[provider]["rate_limited"] += 1
+            return web.json_response({"error": {"message": "Rate limit exceeded", "type": "rate_limit_error"}}, status=429,
+                                     headers={"Retry-After": f"{profile.retry_after:g}"})
+        if roll < profile.rate_limit_rate + profile.error_rate:
+            self.counts[provider]["errors"] += 1
+            return web.json_response({"error": {"message": "Internal server error", "type": "server_error"}}, status=500)
+        return None
+
+    def _decomposition(self, query: str) -> str:
+        rng = self._seeded("decompose", query)
+        lines = []
+        for aspect in rng.sample(_ASPECTS, min(self.sub_questions, len(_ASPECTS))):
+            lines.append(f"Question: {aspect} {query.rstrip('?')}? | Difficulty: {rng.randint(5, 90)} | "
+                         f"Needs Web Search: {str(rng.random() < 0.5).lower()}")
+        return "\n".join(lines)
+
+    def _batch_analysis(self, user_content: str) -> str:
+        analyses = []
+        for match in re.finditer(r"^(\d+)\. .*$", user_content, re.MULTILINE):
+            rng = self._seeded("analyze", match.group(0))
+            analyses.append({"index": int(match.group(1)),
+                             "question_type": rng.choice(["FACTUAL", "ANALYTICAL", "CREATIVE", "TECHNICAL"]),
+                             "expertise": rng.choice(["GENERAL", "SPECIALIZED", "EXPERT"]),
+                             "coding": rng.random() < 0.2})
+        return json.dumps({"analyses": analyses})
+
+    def _reply(self, provider: str, system: str, user: str) -> str:
+        if system == decomp_prompt:
+            self.counts[provider]["decompose"] += 1
+            return self._decomposition(user)
+        if system == batch_analyze_question_prompt:
+            self.counts[provider]["analyze"] += 1
+            return self._batch_analysis(user)
+        if system == analyze_question_prompt:
+            self.counts[provider]["analyze"] += 1
+            rng = self._seeded("analyze", user)
+            return f"{rng.choice(['FACTUAL', 'ANALYTICAL', 'TECHNICAL'])} {rng.choice(['GENERAL', 'SPECIALIZED'])} CODING=FALSE"
+        self.counts[provider]["completion"] += 1
+        return self._text(self.profiles[provider].response_chars, provider, system, user)
+
+    def _cached_prefix(self, provider: str, model: str, prefix: str) -> bool:
+        """Whether `prefix` was sent before (the real caches also require a minimum length; this one does not)."""
+        seen = self._prompt_cache[(provider, model)]
+        if prefix in seen:
+            self.counts[provider]["prompt_cache_hits"] += 1
+            return True
+        seen.add(prefix)
+        return False
+
+    async def _stream(self, request: web.Request, provider: str, text: str, event_for, first_events=(), last_events=()):
+        latency = self._latency(provider)
+        profile = self.profiles[provider]
+        await asyncio.sleep(latency * profile.ttft)
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        for event in first_events:
+            await response.write(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+        chunks = [text[i:i + profile.chunk_chars] for i in range(0, len(text), profile.chunk_chars)] or [""]
+        delay = latency * (1 - profile.ttft) / len(chunks)
+        for chunk in chunks:
+            await response.write(f"data: {json.dumps(event_for(chunk))}\n\n".encode("utf-8"))
+            await asyncio.sleep(delay)
+        for event in last_events:
+            await response.write(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+        return response
+
+    # --- handlers ----------------------------------------------------------
+
+    async def _openai(self, request: web.Request) -> web.StreamResponse:
+        self.counts["openai"]["requests"] += 1
+        failure = self._failure("openai")
+        if failure is not None:
+            return failure
+        body = await request.json()
+        messages = body.get("messages", [])
+        system = next((m["content"] for m in messages if m["role"] == "system"), "")
+        user = next((m["content"] for m in messages if m["role"] == "user"), "")
+        text = self._reply("openai", system, user)
+        usage = {"prompt_tokens": sum(len(m["content"]) for m in messages) // 4, "completion_tokens": len(text) // 4}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        # OpenAI caches an exact prefix automatically; here, the leading system message
+        if messages and messages[0]["role"] == "system" and self._cached_prefix("openai", body.get("model"), system):
+            usage["prompt_tokens_details"] = {"cached_tokens": len(system) // 4}
+
+        if body.get("stream"):
+            self.counts["openai"]["streams"] += 1
+            response = await self._stream(
+                request, "openai", text,
+                lambda chunk: {"choices": [{"index": 0, "delta": {"content": chunk}}]},
+                last_events=[{"choices": [], "usage": usage}] if body.get("stream_options", {}).get("include_usage") else [])
+            await response.write(b"data: [DONE]\n\n")
+            return response
+        await asyncio.sleep(self._latency("openai"))
+        return web.json_response({"choices": [{"index": 0, "message": {"role": "assistant", "content": text}}],
+                                  "model": body.get("model"), "usage": usage})
+
+    async def _anthropic(self, request: web.Request) -> web.StreamResponse:
+        self.counts["anthropic"]["requests"] += 1
+        failure = self._failure("anthropic")
+        if failure is not None:
+            return failure
+        body = await request.json()
+        system = body.get("system", "")
+        blocks = [{"type": "text", "text": system}] if isinstance(system, str) else system
+        user = " ".join(m["content"] for m in body.get("messages", []) if isinstance(m.get("content"), str))
+        text = self._reply("anthropic", "".join(block.get("text", "") for block in blocks), user)
+        usage = {"input_tokens": (sum(len(block.get("text", "")) for block in blocks) + len(user)) // 4}
+        # Only a prefix ending in a cache_control block is cached; input_tokens then covers the rest
+        breakpoints = [i for i, block in enumerate(blocks) if block.get("cache_control")]
+        if breakpoints:
+            prefix = "".join(block.get("text", "") for block in blocks[:breakpoints[-1] + 1])
+            kind = "cache_read_input_tokens" if self._cached_prefix("anthropic", body.get("model"), prefix) else "cache_creation_input_tokens"
+            usage[kind] = len(prefix) // 4
+            usage["input_tokens"] -= usage[kind]
+
+        if body.get("stream"):
+            self.counts["anthropic"]["streams"] += 1
+            return await self._stream(
+                request, "anthropic", text,
+                lambda chunk: {"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": chunk}},
+                first_events=[{"type": "message_start", "message": {"usage": {**usage, "output_tokens": 1}}}],
+                last_events=[{"type": "message_delta", "usage": {"output_tokens": len(text) // 4}}, {"type": "message_stop"}])
+        await asyncio.sleep(self._latency("anthropic"))
+        return web.json_response({"content": [{"type": "text", "text": text}], "model": body.get("model"),
+                                  "usage": {**usage, "output_tokens": len(text) // 4}})
+
+    async def _search(self, request: web.Request) -> web.Response:
+        self.counts["search"]["requests"] += 1
+        failure = self._failure("search")
+        if failure is not None:
+            return failure
+        query = request.query.get("q", "")
+        await asyncio.sleep(self._latency("search"))
+        results = []
+        for i in range(self.search_results):
+            snippet = self._text(self.profiles["search"].response_chars, "search", query, i)
+            target = request.url.origin().join(request.app.router["page"].url_for(index=str(i)).with_query(q=query))
+            # Like DuckDuckGo's: a protocol-relative redirect carrying the target in `uddg`
+            link = f"//{request.url.host}:{request.url.port}/l/?uddg={quote(str(target), safe='')}&rut={i}"
+            results.append(f'<div class="result__body"><a class="result__a" href="{html.escape(link)}">'
+                           f'Result {i + 1} for {query}</a><a class="result__snippet">{snippet}</a></div>')
+        return web.Response(text=f"<html><body>{''.join(results)}</body></html>", content_type="text/html")
+
+    async def _redirect(self, request: web.Request) -> web.Response:
+        raise web.HTTPFound(request.query.get("uddg", "/"))
+
+    async def _page(self, request: web.Request) -> web.StreamResponse:
+        """A result page: navigation and script noise around an <article>, with an ETag for revalidation."""
+        self.counts["pages"]["requests"] += 1
+        query, index = request.query.get("q", ""), request.match_info["index"]
+        etag = '"' + hashlib.sha256(f"{self.seed}|{query}|{index}".encode("utf-8")).hexdigest()[:16] + '"'
+        if request.headers.get("If-None-Match") == etag:
+            self.counts["pages"]["not_modified"] += 1
+            return web.Response(status=304, headers={"ETag": etag})
+        await asyncio.sleep(self._latency("search"))
+        paragraphs = "".join(f"<p>{self._text(400, 'page', query, index, i)}</p>" for i in range(self.page_chars // 400))
+        body = (f"<html><head><script>{'var x = 1;' * 200}</script></head><body>"
+                f"<nav>{' '.join(f'<a href=/{i}>Section {i}</a>' for i in range(50))}</nav>"
+                f"<article><h1>Result {index} for {html.escape(query)}</h1>{paragraphs}</article>"
+                f"<footer>{self._text(300, 'footer')}</footer></body></html>").encode("utf-8")
+        response = web.StreamResponse(headers={"Content-Type": "text/html; charset=utf-8", "ETag": etag})
+        try:
+            await response.prepare(request)
+            for start in range(0, len(body), 8192):
+                await response.write(body[start:start + 8192])
+                self.counts["pages"]["bytes_sent"] += min(8192, len(body) - start)
+        except ConnectionResetError:
+            pass  # the client stopped reading early
+        return response
+
+    # --- lifecycle ---------------------------------------------------------
+
+    async def _serve(self, app: web.Application) -> str:
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", 0).start()
+        self._runners.append(runner)
+        host, port = runner.addresses[0][:2]
+        return f"http://{host}:{port}"
+
+    async def start(self) -> Dict[str, str]:
+        """Start the servers; returns the URLs to use as OPENAI_API_URL, ANTHROPIC_API_URL and SEARCH_URL."""
+        openai_app = web.Application()
+        openai_app.router.add_post("/v1/chat/completions", self._openai)
+        anthropic_app = web.Application()
+        anthropic_app.router.add_post("/v1/messages", self._anthropic)
+        search_app = web.Application()
+        search_app.router.add_get("/html/", self._search)
+        search_app.router.add_get("/l/", self._redirect)
+        search_app.router.add_get("/page/{index}", self._page, name="page")
+        self.urls = {
+            "openai": await self._serve(openai_app) + "/v1/chat/completions",
+            "anthropic": await self._serve(anthropic_app),
+            "search": await self._serve(search_app) + "/html/",
+        }
+        return self.urls
+
+    async def stop(self):
+        for runner in self._runners:
+            await runner.cleanup()
+        self._runners.clear()
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {provider: dict(counts) for provider, counts in self.counts.items()}
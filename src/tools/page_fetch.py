@@ -0,0 +1,219 @@
+import asyncio
+import codecs
+import os
+import re
+import time
+from html.parser import HTMLParser
+from typing import Dict, List, Optional
+from config.caching.memory import MemoryCache
+from config.http_client import HttpClient
+from config.logs import fields, get_logger
+from config.tracing import tracer
+
+log = get_logger(__name__)
+
+# Fetching result pages is off unless PAGE_FETCH_TOP_N is set
+PAGE_FETCH_TOP_N = int(os.getenv('PAGE_FETCH_TOP_N', '0'))
+PAGE_FETCH_MAX_BYTES = int(os.getenv('PAGE_FETCH_MAX_BYTES', str(256 * 1024)))
+PAGE_FETCH_MAX_CHARS = int(os.getenv('PAGE_FETCH_MAX_CHARS', '2000'))
+PAGE_FETCH_BUDGET = float(os.getenv('PAGE_FETCH_BUDGET', '2.5'))
+
+_SKIP_TAGS = {"script", "style", "noscript", "nav", "header", "footer", "aside", "form", "svg", "iframe", "template",
+              "button", "select"}
+_BLOCK_TAGS = {"p", "li", "h1", "h2", "h3", "h4", "h5", "h6", "pre", "blockquote", "td", "th", "dd", "dt", "div",
+               "section", "article", "main", "br", "tr", "table", "ul", "ol"}
+_CONTENT_TAGS = {"article", "main"}
+_WHITESPACE = re.compile(r"\s+")
+_MAX_AGE = re.compile(r"max-age=(\d+)")
+
+
+class TextExtractor(HTMLParser):
+    """Incremental main-text extraction: feed chunks as they arrive, stop once `full`.
+
+    Text inside <script>, <nav>, <footer> and similar is dropped, and only the
+    text blocks themselves are kept (no DOM), up to a few times `max_chars`.
+    If the page marks its content with <article> or <main>, only that is used.
+    """
+
+    def __init__(self, max_chars: int, min_block_chars: int = 30):
+        super().__init__(convert_charrefs=True)
+        self.max_chars = max_chars
+        self.min_block_chars = min_block_chars
+        self._skip_depth = 0
+        self._content_depth = 0
+        self._buffer: List[str] = []
+        self._blocks: List[str] = []
+        self._content_blocks: List[str] = []
+        self._chars = 0
+        self._content_chars = 0
+
+    @property
+    def full(self) -> bool:
+        return self._content_chars >= self.max_chars or self._chars >= 3 * self.max_chars
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _SKIP_TAGS:
+            self._skip_depth += 1
+        elif tag in _BLOCK_TAGS:
+            self._flush()
+        if tag in _CONTENT_TAGS:
+            self._content_depth += 1
+
+    def handle_endtag(self, tag):
+        if tag in _SKIP_TAGS:
+            self._skip_depth = max(0, self._skip_depth - 1)
+        elif tag in _BLOCK_TAGS:
+            self._flush()
+        if tag in _CONTENT_TAGS:
+            self._content_depth = max(0, self._content_depth - 1)
+
+    def handle_data(self, data):
+        if not self._skip_depth:
+            self._buffer.append(data)
+
+    def _flush(self):
+        block = _WHITESPACE.sub(" ", "".join(self._buffer)).strip()
+        self._buffer.clear()
+        if len(block) < self.min_block_chars or self.full:
+            return
+        self._blocks.append(block)
+        self._chars += len(block)
+        if self._content_depth:
+            self._content_blocks.append(block)
+            self._content_chars += len(block)
+
+    def text(self) -> str:
+        self._flush()
+        blocks = self._content_blocks if self._content_chars >= min(200, self.max_chars) else self._blocks
+        return "\n".join(blocks)[:self.max_chars]
+
+
+class PageFetcher:
+    """Fetches the top search result pages concurrently, within byte, character and time budgets.
+
+    Bodies are streamed in chunks through `TextExtractor` and the download is
+    abandoned once `max_bytes` have been read or enough text was extracted.
+    Extracted text is cached per URL: within the server's max-age (or
+    `default_ttl` when the page sends no validators) it is reused as is, after
+    that it is revalidated with If-None-Match/If-Modified-Since so an
+    unchanged page costs a 304. Concurrent fetches of one URL share a download.
+    """
+
+    def __init__(self, max_bytes: int = PAGE_FETCH_MAX_BYTES, max_chars: int = PAGE_FETCH_MAX_CHARS,
+                 budget: float = PAGE_FETCH_BUDGET, default_ttl: float = 300.0, chunk_size: int = 16 * 1024,
+                 http_client: Optional[HttpClient] = None):
+        self.max_bytes = max_bytes
+        self.max_chars = max_chars
+        self.budget = budget
+        self.default_ttl = default_ttl
+        self.chunk_size = chunk_size
+        self.http_client = http_client
+        self.cache = MemoryCache("page_fetch", max_entries=2048, max_bytes=32 * 1024 * 1024)
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.counts = {"fetched": 0, "fresh": 0, "not_modified": 0, "cut_short": 0, "failed": 0, "over_budget": 0,
+                       "bytes": 0}
+
+    def _headers(self, cached: Optional[dict]) -> dict:
+        headers = {
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3',
+            'Accept': 'text/html,application/xhtml+xml',
+        }
+        if cached is not None:
+            if cached["etag"]:
+                headers['If-None-Match'] = cached["etag"]
+            if cached["last_modified"]:
+                headers['If-Modified-Since'] = cached["last_modified"]
+        return headers
+
+    def _store(self, url: str, text: str, response_headers, cached: Optional[dict] = None):
+        cache_control = response_headers.get('Cache-Control', '')
+        if 'no-store' in cache_control:
+            return
+        etag = response_headers.get('ETag') or (cached or {}).get("etag")
+        last_modified = response_headers.get('Last-Modified') or (cached or {}).get("last_modified")
+        max_age = _MAX_AGE.search(cache_control)
+        if max_age:
+            ttl = int(max_age.group(1))
+        else:
+            # Pages with validators are cheap to revalidate; without them, fall back to a heuristic lifetime
+            ttl = 0 if (etag or last_modified) else self.default_ttl
+        self.cache.set(url, {"text": text, "etag": etag, "last_modified": last_modified,
+                             "fresh_until": time.time() + ttl})
+
+    async def _download(self, url: str, cached: Optional[dict]) -> str:
+        extractor = TextExtractor(self.max_chars)
+        read = 0
+        async with self.http_client.get_stream(url, headers=self._headers(cached)) as response:
+            if response.status == 304 and cached is not None:
+                self.counts["not_modified"] += 1
+                self._store(url, cached["text"], response.headers, cached)
+                return cached["text"]
+            response.raise_for_status()
+            if 'html' not in response.headers.get('Content-Type', 'text/html'):
+                return ""
+            try:
+                decoder = codecs.getincrementaldecoder(response.charset or 'utf-8')(errors='replace')
+            except LookupError:
+                decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+            async for chunk in response.content.iter_chunked(self.chunk_size):
+                read += len(chunk)
+                extractor.feed(decoder.decode(chunk))
+                if read >= self.max_bytes or extractor.full:
+                    # Leaving the block unread closes the connection instead of downloading the rest
+                    self.counts["cut_short"] += 1
+                    break
+            headers = response.headers
+        self.counts["fetched"] += 1
+        self.counts["bytes"] += read
+        text = extractor.text()
+        self._store(url, text, headers)
+        return text
+
+    def _download_done(self, url: str, task: asyncio.Task):
+        self._inflight.pop(url, None)
+        # Mark a failure retrieved, in case every caller gave up waiting for it
+        if not task.cancelled():
+            task.exception()
+
+    async def fetch(self, url: str) -> str:
+        cached = self.cache.get(url)
+        if cached is not None and cached["fresh_until"] > time.time():
+            self.counts["fresh"] += 1
+            tracer.record_cache("page", True)
+            return cached["text"]
+        tracer.record_cache("page", False)
+        task = self._inflight.get(url)
+        if task is None:
+            # Shared by every caller, so it is bounded on its own rather than cancelled with one of them
+            task = self._inflight[url] = asyncio.ensure_future(asyncio.wait_for(self._download(url, cached), self.budget))
+            task.add_done_callback(lambda t: self._download_done(url, t))
+        return await asyncio.shield(task)
+
+    async def fetch_many(self, urls: List[str]) -> Dict[str, str]:
+        """Fetch `urls` concurrently; whatever has not arrived within `budget` seconds is dropped."""
+        # Protocol-relative links (e.g. DuckDuckGo redirects cached before they were decoded) are fetched over https
+        urls = ["https:" + url if url.startswith("//") else url for url in urls]
+        urls = list(dict.fromkeys(url for url in urls if url.startswith(("http://", "https://"))))
+        if not urls or self.http_client is None:
+            return {}
+        with tracer.span("page_fetch", pages=len(urls)):
+            tasks = {asyncio.ensure_future(self.fetch(url)): url for url in urls}
+            done, pending = await asyncio.wait(tasks, timeout=self.budget)
+            for task in pending:
+                task.cancel()
+            self.counts["over_budget"] += len(pending)
+            pages = {}
+            for task in done:
+                if task.exception() is not None:
+                    self.counts["failed"] += 1
+                    log.debug(f"Page fetch failed: {task.exception()}", extra=fields(url=tasks[task]))
+                elif task.result():
+                    pages[tasks[task]] = task.result()
+            tracer.annotate(fetched=len(pages), over_budget=len(pending))
+            return pages
+
+    def stats(self) -> Dict[str, int]:
+        return dict(self.counts)
+
+
+page_fetcher = PageFetcher()
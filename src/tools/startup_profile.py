@@ -0,0 +1,87 @@
+"""Startup time report for `python main.py --profile-startup`.
+
+Imports `main` in a fresh interpreter under `-X importtime` (so nothing is
+already cached in `sys.modules`), then times the initialization steps a first
+query pays for: creating the Agent and opening the persistent and semantic
+caches. Import time is broken down per module and per top-level package.
+"""
+import json
+import os
+import re
+import subprocess
+import sys
+from collections import defaultdict
+from typing import Any, Dict, List
+
+_IMPORT_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+_CHILD = """
+import asyncio, contextlib, io, json, time
+timings = {}
+started = time.perf_counter()
+import main
+timings["import main"] = time.perf_counter() - started
+with contextlib.redirect_stdout(io.StringIO()):
+    started = time.perf_counter()
+    main.create_agent()
+    timings["create_agent"] = time.perf_counter() - started
+    from config.caching.caching import persistent_cache
+    started = time.perf_counter()
+    asyncio.run(persistent_cache.get("startup-profile-probe"))
+    timings["open persistent cache"] = time.perf_counter() - started
+    from config.caching.semantic import semantic_cache
+    started = time.perf_counter()
+    semantic_cache.lookup("startup-profile-probe", "startup profile probe")
+    timings["load semantic cache"] = time.perf_counter() - started
+print(json.dumps(timings))
+"""
+
+
+def _parse_importtime(stderr: str) -> List[Dict[str, Any]]:
+    modules = []
+    for line in stderr.splitlines():
+        match = _IMPORT_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            modules.append({"module": name, "self": int(self_us) / 1e6, "cumulative": int(cumulative_us) / 1e6,
+                            "depth": len(indent) // 2})
+    return modules
+
+
+def profile_startup() -> Dict[str, Any]:
+    src_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ)
+    # main refuses to import without keys; the profile never calls the providers
+    env.setdefault("OPENAI_API_KEY", "startup-profile")
+    env.setdefault("ANTHROPIC_API_KEY", "startup-profile")
+    # Run in the caller's directory, so relative cache paths open the same files `main.py` would
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [src_dir, env.get("PYTHONPATH")]))
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", _CHILD], env=env,
+                          capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"Startup profile failed:\n{proc.stderr[-2000:]}")
+    modules = _parse_importtime(proc.stderr)
+    packages: Dict[str, float] = defaultdict(float)
+    for entry in modules:
+        name = entry["module"]
+        # Project modules are reported individually, third-party and stdlib ones by package
+        top = name if name.split(".")[0] in ("main", "config", "tools") else name.split(".")[0]
+        packages[top] += entry["self"]
+    return {
+        "phases": json.loads(proc.stdout.strip().splitlines()[-1]),
+        "packages": dict(sorted(packages.items(), key=lambda item: -item[1])),
+        "modules": modules,
+    }
+
+
+def print_startup_profile(report: Dict[str, Any], top: int = 15):
+    print("Startup phases:")
+    for phase, seconds in report["phases"].items():
+        print(f"  {phase:<24} {seconds * 1000:8.1f} ms")
+    print(f"\nImport time by module/package (self time, top {top}):")
+    for name, seconds in list(report["packages"].items())[:top]:
+        print(f"  {name:<40} {seconds * 1000:8.1f} ms")
+    print("\nProject modules (cumulative, including what they import):")
+    for entry in report["modules"]:
+        if entry["module"].split(".")[0] in ("main", "config", "tools"):
+            print(f"  {'  ' * entry['depth']}{entry['module']:<{40 - 2 * entry['depth']}} {entry['cumulative'] * 1000:8.1f} ms")
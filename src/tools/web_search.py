@@ -1,43 +1,92 @@
 import aiohttp
-from bs4 import BeautifulSoup
-from typing import List, Dict
+import asyncio
+from collections import OrderedDict
+from typing import List, Dict, Optional, Tuple
+from urllib.parse import parse_qs, quote_plus, urlsplit
 import html
-from config.caching.caching import persistent_cache_decorator, memory_cache_decorator
+import os
+import time
+from config.caching.caching import LIVE_DATA_TTL, persistent_cache_decorator, memory_cache_decorator
+from config.caching.keys import normalize_text
+from config.http_client import HttpClient
+from config.logs import get_logger
+from config.tracing import tracer
+from tools.page_fetch import PAGE_FETCH_TOP_N, page_fetcher
 
-@persistent_cache_decorator
-@memory_cache_decorator
+log = get_logger(__name__)
+
+SEARCH_URL = os.getenv('SEARCH_URL', 'https://html.duckduckgo.com/html/')
+# Seconds a finished search summary is shared by later callers for the same query
+SEARCH_PREFETCH_TTL = float(os.getenv('SEARCH_PREFETCH_TTL', '60'))
+
+# Pooled transport shared with the Agent; set by Agent.__init__ and cleared on Agent.close()
+_http_client: Optional[HttpClient] = None
+
+def set_http_client(client: Optional[HttpClient]):
+    global _http_client
+    _http_client = client
+    page_fetcher.http_client = client
+
+async def _fetch_search_page(url: str, headers: dict) -> str:
+    if _http_client is not None:
+        return await _http_client.get_text(url, headers=headers)
+    async with aiohttp.ClientSession() as session:
+        async with session.get(url, headers=headers) as response:
+            response.raise_for_status()
+            return await response.text()
+
+def result_link(href: str) -> str:
+    """The target URL of a DuckDuckGo result link.
+
+    DuckDuckGo's HTML results link through a protocol-relative redirect,
+    `//duckduckgo.com/l/?uddg=<encoded target>&rut=...`; the target is decoded
+    from `uddg`, and other protocol-relative links get an https scheme.
+    """
+    if href.startswith("//"):
+        href = "https:" + href
+    parts = urlsplit(href)
+    if parts.path.rstrip("/").endswith("/l"):
+        target = parse_qs(parts.query).get("uddg")
+        if target:
+            return target[0]
+    return href
+
+def search_cache_fields(query: str, num_results: int = 5) -> dict:
+    return {"query": normalize_text(query), "num_results": num_results}
+
+# A failed search returns no results; that is not cached, so the next lookup retries
+@persistent_cache_decorator(key=search_cache_fields, accept=bool, ttl=LIVE_DATA_TTL)
+@memory_cache_decorator(key=search_cache_fields, accept=bool, ttl=LIVE_DATA_TTL)
 async def perform_web_search(query: str, num_results: int = 5) -> List[Dict[str, str]]:
-    url = f"https://html.duckduckgo.com/html/?q={query}"
+    url = f"{SEARCH_URL}?q={quote_plus(query)}"
     headers = {
         'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3'
     }
     
-    async with aiohttp.ClientSession() as session:
-        try:
-            async with session.get(url, headers=headers) as response:
-                response.raise_for_status()
-                content = await response.text()
-            
-            soup = BeautifulSoup(content, 'html.parser')
-            
-            results = []
-            for result in soup.find_all('div', class_='result__body')[:num_results]:
-                title = result.find('a', class_='result__a')
-                snippet = result.find('a', class_='result__snippet')
-                link = title.get('href') if title else ''
-                
-                results.append({
-                    "title": html.unescape(title.text if title else ""),
-                    "link": link,
-                    "snippet": html.unescape(snippet.text if snippet else ""),
-                    "displayLink": link
-                })
+    try:
+        content = await _fetch_search_page(url, headers)
+        
+        from bs4 import BeautifulSoup  # imported on first search to keep startup fast
+        soup = BeautifulSoup(content, 'html.parser')
+        
+        results = []
+        for result in soup.find_all('div', class_='result__body')[:num_results]:
+            title = result.find('a', class_='result__a')
+            snippet = result.find('a', class_='result__snippet')
+            link = result_link(title.get('href', '')) if title else ''
             
-            return results
+            results.append({
+                "title": html.unescape(title.text if title else ""),
+                "link": link,
+                "snippet": html.unescape(snippet.text if snippet else ""),
+                "displayLink": link
+            })
         
-        except aiohttp.ClientError as e:
-            print(f"An error occurred while performing the web search: {e}")
-            return []
+        return results
+    
+    except aiohttp.ClientError as e:
+        log.warning(f"An error occurred while performing the web search: {e}")
+        return []
 
 def summarize_search_results(results: List[Dict[str, str]], max_chars: int = 1000) -> str:
     summary = "Web search results:\n\n"
@@ -52,6 +101,98 @@ def summarize_search_results(results: List[Dict[str, str]], max_chars: int = 100
         
     return summary.strip()
 
+def summarize_pages(results: List[Dict[str, str]], pages: Dict[str, str]) -> str:
+    sections = [f"Page content: {item['title']}\n  {item['link']}\n{pages[item['link']]}"
+                for item in results if pages.get(item['link'])]
+    return "\n\n".join(sections)
+
+async def _search_and_summarize(query: str, num_results: int, max_chars: int) -> str:
+    with tracer.span("web_search", query=query):
+        results = await perform_web_search(query, num_results)
+        tracer.annotate(results=len(results))
+        summary = summarize_search_results(results, max_chars)
+        if PAGE_FETCH_TOP_N > 0 and results:
+            # Snippets are often too thin; add the main text of the top pages, within the fetch budget
+            pages = await page_fetcher.fetch_many([item['link'] for item in results[:PAGE_FETCH_TOP_N]])
+            if pages:
+                summary += "\n\n" + summarize_pages(results, pages)
+        return summary
+
+class SearchPrefetcher:
+    """Starts searches early and hands every caller for the same normalized query one shared result.
+
+    `prefetch` is called as soon as a sub-question that needs a search is
+    decomposed, so the search runs while the question is still being analyzed.
+    Later calls for the same normalized query, whether from the answering stage
+    or another concurrent user query, await the same task instead of searching
+    again. A finished search is shared for `ttl` seconds; one that failed or
+    found nothing is dropped as soon as it finishes, so the next call retries.
+    """
+
+    def __init__(self, max_entries: int = 512, ttl: float = SEARCH_PREFETCH_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # key -> (task, expiry); the expiry is None while the search is still running
+        self._tasks: "OrderedDict[tuple, Tuple[asyncio.Task, Optional[float]]]" = OrderedDict()
+        self.started = 0
+        self.deduplicated = 0
+
+    @staticmethod
+    def _key(query: str, num_results: int, max_chars: int) -> tuple:
+        return (normalize_text(query), num_results, max_chars)
+
+    def prefetch(self, query: str, num_results: int = 5, max_chars: int = 1000,
+                 limit: Optional[asyncio.Semaphore] = None) -> asyncio.Task:
+        """Shared task for `query`; a new search holds a slot of `limit` (if given) while it runs."""
+        key = self._key(query, num_results, max_chars)
+        entry = self._tasks.get(key)
+        if entry is not None:
+            task, expires_at = entry
+            if expires_at is None or expires_at > time.monotonic():
+                self.deduplicated += 1
+                self._tasks.move_to_end(key)
+                return task
+            del self._tasks[key]
+        task = asyncio.ensure_future(self._search(query, num_results, max_chars, limit))
+        task.add_done_callback(lambda t: self._finished(key, t, max_chars))
+        self._tasks[key] = (task, None)
+        self.started += 1
+        while len(self._tasks) > self.max_entries:
+            self._tasks.popitem(last=False)
+        return task
+
+    def _finished(self, key: tuple, task: asyncio.Task, max_chars: int):
+        # Retrieving the exception also keeps an unconsumed prefetch from logging "exception was never retrieved"
+        failed = task.cancelled() or task.exception() is not None
+        entry = self._tasks.get(key)
+        if entry is None or entry[0] is not task:
+            return
+        # perform_web_search reports errors as no results, which summarize to the bare heading
+        if failed or not self.ttl or task.result() == summarize_search_results([], max_chars):
+            del self._tasks[key]
+        else:
+            self._tasks[key] = (task, time.monotonic() + self.ttl)
+
+    @staticmethod
+    async def _search(query: str, num_results: int, max_chars: int, limit: Optional[asyncio.Semaphore]) -> str:
+        if limit is None:
+            return await _search_and_summarize(query, num_results, max_chars)
+        async with limit:
+            return await _search_and_summarize(query, num_results, max_chars)
+
+    async def get(self, query: str, num_results: int = 5, max_chars: int = 1000) -> str:
+        return await asyncio.shield(self.prefetch(query, num_results, max_chars))
+
+    def clear(self):
+        for task, _ in self._tasks.values():
+            if not task.done():
+                task.cancel()
+        self._tasks.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {"searches": self.started, "deduplicated": self.deduplicated}
+
+search_prefetcher = SearchPrefetcher()
+
 async def web_search_tool(query: str, num_results: int = 5, max_chars: int = 1000) -> str:
-    results = await perform_web_search(query, num_results)
-    return summarize_search_results(results, max_chars)
+    return await search_prefetcher.get(query, num_results, max_chars)